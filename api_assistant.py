@@ -1,21 +1,39 @@
 """API for Volatility Estimators."""
 from loguru import logger
 from datetime import datetime, UTC
-import openai
+import hashlib
 import pandas as pd
 import json
+from botocore.exceptions import ClientError
 
-from api_quotes import get_economic_events
+from api_quotes import DEFAULT_UNDERLYING, data_key, get_economic_events
+from io_utils import read_from_s3, save_to_s3
+from tracing import span
 
 logger.level("INFO")
 
+# Last response with the digest of the inputs it was given
+ASSISTANT_KEY = "data/assistant.json"
+
 def api_assistant(
     config: dict,
     estimators_data: pd.DataFrame,
     zscore_vix_data: pd.DataFrame,
+    events: pd.DataFrame | None = None,
+    underlying: tuple = DEFAULT_UNDERLYING,
 ) -> dict:
-    """Call the OpenAI API."""
+    """Call the OpenAI API.
+
+    `events` are fetched from the calendar unless given, `underlying`
+    is the (ticker, volatility index) pair the data is about.
+    """
+    import openai  # noqa: PLC0415
+
+    if events is None:
+        events = get_economic_events(config)
+
     openai.api_key = config["openai_api_key"]
+    ticker, vol_index = underlying
 
     system_prompt = """
     You are a financial analyst.
@@ -24,17 +42,18 @@ def api_assistant(
 
     user_prompt = f"""
     Analyze the following statistics for realized volatility estimators
-    across several windows and provide insights:
+    of {ticker} across several windows and provide insights:
     {estimators_data.to_dict()}
 
     You have the following economic events for the current and next week.
     Factor this into your analysis and provide forecast for the trend for next week.
     Include specific events and dates that are likely to impact the market.
     Today's date is {datetime.now(UTC).strftime("%Y-%m-%d")}.
-    {get_economic_events(config)}
+    {events}
 
     This is the data for the past 14 days for the difference between the
-    ^VIX indicator and the mean realized volatility, denoted as Volatility Risk Premium.
+    {vol_index} indicator and the mean realized volatility, denoted as Volatility Risk
+    Premium.
     There is also a Z-score for realized volatility, denoted as Z-score.
     {zscore_vix_data}
 
@@ -53,17 +72,19 @@ def api_assistant(
     """
 
     logger.debug(f"API ASSISTANT user prompt: {user_prompt}")
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.3,
-        response_format={"type": "json_object"},
-        max_tokens=5000,
-    )
-    content = response.choices[0].message.content
+    with span("assistant.llm", model="gpt-4o") as llm:
+        response = openai.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.3,
+            response_format={"type": "json_object"},
+            max_tokens=5000,
+        )
+        content = response.choices[0].message.content
+        llm.add_bytes(len(content.encode("utf-8")))
     logger.debug(f"API ASSISTANT response: {content}")
 
     # Parse the response content as JSON
@@ -82,3 +103,52 @@ def api_assistant(
         raise
 
     return parsed_content
+
+
+def inputs_digest(
+    estimators_data: pd.DataFrame,
+    zscore_vix_data: list,
+    events: pd.DataFrame | None,
+) -> str:
+    """Digest of the data the assistant is asked about."""
+    inputs = [
+        estimators_data.to_json(),
+        zscore_vix_data,
+        None if events is None else events.to_json(date_format="iso"),
+    ]
+    return hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+
+def cached_assistant(
+    config: dict,
+    estimators_data: pd.DataFrame,
+    zscore_vix_data: list,
+    events: pd.DataFrame | None,
+    underlying: tuple = DEFAULT_UNDERLYING,
+) -> dict:
+    """Response of the assistant, reused while its inputs are unchanged.
+
+    The assistant can then start as soon as its data is ready instead of
+    waiting for the report digest, and unchanged data does not cost
+    another request.
+    """
+    key = data_key(ASSISTANT_KEY, underlying[0])
+    digest = inputs_digest(estimators_data, zscore_vix_data, events)
+    try:
+        cached = json.loads(read_from_s3(config, key, decode=True))
+    except (FileNotFoundError, ClientError, json.JSONDecodeError) as e:
+        logger.debug(f"No cached assistant response: {e}")
+        cached = {}
+    if cached.get("digest") == digest:
+        logger.info(f"Assistant inputs unchanged ({digest[:12]}), reusing the response")
+        return cached["response"]
+
+    response = api_assistant(
+        config, estimators_data, zscore_vix_data, events, underlying)
+    save_to_s3(
+        config,
+        key,
+        json.dumps({"digest": digest, "response": response}),
+        content_type="application/json",
+    )
+    return response
@@ -1,69 +1,739 @@
 """GARCH models for volatility forecasting."""
 
-import base64
-from io import BytesIO
+import copy
+import datetime
+import json
+import time
+from typing import TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import FuncFormatter
-import seaborn as sns
-import arch
+from botocore.exceptions import ClientError
+from loguru import logger
 
-from api_quotes import get_historical_quotes
+from api_quotes import DEFAULT_UNDERLYING, data_key, quotes_nodes, underlyings
+from io_utils import read_from_s3, save_to_s3
+from pipeline import SKIPPED, Pipeline
+from plot_utils import (
+  CLIENT_MODE,
+  dense,
+  figure_svg,
+  lines_chart,
+  render,
+  render_pool,
+  save_plot,
+)
+from pool_utils import process_starmap
+from volatility.sessions import TRADING_DAYS_PER_YEAR, next_sessions
+from warm_state import STATE
+
+if TYPE_CHECKING:
+  from arch.univariate.base import ARCHModel, ARCHModelResult
+
+# Loaded by the fitting stage, see `add_garch_nodes`
+FIT_IMPORTS = ("arch", "scipy.stats")
+
+GARCH_STATE_KEY = "data/garch_state.json"
+STATE_TTL = 3600  # seconds a warm container trusts its copy of the stored state
+MODELS_TTL = 3600  # seconds a warm container keeps models of unchanged quotes
+REFIT_DAYS = 7  # full refit at least once a week
+LOGLIK_TOLERANCE = 0.05  # per-observation log-likelihood drop forcing a refit
+DRIFT_QUANTILE = 0.99  # chi-squared quantile of the parameter drift test
+
+MODEL_SPECS = [
+  ("GARCH(1,1)", {"vol": "GARCH", "p": 1, "q": 1}),
+  ("GARCH(1,1)-t", {"vol": "GARCH", "p": 1, "q": 1, "dist": "t"}),
+  ("GARCH(1,1)-skewt", {"vol": "GARCH", "p": 1, "q": 1, "dist": "skewt"}),
+  ("GARCH(2,1)", {"vol": "GARCH", "p": 2, "q": 1}),
+  ("GARCH(1,2)", {"vol": "GARCH", "p": 1, "q": 2}),
+  ("GJR-GARCH(1,1,1)", {"vol": "GARCH", "p": 1, "o": 1, "q": 1}),
+  ("GJR-GARCH(1,1,1)-t", {"vol": "GARCH", "p": 1, "o": 1, "q": 1, "dist": "t"}),
+  ("EGARCH(1,1,1)", {"vol": "EGARCH", "p": 1, "o": 1, "q": 1}),
+  ("EGARCH(1,1,1)-t", {"vol": "EGARCH", "p": 1, "o": 1, "q": 1, "dist": "t"}),
+]
+
+SIM_PATHS = 5000  # Monte Carlo paths for forecast bands
+SIM_CHUNK = 1000  # paths simulated per batch
+SIM_STEPS = SIM_PATHS * 22  # budget of path steps, caps the paths of long horizons
+SIM_QUANTILES = (0.05, 0.5, 0.95)
 
 
 def to_percentage(value: float, _: str) -> str:
   """Convert value to percentage."""
   return f"{value:.1f}%"
 
+def _read_state(config: dict, key: str) -> dict | None:
+  """Stored fitted parameters, None if there are none."""
+  try:
+    return json.loads(read_from_s3(config, key, decode=True))
+  except (FileNotFoundError, ClientError, json.JSONDecodeError) as e:
+    logger.warning(f"No GARCH state {key}, using default starting values: {e}")
+    return None
+
+
+def load_state(config: dict, ticker: str = DEFAULT_UNDERLYING[0]) -> dict:
+  """Read fitted parameters of an underlying persisted by the previous run.
+
+  A warm container reuses the state it saved last, the caller gets a
+  copy it may update.
+  """
+  key = data_key(GARCH_STATE_KEY, ticker)
+  state = STATE.get(key, lambda: _read_state(config, key), ttl=STATE_TTL)
+  return copy.deepcopy(state) if state else {}
+
+
+def save_state(config: dict, state: dict, ticker: str = DEFAULT_UNDERLYING[0]) -> None:
+  """Persist fitted parameters of an underlying for the next run."""
+  key = data_key(GARCH_STATE_KEY, ticker)
+  save_to_s3(
+    config,
+    key,
+    json.dumps(state),
+    content_type="application/json",
+  )
+  STATE.put(key, copy.deepcopy(state), ttl=STATE_TTL)
+
+
+SCORE_STEP = 1e-5  # relative parameter shift of the central-difference score
+
+
+def _lags(names: list) -> int:
+  """Count the lagged residuals and variances the recursion needs."""
+  return max(
+    sum(name.startswith(prefix) for name in names)
+    for prefix in ("alpha[", "gamma[", "beta[")
+  )
+
+
+def _score_vectors(params: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+  """Stack the parameters with their upper and lower shifted vectors.
+
+  Returns the (1 + 2k, k) vectors and the k shifts of the
+  central-difference score.
+  """
+  shifts = SCORE_STEP * np.maximum(np.abs(params), 1e-3)
+  return np.vstack([params, params + np.diag(shifts), params - np.diag(shifts)]), shifts
+
+
+def _split(names: list, vectors: np.ndarray, n_dist: int) -> dict:
+  """Mean, variance and distribution parameters of each vector by role."""
+  def columns(prefix: str) -> np.ndarray:
+    return vectors[:, [i for i, name in enumerate(names) if name.startswith(prefix)]]
+
+  return {
+    "mu": vectors[:, names.index("mu")] if "mu" in names else np.zeros(len(vectors)),
+    "omega": vectors[:, names.index("omega")],
+    "alpha": columns("alpha["),
+    "gamma": columns("gamma["),
+    "beta": columns("beta["),
+    "dist": vectors[:, vectors.shape[1] - n_dist:],
+  }
+
+
+def _variance_step(
+  params: dict,
+  eps: np.ndarray,
+  var: np.ndarray,
+  *,
+  egarch: bool,
+) -> np.ndarray:
+  """Next conditional variance of each row from its lagged residuals.
+
+  `eps` and `var` hold the lags along the last axis, most recent first.
+  Parameter arrays either apply to all rows or hold one row each.
+  """
+  alpha, gamma, beta = params["alpha"], params["gamma"], params["beta"]
+  a, g, b = alpha.shape[-1], gamma.shape[-1], beta.shape[-1]
+  if egarch:
+    std = eps / np.sqrt(var)
+    return np.exp(
+      params["omega"]
+      + ((np.abs(std[:, :a]) - np.sqrt(2 / np.pi)) * alpha).sum(axis=-1)
+      + (std[:, :g] * gamma).sum(axis=-1)
+      + (np.log(var[:, :b]) * beta).sum(axis=-1),
+    )
+  return (
+    params["omega"]
+    + (eps[:, :a] ** 2 * alpha).sum(axis=-1)
+    + (eps[:, :g] ** 2 * (eps[:, :g] < 0) * gamma).sum(axis=-1)
+    + (var[:, :b] * beta).sum(axis=-1)
+  )
+
+
+def filter_state(model: "ARCHModel", fitted: "ARCHModelResult") -> dict:
+  """Recursion state at the end of a full fit.
+
+  Holds the last conditional variances of the fitted parameters and of
+  the shifted vectors of the score, and their log-likelihoods of the
+  returns filtered since, so updates only run over new returns.
+  """
+  params = fitted.params.to_numpy()
+  lags = _lags(list(fitted.params.index))
+  vectors, _ = _score_vectors(params)
+  volatilities = [fitted.conditional_volatility.to_numpy()]
+  volatilities += [
+    model.fix(vector).conditional_volatility.to_numpy() for vector in vectors[1:]
+  ]
+  return {
+    "variance": [(v[:-lags - 1:-1] ** 2).tolist() for v in volatilities],
+    "loglikelihood": [0.0] * len(vectors),
+    "nobs": 0,
+  }
+
+
+def filter_update(model: "ARCHModel", entry: dict) -> tuple[np.ndarray, dict]:
+  """Carry the stored recursion state over the returns after `end_date`.
+
+  Costs O(new returns), the full sample is only filtered by refits.
+  Returns the conditional volatility history with the new returns
+  appended, trimmed to the sample, and the updated `filter_state`.
+  Raises KeyError when the stored end date is not in the sample.
+  """
+  from arch.univariate import EGARCH  # noqa: PLC0415
+
+  names = list(entry["params"])
+  vectors, _ = _score_vectors(np.array(list(entry["params"].values())))
+  params = _split(names, vectors, model.distribution.num_params)
+  lags = _lags(names)
+
+  returns = model.y.to_numpy()
+  end = model.y.index.get_loc(pd.Timestamp(entry["end_date"]))
+  new = returns[end + 1:]
+  mu = params["mu"][:, None]
+
+  # Most recent observation first along the lag axis
+  eps = returns[end - lags + 1:end + 1][::-1] - mu
+  var = np.array(entry["filter"]["variance"])
+  variance = np.empty((len(vectors), new.size))
+  egarch = isinstance(model.volatility, EGARCH)
+  for t in range(new.size):
+    variance[:, t] = _variance_step(params, eps, var, egarch=egarch)
+    eps = np.column_stack([new[t] - params["mu"], eps[:, :-1]])
+    var = np.column_stack([variance[:, t], var[:, :-1]])
+
+  resid = new - mu
+  loglikelihood = [
+    previous + model.distribution.loglikelihood(dist, r, s, individual=True).sum()
+    for previous, dist, r, s in zip(
+      entry["filter"]["loglikelihood"], params["dist"], resid, variance, strict=True,
+    )
+  ]
+  volatility = np.concatenate([entry["volatility"], np.sqrt(variance[0])])
+  return volatility[-returns.size:], {
+    "variance": var.tolist(),
+    "loglikelihood": loglikelihood,
+    "nobs": entry["filter"]["nobs"] + new.size,
+  }
+
+
+def information_criteria(entry: dict) -> tuple[float, float]:
+  """AIC and BIC of the stored parameters over the fit and later returns."""
+  loglikelihood = (
+    entry["loglikelihood"] * entry["nobs"] + entry["filter"]["loglikelihood"][0]
+  )
+  nobs = entry["nobs"] + entry["filter"]["nobs"]
+  k = len(entry["params"])
+  return 2 * k - 2 * loglikelihood, k * np.log(nobs) - 2 * loglikelihood
+
+
+def refit_reason(
+  model: "ARCHModel",
+  entry: dict | None,
+  end_date: pd.Timestamp,
+) -> tuple[str | None, dict | None]:
+  """Check whether the stored parameters still describe the data.
+
+  Only the returns after the last update are filtered, see
+  `filter_update`. Returns the reason for a full refit, or None together
+  with the updated entry.
+  """
+  from scipy.stats import chi2  # noqa: PLC0415
+
+  fields = {"params", "loglikelihood", "nobs", "volatility", "filter", "fitted_on"}
+  if entry is None or not fields <= entry.keys():
+    return "no stored parameters", None
+
+  if (end_date - pd.Timestamp(entry["fitted_on"])).days >= REFIT_DAYS:
+    return "scheduled refit", None
+
+  if not entry.get("fit", {}).get("converged", True):
+    return "last fit did not converge", None
+
+  n_params = sum(
+    part.num_params for part in (model, model.volatility, model.distribution)
+  )
+  variance = np.array(entry["filter"]["variance"])
+  if (
+    len(entry["params"]) != n_params
+    or variance.shape != (2 * n_params + 1, _lags(list(entry["params"])))
+  ):
+    return "stored parameters do not match the model", None
+
+  try:
+    volatility, filtered = filter_update(model, entry)
+  except KeyError:
+    return "stored end date is not in the returns", None
+  updated = entry | {"volatility": volatility.tolist(), "filter": filtered}
+
+  # Average log-likelihood against the one at the last full fit
+  nobs = entry["nobs"] + filtered["nobs"]
+  total = entry["loglikelihood"] * entry["nobs"] + filtered["loglikelihood"][0]
+  average = total / nobs
+  degradation = entry["loglikelihood"] - average
+  if degradation > LOGLIK_TOLERANCE:
+    return f"likelihood degraded by {degradation:.4f} per observation", None
+
+  # Score test on the gradient of the returns since the last full fit
+  if entry.get("cov") is None:
+    return "no parameter covariance for the drift test", None
+  _, shifts = _score_vectors(np.array(list(entry["params"].values())))
+  loglikelihood = np.array(filtered["loglikelihood"][1:])
+  drift = (loglikelihood[:n_params] - loglikelihood[n_params:]) / (2 * shifts)
+  statistic = drift @ np.array(entry["cov"]) @ drift
+  if statistic > chi2.ppf(DRIFT_QUANTILE, n_params):
+    return f"parameter drift statistic {statistic:.2f}", None
+
+  return None, updated
+
+
+def fit_model(
+  model: "ARCHModel",
+  label: str,
+  state: dict,
+  mode: str = "update",
+) -> tuple[dict, dict]:
+  """Fit the model warm-started from the persisted parameters.
+
+  In "update" mode the stored parameters are reused and the conditional
+  variance recursion only runs over the new returns, unless
+  `refit_reason` asks for a full refit. Full fits fall back to arch's
+  default starting values when there is no state for the model, the
+  stored vector does not fit it or the warm start does not converge.
+  Updates `state` in place and returns the entry of the model with the
+  fit statistics.
+  """
+  entry = state.get(label)
+  start = time.perf_counter()
+  end_date = model.y.index[-1]
+
+  reason = "refit mode"
+  if mode == "update":
+    reason, updated = refit_reason(model, entry, end_date)
+    if reason is None:
+      info = {
+        "mode": "update",
+        "warm_start": True,
+        "iterations": 0,
+        "seconds": round(time.perf_counter() - start, 4),
+        "converged": entry["fit"]["converged"],
+      }
+      logger.info(f"GARCH update {label}: {info}")
+      state[label] = updated | {"end_date": end_date.strftime("%Y-%m-%d"), "fit": info}
+      return state[label], info
+    logger.info(f"GARCH full refit of {label}: {reason}")
+
+  previous = entry.get("params") if entry else None
+  fitted = None
+
+  if previous is not None:
+    try:
+      fitted = model.fit(
+        starting_values=list(previous.values()),
+        disp="off",
+        update_freq=0,
+        show_warning=False,
+      )
+    except ValueError as e:
+      logger.warning(f"Warm start rejected for {label}: {e}")
+    else:
+      if fitted.convergence_flag != 0:
+        logger.warning(f"Warm start did not converge for {label}, refitting")
+        fitted = None
+
+  warm_start = fitted is not None
+  if not warm_start:
+    fitted = model.fit(
+      disp="off",
+      update_freq=0,
+      show_warning=False,
+    )
+
+  info = {
+    "mode": "refit",
+    "reason": reason,
+    "warm_start": warm_start,
+    "iterations": int(fitted.optimization_result.nit),
+    "seconds": round(time.perf_counter() - start, 4),
+    "converged": fitted.convergence_flag == 0,
+  }
+  logger.info(f"GARCH fit {label}: {info}")
+
+  try:
+    cov = fitted.param_cov.to_numpy().tolist()
+  except np.linalg.LinAlgError:
+    logger.warning(f"Singular parameter covariance for {label}")
+    cov = None
+
+  state[label] = {
+    "params": fitted.params.to_dict(),
+    "cov": cov,
+    "loglikelihood": fitted.loglikelihood / fitted.nobs,
+    "nobs": int(fitted.nobs),
+    "volatility": fitted.conditional_volatility.to_numpy().tolist(),
+    "filter": filter_state(model, fitted),
+    "fitted_on": end_date.strftime("%Y-%m-%d"),
+    "end_date": end_date.strftime("%Y-%m-%d"),
+    "fit": info,
+  }
+  return state[label], info
+
+
+def forecast_variance(model: "ARCHModel", entry: dict, horizon: int) -> np.ndarray:
+  """Variance forecast from the stored end of the recursion.
+
+  GARCH and GJR-GARCH use the analytic multi-step forecast, EGARCH has
+  none and uses the mean simulated path.
+  """
+  from arch.univariate import EGARCH  # noqa: PLC0415
+
+  if isinstance(model.volatility, EGARCH):
+    volatility = np.asarray(entry["volatility"])
+    paths = simulate_variance(model, entry["params"], horizon, volatility=volatility)
+    return paths.mean(axis=0)
+
+  names = list(entry["params"])
+  params = _split(names, np.array([list(entry["params"].values())]), 0)
+  lags = _lags(names)
+  eps = model.y.to_numpy()[:-lags - 1:-1] - params["mu"][:, None]
+  var = np.array(entry["filter"]["variance"][:1])
+
+  # Expected squared and negative squared residuals after the first step
+  squared = eps ** 2
+  negative = eps ** 2 * (eps < 0)
+  a, g, b = (params[name].shape[1] for name in ("alpha", "gamma", "beta"))
+  variance = np.empty(horizon)
+  for h in range(horizon):
+    variance[h] = (
+      params["omega"]
+      + (squared[:, :a] * params["alpha"]).sum()
+      + (negative[:, :g] * params["gamma"]).sum()
+      + (var[:, :b] * params["beta"]).sum()
+    )[0]
+    squared = np.column_stack([[variance[h]], squared[:, :-1]])
+    negative = np.column_stack([[0.5 * variance[h]], negative[:, :-1]])
+    var = np.column_stack([[variance[h]], var[:, :-1]])
+  return variance
+
+
+def fit_forecast(
+  model: "ARCHModel",
+  label: str,
+  entry: dict | None,
+  mode: str,
+  horizon: int,
+) -> dict:
+  """Fit one model and forecast its variance, runs in a worker process."""
+  state = {} if entry is None else {label: entry}
+  entry, _ = fit_model(model, label, state, mode=mode)
+  aic, bic = information_criteria(entry)
+
+  return {
+    "label": label,
+    "volatility": np.asarray(entry["volatility"]),
+    "variance": forecast_variance(model, entry, horizon),
+    "aic": aic,
+    "bic": bic,
+    "state": entry,
+  }
+
+
+def model_weights(state: dict, labels: list, criterion: str = "bic") -> pd.Series:
+  """Information-criterion weights exp(-delta/2) normalised over the models.
+
+  Models whose last fit did not converge get zero weight. When none
+  converged, all models are weighted by their criterion with a warning,
+  and models without a finite criterion always get zero weight.
+  """
+  values = pd.Series({label: state[label][criterion] for label in labels}, dtype=float)
+  converged = pd.Series({label: state[label]["fit"]["converged"] for label in labels})
+  if converged.any():
+    values = values.where(converged, np.inf)
+  else:
+    logger.warning(f"No GARCH model converged, weighting all by {criterion}")
+
+  values = values.where(np.isfinite(values), np.inf)
+  if np.isinf(values.min()):
+    logger.warning(f"No GARCH model has a finite {criterion}, weighting all equally")
+    return pd.Series(1 / len(values), index=values.index)
+
+  weights = np.exp(-0.5 * (values - values.min()))
+  return weights / weights.sum()
+
+
 def forecast(
   models: list,
   quotes: pd.DataFrame,
   horizon: int = 22,
+  state: dict | None = None,
+  mode: str = "update",
+  workers: int | None = None,
+  criterion: str = "bic",
 ) -> pd.DataFrame:
-  """Perform GARCH forecast."""
-  end_date = quotes.index[-1]
-  working_dates = pd.bdate_range(
-    end_date + pd.Timedelta(days=1),
-    periods=horizon,
+  """Perform GARCH forecast.
+
+  Models are fitted in a process pool, one model per task, and combined
+  into an extra column averaging the variances with `model_weights`.
+  `state` holds the parameters of previous fits, it is used for warm
+  starts and updated in place with the new fits and their statistics.
+  `mode` is either "update" (reuse stored parameters) or "refit".
+  """
+  state = {} if state is None else state
+  return forecast_panel(
+    {None: (models, quotes, state)},
+    horizon=horizon,
+    mode=mode,
+    workers=workers,
+    criterion=criterion,
+  )[None]
+
+
+def forecast_panel(
+  panel: dict,
+  horizon: int = 22,
+  mode: str = "update",
+  workers: int | None = None,
+  criterion: str = "bic",
+) -> dict:
+  """`forecast` of several underlyings, with all their models in one pool.
+
+  `panel` maps a ticker to its (models, quotes, state), the states are
+  updated in place. Returns the forecasts by ticker.
+  """
+  tasks = [
+    (ticker, (model, label, state.get(label), mode, horizon))
+    for ticker, (models, _, state) in panel.items()
+    for model, label in models
+  ]
+  fits = process_starmap(
+    fit_forecast,
+    [args for _, args in tasks],
+    max_workers=workers,
   )
-  results = pd.DataFrame(index=quotes.index.append(working_dates))
 
-  for model, label in models:
-    fitted = model.fit(
-      disp="off",
-      update_freq=0,
-      show_warning=False,
+  fits_by_ticker = {ticker: [] for ticker in panel}
+  for (ticker, _), fit in zip(tasks, fits, strict=True):
+    fits_by_ticker[ticker].append(fit)
+
+  forecasts = {}
+  for ticker, (models, quotes, state) in panel.items():
+    for fit in fits_by_ticker[ticker]:
+      label = fit["label"]
+      state[label] = fit["state"]
+      state[label]["aic"] = fit["aic"]
+      state[label]["bic"] = fit["bic"]
+
+    labels = [label for _, label in models]
+    forecasts[ticker] = forecast_results(
+      quotes.index,
+      next_sessions(quotes.index[-1], horizon),
+      fits_by_ticker[ticker],
+      weights=model_weights(state, labels, criterion),
+      average_label=f"{criterion.upper()} average",
     )
+  return forecasts
+
+
+def forecast_results(
+  history: pd.DatetimeIndex,
+  future: pd.DatetimeIndex,
+  fits: list,
+  weights: pd.Series | None = None,
+  average_label: str = "average",
+) -> pd.DataFrame:
+  """Assemble annualized fitted and forecast volatilities of all models.
+
+  One (dates x models) array is preallocated, each fit writes its
+  history and forecast slices positionally and the array is wrapped in
+  a DataFrame once. Fitted volatilities are aligned to the end of
+  `history`, as returns start one session after the first quote.
+  With `weights` an extra column averages the model variances.
+  """
+  n_history = len(history)
+  n_columns = len(fits) + (weights is not None)
+  values = np.full((n_history + len(future), n_columns), np.nan)
+
+  for i, fit in enumerate(fits):
+    volatility = np.asarray(fit["volatility"])
+    start = n_history - volatility.size
+    values[start:n_history, i] = volatility * (TRADING_DAYS_PER_YEAR ** 0.5)
+    values[n_history:, i] = (np.asarray(fit["variance"]) * TRADING_DAYS_PER_YEAR) ** 0.5
+
+  labels = [fit["label"] for fit in fits]
+  if weights is not None:
+    # Zero-weight models are left out, their variances may have diverged
+    column_weights = weights[labels].to_numpy()
+    used = column_weights > 0
+    variances = values[:, :-1][:, used] ** 2
+    weighted = np.where(np.isnan(variances), 0, variances) @ column_weights[used]
+    weighted[np.isnan(variances).all(axis=1)] = np.nan
+    values[:, -1] = weighted ** 0.5
+    labels.append(average_label)
+
+  return pd.DataFrame(values, index=history.append(future), columns=labels)
+
+
+def simulate_variance(
+  model: "ARCHModel",
+  params: dict,
+  horizon: int = 22,
+  n_paths: int = SIM_PATHS,
+  chunk: int = SIM_CHUNK,
+  max_steps: int = SIM_STEPS,
+  seed: int = 0,
+  volatility: np.ndarray | None = None,
+) -> np.ndarray:
+  """Simulate variance paths of a GARCH, GJR-GARCH or EGARCH model.
+
+  Innovations are drawn from the standardized residuals (filtered
+  historical simulation) and the variance recursion runs over the
+  horizon on arrays of paths. The residuals are standardized by
+  `volatility`, the stored conditional volatility history, and the
+  returns are only filtered through the parameters without it.
+
+  The budget is enforced up front: `n_paths` is capped so that
+  `horizon * n_paths` stays within `max_steps`. Paths are simulated in
+  chunks, so the output only depends on `seed` and the arguments, never
+  on the speed of the machine.
+
+  Returns an array of shape (paths, horizon) of daily variances.
+  """
+  from arch.univariate import EGARCH  # noqa: PLC0415
+
+  names = list(params)
+  split = _split(names, np.array([list(params.values())]), 0)
+  if volatility is None:
+    volatility = model.fix(list(params.values())).conditional_volatility.to_numpy()
+  resid = model.y.to_numpy()[-volatility.size:] - split["mu"]
+  sigma2 = volatility ** 2
+  std_resid = resid / volatility
+  std_resid = std_resid[np.isfinite(std_resid)]
+  egarch = isinstance(model.volatility, EGARCH)
+  lags = _lags(names)
+
+  budget = max(1, max_steps // horizon)
+  if n_paths > budget:
+    logger.warning(
+      f"Simulating {budget} of {n_paths} paths, {horizon} steps each "
+      f"are over the budget of {max_steps}")
+    n_paths = budget
+
+  rng = np.random.default_rng(seed)
+  start = time.perf_counter()
+  paths = []
+
+  for done in range(0, n_paths, chunk):
+    size = min(chunk, n_paths - done)
+
+    # Most recent observation first along the lag axis
+    eps = np.tile(resid[:-lags - 1:-1], (size, 1))
+    var = np.tile(sigma2[:-lags - 1:-1], (size, 1))
+    out = np.empty((size, horizon))
+
+    for h in range(horizon):
+      out[:, h] = _variance_step(split, eps, var, egarch=egarch)
+      shock = np.sqrt(out[:, h]) * rng.choice(std_resid, size=size)
+      eps = np.column_stack([shock, eps[:, :-1]])
+      var = np.column_stack([out[:, h], var[:, :-1]])
+
+    paths.append(out)
 
-    annualized_volatility = fitted.conditional_volatility * (252 ** 0.5)
-    results.loc[quotes.index, label] = annualized_volatility
+  logger.debug(f"Simulated {n_paths} paths in {time.perf_counter() - start:.3f}s")
+  return np.concatenate(paths)
 
-    # Forecast section
-    am_forecast = fitted.forecast(horizon=horizon)
-    predicted_volatility = (am_forecast.variance*252) ** 0.5
 
-    results.loc[working_dates, label] = predicted_volatility.to_numpy()[0]
+def simulation_bands(
+  variance: np.ndarray,
+  dates: pd.DatetimeIndex,
+  quantiles: tuple = SIM_QUANTILES,
+  horizons: tuple = (1, 5, 10, 22),
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+  """Annualized volatility bands per date and term-structure quantiles.
 
-  return results
+  The term structure at horizon h is the volatility implied by the
+  average variance over the first h sessions of each path.
+  """
+  labels = [f"{100 * q:.0f}%" for q in quantiles]
 
+  daily = np.quantile(np.sqrt(variance * TRADING_DAYS_PER_YEAR), quantiles, axis=0)
+  bands = pd.DataFrame(daily.T, index=dates, columns=labels)
+
+  horizons = [h for h in horizons if h <= variance.shape[1]]
+  average = np.cumsum(variance, axis=1)[:, np.array(horizons) - 1] / horizons
+  term = np.quantile(np.sqrt(average * TRADING_DAYS_PER_YEAR), quantiles, axis=0)
+  term_structure = pd.DataFrame(
+    term.T,
+    index=pd.Index(horizons, name="Sessions"),
+    columns=labels,
+  )
+  return bands, term_structure
+
+
+def forecast_start(bands: pd.DataFrame | None) -> datetime.date:
+  """First simulated session, today without bands.
+
+  Marking the forecast from the data rather than the clock keeps the
+  figure unchanged on days without new quotes.
+  """
+  if bands is None:
+    return pd.Timestamp.today().date()
+  return bands.index[0].date()
+
+
+def forecast_plot(
+  volatilities: pd.DataFrame,
+  bands: pd.DataFrame | None = None,
+  render_mode: str = "vector",
+) -> bytes:
+  """Plot the forecast with optional simulated bands (low, median, high)."""
+  import matplotlib.dates as mdates  # noqa: PLC0415
+  import matplotlib.pyplot as plt  # noqa: PLC0415
+  import seaborn as sns  # noqa: PLC0415
+  from matplotlib.ticker import FuncFormatter  # noqa: PLC0415
 
-def forecast_plot(volatilities: pd.DataFrame) -> str:
-  """Plot the forecast."""
   # Figure setup
-  _, ax1 = plt.subplots(
+  fig, ax1 = plt.subplots(
     figsize=(9, 3),
     dpi=600,
   )
 
   sns.lineplot(
     volatilities,
-    color=sns.color_palette("vlag_r")[-1],
+    palette=sns.color_palette("vlag_r", n_colors=volatilities.shape[1]),
     dashes=False,
     ax=ax1,
   )
 
+  if bands is not None:
+    low, median, high = bands.columns
+    ax1.fill_between(
+      bands.index,
+      bands[low],
+      bands[high],
+      color=sns.color_palette("vlag_r")[-1],
+      linewidth=0,
+      alpha=.2,
+      label=f"{low}-{high} simulated",
+      **dense(render_mode),
+    )
+    ax1.plot(
+      bands.index,
+      bands[median],
+      color=sns.color_palette("vlag_r")[-1],
+      linestyle=":",
+      linewidth=1,
+      label=f"{median} simulated",
+    )
+
   # Formatting
   ax1.yaxis.set_major_formatter(FuncFormatter(to_percentage))
   ax1.set_ylabel("")
@@ -73,48 +743,199 @@ def forecast_plot(volatilities: pd.DataFrame) -> str:
   ax1.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
   plt.setp(ax1.xaxis.get_majorticklabels(), ha="right")
 
-  # Add horizontal line for today
-  today = pd.Timestamp.today().date()
+  # Add vertical line where the forecast starts
+  start = forecast_start(bands)
   ax1.axvline(
-    today,
+    start,
     color="black",
     linestyle="-",
     linewidth=0.1,
   )
   ax1.axvspan(
-    today,
+    start,
     volatilities.index[-1],
     facecolor="red",
     alpha=0.1,
   )
   plt.tight_layout()
 
-  buf = BytesIO()
-  plt.savefig(buf, format="svg", transparent=True)
-  buf.seek(0)
-  return base64.b64encode(buf.read()).decode("utf-8")
+  return figure_svg(fig, "garch", render_mode)
+
+
+def forecast_chart(
+  volatilities: pd.DataFrame,
+  bands: pd.DataFrame | None = None,
+) -> dict:
+  """Chart data of `forecast_plot` for the browser, in fractions."""
+  frame = volatilities / 100
+  options = {"marker": str(forecast_start(bands))}
+  if bands is not None:
+    low, median, high = bands.columns
+    frame = frame.join(bands / 100)
+    options |= {"band": [low, high], "dashed": [median]}
+  return {"panels": [lines_chart(frame, **options)]}
 
 
 def get_models(quotes: pd.DataFrame) -> list:
-  """Construct GARCH models."""
-  returns = 100*quotes["close"].pct_change().dropna()
+  """Construct GARCH models, reused by warm invocations for the same closes."""
+  from arch import arch_model  # noqa: PLC0415
 
-  return [
-    [arch.arch_model(returns, vol="GARCH", p=1, q=1), "GARCH(1,1)"],
-  ]
+  closes = pd.util.hash_pandas_object(quotes["close"]).to_numpy()
+  key = f"garch:models:{hash(closes.tobytes()):x}"
+
+  def build() -> list:
+    returns = 100*quotes["close"].pct_change().dropna()
+    return [
+      [arch_model(returns, **spec), label] for label, spec in MODEL_SPECS
+    ]
+
+  return STATE.get(key, build, ttl=MODELS_TTL)
 
-def api_garch(config: dict) -> dict:
-  """Orchestrate GARCH forecast."""
-  spx = get_historical_quotes(config, "^SPX")
+def fit_garch_panel(config: dict, quotes: dict, states: dict) -> dict:
+  """Fit the model family of every underlying, see `forecast_panel`.
+
+  Returns the forecast and updated state by ticker.
+  """
+  forecasts = forecast_panel(
+    {
+      ticker: (get_models(quotes[ticker]), quotes[ticker], states[ticker])
+      for ticker in quotes
+    },
+    mode=config.get("garch_mode") or "update",
+    workers=config.get("garch_workers"),
+    criterion=config.get("garch_criterion") or "bic",
+  )
+  return {
+    ticker: {"forecast": forecasts[ticker], "state": states[ticker]}
+    for ticker in quotes
+  }
+
+
+def fit_garch(
+  config: dict,
+  ticker: str,
+  quotes: pd.DataFrame,
+  garch_forecast: pd.DataFrame,
+  state: dict,
+) -> dict:
+  """Persist the fitted state of an underlying and simulate the best model."""
+  models = get_models(quotes)
+  criterion = config.get("garch_criterion") or "bic"
+  save_state(config, state, ticker)
 
-  models = get_models(spx)
+  labels = [label for _, label in models]
+  weights = model_weights(state, labels, criterion)
+  best = weights.idxmax()
+
+  model = next(model for model, label in models if label == best)
+  variance = simulate_variance(
+    model,
+    state[best]["params"],
+    volatility=np.asarray(state[best]["volatility"]),
+  )
+  bands, term_structure = simulation_bands(
+    variance,
+    garch_forecast.index[-variance.shape[1]:],
+  )
 
   context = {}
-  context["start_date"] = spx.index.min().strftime("%Y-%m-%d")
-  context["end_date"] = spx.index.max().strftime("%Y-%m-%d")
+  context["start_date"] = quotes.index.min().strftime("%Y-%m-%d")
+  context["end_date"] = quotes.index.max().strftime("%Y-%m-%d")
+  context["fit_stats"] = {label: state[label]["fit"] for label in labels}
+  context["model_selection"] = pd.DataFrame({
+    "aic": [state[label]["aic"] for label in labels],
+    "bic": [state[label]["bic"] for label in labels],
+    "weight": weights,
+  }, index=labels).sort_values(criterion)
+  context["best_model"] = best
+  context["term_structure"] = term_structure.map("{:.2f}%".format).to_html(
+    classes="striped",
+  )
+
+  return {
+    "context": context,
+    "volatilities": garch_forecast[[best, f"{criterion.upper()} average"]],
+    "bands": bands,
+  }
+
+
+def garch_panel_node(pipeline: Pipeline, config: dict) -> str:
+  """Register the fits of all underlyings once and return the node name.
+
+  Underlyings whose quotes are missing are left out.
+  """
+  tickers = [ticker for ticker, _ in underlyings(config)]
+  quotes = quotes_nodes(pipeline, config)
+  if "garch:panel" not in pipeline:
+    for ticker in tickers:
+      pipeline.add(
+        f"garch:state:{ticker}",
+        lambda ticker=ticker: load_state(config, ticker),
+      )
+
+    def fit(*args: object) -> dict:
+      available = {
+        ticker: frame
+        for ticker, frame in zip(tickers, args[:len(tickers)], strict=True)
+        if frame is not SKIPPED
+      }
+      states = dict(zip(tickers, args[len(tickers):], strict=True))
+      return fit_garch_panel(config, available, states)
+
+    pipeline.add(
+      "garch:panel",
+      fit,
+      [quotes[ticker] for ticker in tickers]
+        + [f"garch:state:{ticker}" for ticker in tickers],
+      imports=FIT_IMPORTS,
+      allow_skipped=True,
+    )
+  return "garch:panel"
+
+
+def add_garch_nodes(pipeline: Pipeline, config: dict, ticker: str | None = None) -> str:
+  """Register GARCH report nodes of an underlying, the primary by default.
+
+  Returns the context node name. The models of all configured
+  underlyings are fitted together, see `garch_panel_node`.
+  """
+  ticker = ticker or underlyings(config)[0][0]
+  quotes = quotes_nodes(pipeline, config)[ticker]
+
+  render_mode = config.get("render_mode") or "vector"
+  client = render_mode == CLIENT_MODE
+
+  pipeline.add(
+    f"garch:fit:{ticker}",
+    lambda underlying_quotes, panel: fit_garch(
+      config,
+      ticker,
+      underlying_quotes,
+      panel[ticker]["forecast"],
+      panel[ticker]["state"],
+    ),
+    [quotes, garch_panel_node(pipeline, config)],
+  )
+  def draw(fit: dict) -> dict | str:
+    if client:
+      return forecast_chart(fit["volatilities"], fit["bands"])
+    pool = render_pool(config.get("render_workers"))
+    svg = render(pool, forecast_plot, fit["volatilities"], fit["bands"], render_mode)
+    return save_plot(config, svg)
+
+  pipeline.add(f"garch:plot:{ticker}", draw, [f"garch:fit:{ticker}"])
+  pipeline.add(
+    f"garch:{ticker}",
+    lambda fit, plot: {
+      **fit["context"],
+      "garch_chart" if client else "garch_plot": plot,
+    },
+    [f"garch:fit:{ticker}", f"garch:plot:{ticker}"],
+  )
+  return f"garch:{ticker}"
 
-  garch_forecast = forecast(models, spx)
-  garch_plot = forecast_plot(garch_forecast)
 
-  context["garch_plot"] = garch_plot
-  return context
+def api_garch(config: dict, ticker: str | None = None) -> dict:
+  """Orchestrate GARCH forecast of an underlying, the primary by default."""
+  pipeline = Pipeline()
+  return pipeline[add_garch_nodes(pipeline, config, ticker)]
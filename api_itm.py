@@ -3,27 +3,67 @@ Predicting probability of ITM for a given option
 this file supposed to be used as a standalone API
 """
 
-from io import BytesIO
-import base64
+import warnings
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from loguru import logger
 
 from api_quotes import get_vix_open, get_otc_open
-from io_utils import read_from_s3
+from io_utils import open_from_s3
+from plot_utils import encode_figure
+from tracing import span
 
 
-def probs_heatmap(df):
+def compact_itm_frame(df):
+    """
+    Copy of the ITM frame reduced to the used columns in compact dtypes,
+    the source frame is left untouched. Rows without an ITM outcome are
+    dropped, a plain bool cast would count them as ITM
+    """
+    known = df['itm'].notna()
+    compact = pd.DataFrame({
+        'quote_datetime': df['quote_datetime'],
+        'vix_open': df['vix_open'].astype('float32'),
+        'open_to_close_pct': df['open_to_close_pct'].astype('float32'),
+        'expiration_weekday': df['expiration_weekday'].astype('int8'),
+        'delta_bin': df['delta_bin'].astype('category'),
+        'itm': df['itm'].fillna(0).astype(bool),
+    }, index=df.index)
+    if not known.all():
+        logger.warning(f"Dropping {(~known).sum()} ITM rows without an outcome")
+        compact = compact[known]
+
+    before = df.memory_usage(deep=True).sum() / 2**20
+    after = compact.memory_usage(deep=True).sum() / 2**20
+    logger.info(f"ITM frame memory: {before:,.1f} MB -> {after:,.1f} MB")
+    return compact
+
+
+def load_itm_frame(config):
+    """
+    Read the ITM dataset and convert it to compact dtypes
+
+    The pickle is unpickled straight from the memory-mapped file or the
+    S3 stream, without a full copy of its bytes.
+    """
+    with span('itm.unpickle'), open_from_s3(config, config['pickle_path']) as f:
+        df = pd.read_pickle(f)
+    with span('itm.compact'):
+        return compact_itm_frame(df)
+
+
+def probs_heatmap(df, render_mode='vector'):
     """
     Generate a heatmap from the given frame
     save as IO buffer and pass as base64 string
     """
 
-    df.replace(0, np.nan, inplace=True)
+    df = df.replace(0, np.nan)
 
-    plt.figure(figsize=(9,4), dpi=600)
+    fig = plt.figure(figsize=(9,4), dpi=600)
     sns.heatmap(
         df,
         annot=True,
@@ -38,47 +78,163 @@ def probs_heatmap(df):
     plt.xlabel("delta bin", fontweight='bold')
     plt.ylabel("expiration", fontweight='bold')
 
-    buf = BytesIO()
-    plt.savefig(buf, format='svg', transparent=True)
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode('utf-8')
+    return encode_figure(fig, 'probs_heatmap', render_mode)
+
 
+def wilson_interval(successes, trials, z=1.96):
+    """
+    Wilson score interval for binomial proportions
+
+    Parameters
+    ----------
+    successes : array-like
+        Number of ITM outcomes per cell
+    trials : array-like
+        Number of observations per cell
+    z : float
+        Normal quantile of the interval, 1.96 for 95%
 
-def itm_stats(df, vix_open, otc_open):
+    Returns
+    -------
+    lower, upper : numpy.ndarray
+        Interval bounds, NaN for empty cells
     """
-    API-ready function
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = successes / trials
+        denominator = 1 + z**2 / trials
+        centre = (p + z**2 / (2 * trials)) / denominator
+        half_width = z * np.sqrt(
+            p * (1 - p) / trials + z**2 / (4 * trials**2)) / denominator
+
+    return centre - half_width, centre + half_width
+
+
+def bootstrap_interval(successes, trials, n_boot=2000, alpha=0.05, seed=0):
     """
-    df['vix_bins'], vix_bins = pd.qcut(df['vix_open'], q=4, retbins=True)
-    df['otc_bins'], otc_bins = pd.qcut(df['open_to_close_pct'], q=4, retbins=True)
+    Bootstrap interval for ITM probabilities of all cells at once
+
+    The group is resampled as a single multinomial over the
+    (cell, itm/otm) counts, so one draw of shape (n_boot, 2 * cells)
+    replaces the per-iteration resampling of the frame.
+
+    Parameters
+    ----------
+    successes : array-like
+        Number of ITM outcomes per cell
+    trials : array-like
+        Number of observations per cell
+    n_boot : int
+        Number of bootstrap resamples
+    alpha : float
+        Two-sided significance level
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray
+        Interval bounds in the shape of inputs, NaN for empty cells
+    """
+    successes = np.nan_to_num(np.asarray(successes, dtype=float))
+    trials = np.nan_to_num(np.asarray(trials, dtype=float))
+    shape = successes.shape
+
+    counts = np.concatenate([successes.ravel(), (trials - successes).ravel()])
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.full(shape, np.nan)
+        return empty, empty.copy()
+
+    rng = np.random.default_rng(seed)
+    draws = rng.multinomial(total, counts / total, size=n_boot)
+
+    n_cells = successes.size
+    hits = draws[:, :n_cells]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = hits / (hits + draws[:, n_cells:])
+
+    # Cells without observations stay NaN in every resample
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        lower, upper = np.nanquantile(probs, [alpha / 2, 1 - alpha / 2], axis=0)
+
+    return lower.reshape(shape), upper.reshape(shape)
+
+
+def probs_intervals(hits, counts):
+    """
+    Long table of probabilities with Wilson and bootstrap intervals
+    for every delta_bin x expiration_weekday cell
+    """
+    wilson_lower, wilson_upper = wilson_interval(hits, counts)
+    boot_lower, boot_upper = bootstrap_interval(hits, counts)
+
+    def _long(values, name):
+        frame = pd.DataFrame(values, index=counts.index, columns=counts.columns)
+        return frame.stack(future_stack=True).rename(name)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = hits.to_numpy(dtype=float) / counts.to_numpy(dtype=float)
+
+    return pd.concat([
+        _long(probs, 'prob'),
+        _long(counts.to_numpy(), 'samples'),
+        _long(wilson_lower, 'wilson_lower'),
+        _long(wilson_upper, 'wilson_upper'),
+        _long(boot_lower, 'bootstrap_lower'),
+        _long(boot_upper, 'bootstrap_upper'),
+    ], axis=1)
+
+
+def itm_stats(df, vix_open, otc_open, render_mode='vector'):
+    """
+    API-ready function, the heatmap is rendered in `render_mode`
+    """
+    # bins are kept aside as series, the frame itself is not modified
+    vix_cats, vix_bins = pd.qcut(df['vix_open'], q=4, retbins=True)
+    otc_cats, otc_bins = pd.qcut(df['open_to_close_pct'], q=4, retbins=True)
+    vix_cats = vix_cats.rename('vix_bins')
+    otc_cats = otc_cats.rename('otc_bins')
 
     # for sample size
-    group_sizes = df.groupby(['vix_bins','otc_bins'], observed=False).size()
+    group_sizes = df.groupby([vix_cats, otc_cats], observed=False).size()
 
-    # get probabilities
-    probs = pd.pivot_table(
-        df,
-        values='itm',
-        index=['vix_bins', 'otc_bins', 'expiration_weekday'],
-        columns=['delta_bin'],
-        aggfunc='mean',
-        observed=False)
+    # get ITM counts and sample sizes per cell
+    cells = df['itm'].groupby(
+        [vix_cats, otc_cats, df['expiration_weekday'], df['delta_bin']],
+        observed=False).agg(['sum', 'count'])
 
-    probs = probs.sort_index()
-    probs = probs.sort_index(axis=1)
+    hits = cells['sum'].unstack('delta_bin').sort_index().sort_index(axis=1)
+    counts = cells['count'].unstack('delta_bin').sort_index().sort_index(axis=1)
+    probs = hits / counts
 
     vix_bin = pd.cut([vix_open], bins=vix_bins, include_lowest=True)
     otc_bin = pd.cut([otc_open], bins=otc_bins, include_lowest=True)
 
     response = {}
 
-    result = probs.loc[(vix_bin, otc_bin, slice(None))].reset_index(level=[0,1], drop=True)
+    cell = (vix_bin, otc_bin, slice(None))
+    result = probs.loc[cell].reset_index(level=[0,1], drop=True)
+    group_hits = hits.loc[cell].reset_index(level=[0,1], drop=True)
+    group_counts = counts.loc[cell].reset_index(level=[0,1], drop=True)
+
+    intervals = probs_intervals(group_hits, group_counts)
+    response['intervals'] = intervals.to_html(
+        float_format="{:,.4f}".format,
+        classes='dataframe',
+        col_space=10,
+        na_rep='',
+    )
     response['probs'] = result.to_html(
         float_format="{:,.4f}".format,
         index_names=False,
         classes='dataframe',
         col_space=10,
     )
-    response['probs_heatmap'] = probs_heatmap(result)
+    response['probs_heatmap'] = probs_heatmap(result, render_mode)
     response['total_samples'] = f"{df.shape[0]}"
     response['group_samples'] = f"{group_sizes.loc[(vix_bin, otc_bin)].values[0]}"
     response['min_date'] = df['quote_datetime'].min().strftime('%Y-%m-%d')
@@ -90,13 +246,12 @@ def api_itm(config):
     """
     API call return
     """
-    byte_content = read_from_s3(config, config['pickle_path'], decode=False)
-    df = pd.read_pickle(BytesIO(byte_content))
+    df = load_itm_frame(config)
 
     result = {}
     vix_open, vix_quote_date = get_vix_open(config)
     otc_open, otc_quote_date = get_otc_open(config)
-    stats = itm_stats(df, vix_open, otc_open)
+    stats = itm_stats(df, vix_open, otc_open, config.get('render_mode', 'vector'))
 
     result['vix_open'] = vix_open
     result['vix_quote_date'] = vix_quote_date.strftime('%Y-%m-%d')
@@ -4,8 +4,21 @@ import pandas as pd
 import requests
 from loguru import logger
 
+from metrics import REGISTRY
+from pipeline import SKIPPED, Pipeline
+from tracing import span
+from warm_state import STATE
+
 logger.level("DEBUG")
 
+QUOTES_TTL = 900  # seconds a warm container reuses downloaded quotes
+QUOTES_URL = "https://financialmodelingprep.com/api/v3/historical-price-full/"
+BATCH_SIZE = 5  # tickers per request of the historical quotes API
+DEFAULT_UNDERLYING = ("^SPX", "^VIX")  # underlying and its volatility index
+UPSTREAM_REQUESTS = REGISTRY.counter(
+  "upstream_requests_total", "Requests to the market data API.", ("endpoint", "result"),
+)
+
 def get_historical_quotes(
   config: dict,
   ticker: str,
@@ -21,22 +34,29 @@ def get_historical_quotes(
     start_date = (pd.Timestamp.now() - pd.Timedelta(days=n_days)).strftime("%Y-%m-%d")
 
   logger.debug(f"Getting quotes for {ticker} from {start_date} to {end_date}")
-  url = "https://financialmodelingprep.com/api/v3/historical-price-full/"
-  url = url + f"{ticker}?from={start_date}&to={end_date}&apikey={api_key}"
+  url = QUOTES_URL + f"{ticker}?from={start_date}&to={end_date}&apikey={api_key}"
 
-  try:
-    response = requests.get(url, timeout=5)
-    response.raise_for_status()
-  except requests.exceptions.RequestException as e:
-    logger.error(f"Failed to fetch data from quotes api: {e}")
-    return None
+  with span("quotes.fetch", ticker=ticker) as fetch:
+    try:
+      response = requests.get(url, timeout=5)
+      response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+      UPSTREAM_REQUESTS.labels("quotes", "error").inc()
+      logger.error(f"Failed to fetch data from quotes api: {e}")
+      return None
+    UPSTREAM_REQUESTS.labels("quotes", "ok").inc()
+    fetch.add_bytes(len(response.content))
 
   try:
-    data = pd.DataFrame(response.json()["historical"])
+    return _quotes_frame(response.json()["historical"])
   except ValueError:
     logger.error(f"Failed to parse data from quotes api: {response.json()}")
     return None
 
+
+def _quotes_frame(historical: list) -> pd.DataFrame:
+  """Daily quotes of the API as a frame indexed by ascending date."""
+  data = pd.DataFrame(historical)
   data["date"] = pd.to_datetime(data["date"])
   data = data.set_index("date")
   del data["label"]  # Remove only non-numeric column
@@ -44,6 +64,144 @@ def get_historical_quotes(
   return data.sort_index(ascending=True)
 
 
+def get_historical_quotes_batch(
+  config: dict,
+  tickers: list,
+  n_days: int = 356,
+) -> dict:
+  """Get quotes of several tickers, BATCH_SIZE tickers per request.
+
+  Returns the frames by ticker, None for tickers that failed.
+  """
+  api_key = config["quotes_api_key"]
+  end_date = pd.Timestamp.now().strftime("%Y-%m-%d")
+  start_date = (pd.Timestamp.now() - pd.Timedelta(days=n_days)).strftime("%Y-%m-%d")
+
+  quotes = dict.fromkeys(tickers)
+  for i in range(0, len(tickers), BATCH_SIZE):
+    batch = tickers[i:i + BATCH_SIZE]
+    # A single ticker is answered without the list wrapper
+    if len(batch) == 1:
+      quotes[batch[0]] = get_historical_quotes(config, batch[0], start_date, end_date)
+      continue
+
+    logger.debug(f"Getting quotes for {batch} from {start_date} to {end_date}")
+    url = (
+      QUOTES_URL
+      + f"{','.join(batch)}?from={start_date}&to={end_date}&apikey={api_key}"
+    )
+    with span("quotes.fetch", ticker=",".join(batch)) as fetch:
+      try:
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+      except requests.exceptions.RequestException as e:
+        UPSTREAM_REQUESTS.labels("quotes", "error").inc()
+        logger.error(f"Failed to fetch data from quotes api: {e}")
+        continue
+      UPSTREAM_REQUESTS.labels("quotes", "ok").inc()
+      fetch.add_bytes(len(response.content))
+
+    try:
+      for item in response.json()["historicalStockList"]:
+        quotes[item["symbol"]] = _quotes_frame(item["historical"])
+    except (KeyError, ValueError):
+      logger.error(f"Failed to parse data from quotes api: {response.text[:200]}")
+  return quotes
+
+
+def _quotes_key(ticker: str) -> str:
+  return f"quotes:{ticker}:{pd.Timestamp.now().strftime('%Y-%m-%d')}"
+
+
+def cached_quotes(config: dict, ticker: str) -> pd.DataFrame:
+  """Historical quotes of today, shared by invocations for `quotes_ttl` seconds.
+
+  The frame is shared, callers must not modify it in place.
+  """
+  ttl = config.get("quotes_ttl")
+  return STATE.get(
+    _quotes_key(ticker),
+    lambda: get_historical_quotes(config, ticker),
+    ttl=QUOTES_TTL if ttl is None else ttl,
+  )
+
+
+def cached_quotes_batch(config: dict, tickers: list) -> dict:
+  """`cached_quotes` of several tickers, those not cached fetched in one batch."""
+  ttl = config.get("quotes_ttl")
+  ttl = QUOTES_TTL if ttl is None else ttl
+  missing = [ticker for ticker in tickers if STATE.peek(_quotes_key(ticker)) is None]
+  fetched = get_historical_quotes_batch(config, missing) if missing else {}
+
+  # Entries that expired since the peek are fetched on their own
+  return {
+    ticker: STATE.get(
+      _quotes_key(ticker),
+      lambda ticker=ticker: fetched[ticker]
+        if ticker in fetched else get_historical_quotes(config, ticker),
+      ttl=ttl,
+    )
+    for ticker in tickers
+  }
+
+
+def underlyings(config: dict) -> list:
+  """Configured (underlying, volatility index) pairs, the first is the primary."""
+  return config.get("underlyings") or [DEFAULT_UNDERLYING]
+
+
+def data_key(key: str, ticker: str) -> str:
+  """Storage key of data of an underlying.
+
+  The default underlying keeps `key`, so that data stored before other
+  underlyings were added is still found.
+  """
+  if ticker == DEFAULT_UNDERLYING[0]:
+    return key
+  stem, dot, extension = key.rpartition(".")
+  return f"{stem}_{ticker.lstrip('^').lower()}{dot}{extension}"
+
+
+def _available(ticker: str, quotes: pd.DataFrame | None) -> object:
+  """Quotes of a ticker, `SKIPPED` with an error logged when missing."""
+  if quotes is None:
+    logger.error(f"No quotes of {ticker}, skipping the nodes that use them")
+    return SKIPPED
+  return quotes
+
+
+def quotes_node(pipeline: Pipeline, config: dict, ticker: str) -> str:
+  """Register the historical quotes of a ticker once and return the node name.
+
+  The node is `SKIPPED` when the quotes are unavailable.
+  """
+  name = f"quotes:{ticker}"
+  if name not in pipeline:
+    pipeline.add(name, lambda: _available(ticker, cached_quotes(config, ticker)))
+  return name
+
+
+def quotes_nodes(pipeline: Pipeline, config: dict) -> dict:
+  """Register the quotes of all underlyings and their volatility indices.
+
+  Tickers without a node yet are fetched by one batch node, the node of
+  a ticker whose quotes are missing is `SKIPPED`. Returns the node
+  names by ticker.
+  """
+  tickers = list(dict.fromkeys(t for pair in underlyings(config) for t in pair))
+  missing = [ticker for ticker in tickers if f"quotes:{ticker}" not in pipeline]
+  if len(missing) > 1:
+    batch = f"quotes:{','.join(missing)}"
+    pipeline.add(batch, lambda: cached_quotes_batch(config, missing))
+    for ticker in missing:
+      pipeline.add(
+        f"quotes:{ticker}",
+        lambda quotes, ticker=ticker: _available(ticker, quotes[ticker]),
+        [batch],
+      )
+  return {ticker: quotes_node(pipeline, config, ticker) for ticker in tickers}
+
+
 def _get_last_quote(config: dict, ticker: str) -> dict:
   """Get the latest quote for a given ticker."""
   api_key = config["quotes_api_key"]
@@ -99,12 +257,16 @@ def get_economic_events(config: dict) -> pd.DataFrame:
       "apikey": api_key,
   }
 
-  try:
-      response = requests.get(base_url, params=params, timeout=5)
-      response.raise_for_status()
-  except requests.exceptions.RequestException as e:
-      logger.error(f"Failed to fetch economic events: {e}")
-      return None
+  with span("events.fetch") as fetch:
+    try:
+        response = requests.get(base_url, params=params, timeout=5)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        UPSTREAM_REQUESTS.labels("events", "error").inc()
+        logger.error(f"Failed to fetch economic events: {e}")
+        return None
+    UPSTREAM_REQUESTS.labels("events", "ok").inc()
+    fetch.add_bytes(len(response.content))
 
   try:
       events = response.json()
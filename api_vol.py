@@ -1,27 +1,34 @@
 """API for Volatility Estimators."""
-import base64
-from io import BytesIO
+from collections.abc import Callable
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import FuncFormatter
-
-import seaborn as sns
+import numpy as np
 import pandas as pd
 
 from loguru import logger
 
-from api_quotes import get_historical_quotes
-from volatility.estimators import VolatilityEstimator, multi_window_estimates
+from api_quotes import quotes_nodes, underlyings
+from pipeline import SKIPPED, Pipeline
+from plot_utils import (
+  CLIENT_MODE,
+  box_stats,
+  boxes_chart,
+  dense,
+  figure_svg,
+  lines_chart,
+  render,
+  render_pool,
+  save_plot,
+)
+from volatility.estimators import VolatilityEstimator, panel_estimates
+from volatility.sessions import next_sessions
 
 logger.level("DEBUG")
-plt.set_loglevel("WARNING")
 
 def to_percentage(value: float, _: str) -> dict:
   """Convert value to percentage."""
   return f"{100 * value:.1f}%"
 
-def vol_plot_trend_box(data: pd.DataFrame) -> str:
+def vol_plot_trend_box(data: pd.DataFrame, render_mode: str = "vector") -> dict:
   """Generate a plot of the trend of the volatility estimates.
 
   Moving average plot plus box plot
@@ -33,8 +40,40 @@ def vol_plot_trend_box(data: pd.DataFrame) -> str:
   min_window = data.columns.min()
   max_window = data.columns.max()
 
+  if render_mode == CLIENT_MODE:
+    chart = {"panels": [
+      lines_chart(data, band=[str(min_window), str(max_window)]),
+      boxes_chart(
+        {"mean": [box_stats(data[window]) for window in data.columns]},
+        data.columns,
+        line={"name": data.index[-1].strftime("%Y-%m-%d"), "values": data.iloc[-1]},
+      ),
+    ]}
+    plot = None
+  else:
+    chart = None
+    plot = _draw_trend_box(data, min_window, max_window, render_mode)
+
+  return {
+    "plot": plot,
+    "chart": chart,
+    "data": None,
+  }
+
+def _draw_trend_box(
+  data: pd.DataFrame,
+  min_window: int,
+  max_window: int,
+  render_mode: str,
+) -> bytes:
+  """Draw the moving averages and their box plot."""
+  import matplotlib.dates as mdates  # noqa: PLC0415
+  import matplotlib.pyplot as plt  # noqa: PLC0415
+  import seaborn as sns  # noqa: PLC0415
+  from matplotlib.ticker import FuncFormatter  # noqa: PLC0415
+
   # Figure setup
-  _, (ax1, ax2) = plt.subplots(
+  fig, (ax1, ax2) = plt.subplots(
     1, 2,
     figsize=(9, 4),
     dpi=600,
@@ -55,7 +94,8 @@ def vol_plot_trend_box(data: pd.DataFrame) -> str:
     where=(data.loc[:,min_window] > data.loc[:,max_window]),
     color=sns.color_palette("coolwarm")[-1],
     linewidth=0,
-    alpha=.2)
+    alpha=.2,
+    **dense(render_mode))
 
   ax1.fill_between(
     data.index,
@@ -64,7 +104,8 @@ def vol_plot_trend_box(data: pd.DataFrame) -> str:
     where=(data.loc[:,min_window] <= data.loc[:,max_window]),
     color=sns.color_palette("coolwarm")[0],
     linewidth=0,
-    alpha=.2)
+    alpha=.2,
+    **dense(render_mode))
 
   # Second subplot
   currs = data.iloc[-1].to_numpy()
@@ -78,7 +119,20 @@ def vol_plot_trend_box(data: pd.DataFrame) -> str:
     flierprops={"marker": "x"},
     ax=ax2,
   )
-  sns.stripplot(data, size=2, color=".3", ax=ax2)
+  # Strip of all values with the jitter of seaborn's stripplot, drawn from
+  # a seeded generator so that the same data gives the same SVG and asset
+  # key without touching the global RNG
+  rng = np.random.default_rng(0)
+  for position, column in enumerate(data.columns):
+    values = data[column].dropna()
+    ax2.scatter(
+      position + rng.uniform(-STRIP_JITTER, STRIP_JITTER, len(values)),
+      values,
+      s=2**2,
+      color=".3",
+      linewidth=0,
+      **dense(render_mode),
+    )
   sns.lineplot(currs, color="red", label=last_date, ax=ax2)
 
   # Formatting
@@ -94,18 +148,10 @@ def vol_plot_trend_box(data: pd.DataFrame) -> str:
 
   plt.tight_layout()
 
-  buf = BytesIO()
-  plt.savefig(buf, format="svg", transparent=True)
-  buf.seek(0)
-  plot = base64.b64encode(buf.read()).decode("utf-8")
-
-  return {
-    "plot": plot,
-    "data": None,
-  }
+  return figure_svg(fig, "mean_mwa", render_mode)
 
-def vol_plot_est_boxplots(data: pd.DataFrame) -> dict:
-  """Plot all estimators and windows in one plot."""
+def estimators_long(data: pd.DataFrame) -> pd.DataFrame:
+  """Estimates as (Index, Estimator, Window, Value) rows with readable names."""
   # Create a mapping for more readable names
   estimator_names = {
     "close_to_close": "Close-to-Close",
@@ -126,9 +172,50 @@ def vol_plot_est_boxplots(data: pd.DataFrame) -> dict:
 
   # Replace the estimator names with more readable versions
   df_long["Estimator"] = df_long["Estimator"].map(estimator_names)
+  return df_long
+
+def vol_plot_est_boxplots(data: pd.DataFrame, render_mode: str = "vector") -> dict:
+  """Plot all estimators and windows in one plot."""
+  df_long = estimators_long(data)
+
+  mean_estimator = data.xs("mean", level="Estimator", axis=1).iloc[-1]
+  latest_date = data.index[-1].strftime("%Y-%m-%d")
+
+  if render_mode == CLIENT_MODE:
+    windows = df_long["Window"].unique()
+    by_group = df_long.groupby(["Estimator", "Window"])["Value"]
+    chart = {"panels": [boxes_chart(
+      {
+        name: [box_stats(by_group.get_group((name, window))) for window in windows]
+        for name in df_long["Estimator"].unique()
+      },
+      [f"{int(window)} days" for window in windows],
+      line={"name": f"Mean on {latest_date}", "values": mean_estimator},
+    )]}
+    plot = None
+  else:
+    chart = None
+    plot = _draw_est_boxplots(df_long, mean_estimator, latest_date, render_mode)
+
+  return {
+    "plot": plot,
+    "chart": chart,
+    "data": estimator_stats(df_long),
+  }
+
+def _draw_est_boxplots(
+  df_long: pd.DataFrame,
+  mean_estimator: pd.Series,
+  latest_date: str,
+  render_mode: str,
+) -> bytes:
+  """Draw the boxes of all estimators and windows."""
+  import matplotlib.pyplot as plt  # noqa: PLC0415
+  import seaborn as sns  # noqa: PLC0415
+  from matplotlib.ticker import FuncFormatter  # noqa: PLC0415
 
   # Plotting
-  _, ax = plt.subplots(figsize=(9,4), dpi=600)
+  fig, ax = plt.subplots(figsize=(9,4), dpi=600)
   sns.boxplot(
     x="Window",
     y="Value",
@@ -140,8 +227,6 @@ def vol_plot_est_boxplots(data: pd.DataFrame) -> dict:
   )
 
   # Line plot for "mean" estimator across all windows
-  mean_estimator = data.xs("mean", level="Estimator", axis=1).iloc[-1]
-  latest_date = data.index[-1].strftime("%Y-%m-%d")
   sns.lineplot(
     data=mean_estimator.values,
     color="red",
@@ -160,11 +245,10 @@ def vol_plot_est_boxplots(data: pd.DataFrame) -> dict:
 
   plt.tight_layout()
 
-  buf = BytesIO()
-  plt.savefig(buf, format="svg", transparent=True)
-  buf.seek(0)
-  plot = base64.b64encode(buf.read()).decode("utf-8")
+  return figure_svg(fig, "estimators", render_mode)
 
+def estimator_stats(df_long: pd.DataFrame) -> pd.DataFrame:
+  """Quartiles, fences and relative position of the latest estimates."""
   # Create statistics table
   stats_table = df_long.groupby(["Estimator", "Window"])["Value"].agg([
     ("Q1", lambda x: x.quantile(0.25)),
@@ -203,27 +287,77 @@ def vol_plot_est_boxplots(data: pd.DataFrame) -> dict:
   stats_table["relative_position"] = stats_table["relative_position"] / 100
   stats_table["relative_position"] = stats_table["relative_position"].round(2)
 
-  return {
-    "plot": plot,
-    "data": stats_table,
-  }
+  return stats_table
 
 def vol_plot_zscore_vix(
   vols: pd.DataFrame,
   vix: pd.DataFrame,
   window: int,
+  vol_index: str = "^VIX",
+  render_mode: str = "vector",
 ) -> dict:
   """Plot z-score of mean 30 days window estimator."""
-  # Data preparation
+  data = zscore_vix_frame(vols, vix, window)
+
+  if render_mode == CLIENT_MODE:
+    chart = {"panels": [
+      lines_chart(
+        data[["vrp"]].rename(columns={"vrp": f"{vol_index} - RV {window} days"}),
+      ),
+      lines_chart(
+        data[["zscore"]].rename(columns={"zscore": f"Z-score for RV {window} days"}),
+        value_format="number",
+      ),
+    ]}
+    plot = None
+  else:
+    chart = None
+    plot = _draw_zscore_vix(data, window, vol_index, render_mode)
+
+  return {
+    "plot": plot,
+    "chart": chart,
+    "data": zscore_vix_records(data),
+  }
+
+def zscore_vix_frame(
+  vols: pd.DataFrame,
+  vix: pd.DataFrame,
+  window: int,
+) -> pd.DataFrame:
+  """Mean estimate of the window, its z-score and the premium of the index over it."""
   data = vols.xs(("mean", window), level=["Estimator","Window"], axis=1)
   data.columns = ["mean"]
   data = data.join(vix["close"])
   data["zscore"] = (data["mean"] - data["mean"].mean()) / data["mean"].std()
   data["close"] = data["close"] / 100
   data["vrp"] = data["close"] - data["mean"]
+  return data
+
+def zscore_vix_records(data: pd.DataFrame) -> list:
+  """Formatted rows of the last 14 days of `zscore_vix_frame`."""
+  data = data.iloc[-14:]
+  export_data = pd.DataFrame({
+    "Date": data.index.strftime("%Y-%m-%d"),
+    "Volatility Risk Premium": data["vrp"].map("{:.2%}".format),
+    "Realized Volatility z-score": data["zscore"].map("{:.2f}".format),
+  })
+  return export_data.to_dict("records")
+
+def _draw_zscore_vix(
+  data: pd.DataFrame,
+  window: int,
+  vol_index: str,
+  render_mode: str,
+) -> bytes:
+  """Draw the risk premium above the realized volatility z-score."""
+  import matplotlib.dates as mdates  # noqa: PLC0415
+  import matplotlib.pyplot as plt  # noqa: PLC0415
+  import seaborn as sns  # noqa: PLC0415
+  from matplotlib.ticker import FuncFormatter  # noqa: PLC0415
 
   # Figure setup
-  _, (ax1, ax2) = plt.subplots(
+  fig, (ax1, ax2) = plt.subplots(
     2, 1,
     figsize=(9,4),
     dpi=600,
@@ -232,7 +366,7 @@ def vol_plot_zscore_vix(
   sns.lineplot(
     data["vrp"],
     color="red",
-    label=f"^VIX - RV {window} days",
+    label=f"{vol_index} - RV {window} days",
     ax=ax1,
   )
 
@@ -259,59 +393,151 @@ def vol_plot_zscore_vix(
 
   plt.tight_layout()
 
-  buf = BytesIO()
-  plt.savefig(buf, format="svg", transparent=True)
-  buf.seek(0)
-  plot = base64.b64encode(buf.read()).decode("utf-8")
-
-  # Create export data
-  data = data.iloc[-14:]
-  export_data = pd.DataFrame({
-    "Date": data.index.strftime("%Y-%m-%d"),
-    "Volatility Risk Premium": data["vrp"].map("{:.2%}".format),
-    "Realized Volatility z-score": data["zscore"].map("{:.2f}".format),
-  })
+  return figure_svg(fig, "zscore_vix", render_mode)
 
-  return {
-    "plot": plot,
-    "data": export_data.to_dict("records"),
-  }
+ESTIMATORS = [
+  "close_to_close",
+  "parkinson",
+  "garman_klass",
+  "rogers_satchell",
+  "yang_zhang",
+]
+WINDOWS = [10, 22, 66, 100]
+ZSCORE_WINDOW = 22
+STRIP_JITTER = 0.08  # half width of the jitter of seaborn stripplot
 
-def api_vol(config: dict) -> dict:
-  """Return volatility data."""
-  estimators = [
-    "close_to_close",
-    "parkinson",
-    "garman_klass",
-    "rogers_satchell",
-    "yang_zhang",
-  ]
+def vol_panel_node(pipeline: Pipeline, config: dict) -> str:
+  """Register the estimates of all underlyings once and return the node name.
 
-  windows = [10, 22, 66, 100]
-  window = 22 # for z-score plot
+  Underlyings whose quotes are missing are left out.
+  """
+  tickers = [ticker for ticker, _ in underlyings(config)]
+  quotes = quotes_nodes(pipeline, config)
+  if "vol:panel" not in pipeline:
+    ens = VolatilityEstimator(estimators=ESTIMATORS)
+    pipeline.add(
+      "vol:panel",
+      lambda *frames: panel_estimates(
+        estimator=ens,
+        price_data={
+          ticker: frame
+          for ticker, frame in zip(tickers, frames, strict=True)
+          if frame is not SKIPPED
+        },
+        windows=WINDOWS,
+        components=True,
+      ),
+      [quotes[ticker] for ticker in tickers],
+      allow_skipped=True,
+    )
+  return "vol:panel"
+
+def add_vol_nodes(pipeline: Pipeline, config: dict, ticker: str | None = None) -> str:
+  """Register volatility report nodes of an underlying, the primary by default.
+
+  Returns the context node name. Estimates of all configured underlyings
+  are computed together, see `vol_panel_node`, the other nodes are
+  named after the underlying.
+  """
+  vol_indices = dict(underlyings(config))
+  ticker = ticker or next(iter(vol_indices))
+  vol_index = vol_indices[ticker]
+  quotes = quotes_nodes(pipeline, config)
+  underlying_quotes = quotes[ticker]
+  index_quotes = quotes[vol_index]
+
+  estimates = f"vol:estimates:{ticker}"
+  pipeline.add(
+    estimates,
+    lambda _, panel: panel[ticker],
+    [underlying_quotes, vol_panel_node(pipeline, config)],
+  )
 
-  spx = get_historical_quotes(config, "^SPX")
-  vix = get_historical_quotes(config, "^VIX")
+  # Figures render concurrently in worker processes, each gets only its
+  # data, and are saved as assets referenced by the page
+  render_mode = config.get("render_mode") or "vector"
+
+  def draw(fn: Callable, *args: object) -> dict:
+    pool = None if render_mode == CLIENT_MODE else render_pool(
+      config.get("render_workers"),
+    )
+    result = render(pool, fn, *args, render_mode)
+    return result | {"plot": save_plot(config, result["plot"])}
+
+  pipeline.add(
+    f"vol:trend_plot:{ticker}",
+    lambda vols: draw(vol_plot_trend_box, vols[["mean"]]),
+    [estimates],
+  )
+  pipeline.add(
+    f"vol:estimators:{ticker}",
+    lambda vols: draw(vol_plot_est_boxplots, vols),
+    [estimates],
+  )
+  pipeline.add(
+    f"vol:zscore_vix:{ticker}",
+    lambda vols, quotes: draw(
+      vol_plot_zscore_vix,
+      vols[["mean"]],
+      quotes[["close"]],
+      ZSCORE_WINDOW,
+      vol_index,
+    ),
+    [estimates, index_quotes],
+  )
 
-  ens = VolatilityEstimator(estimators=estimators)
-  vols = multi_window_estimates(
-    estimator=ens,
-    price_data=spx,
-    windows=windows,
-    components=True,
+  # Tables for the assistant, available before the figures are drawn
+  pipeline.add(
+    f"vol:estimators_data:{ticker}",
+    lambda vols: estimator_stats(estimators_long(vols)),
+    [estimates],
   )
+  pipeline.add(
+    f"vol:zscore_vix_data:{ticker}",
+    lambda vols, quotes: zscore_vix_records(
+      zscore_vix_frame(vols[["mean"]], quotes[["close"]], ZSCORE_WINDOW),
+    ),
+    [estimates, index_quotes],
+  )
+  pipeline.add(
+    f"vol:{ticker}",
+    vol_context,
+    [
+      underlying_quotes,
+      f"vol:trend_plot:{ticker}",
+      f"vol:estimators:{ticker}",
+      f"vol:zscore_vix:{ticker}",
+    ],
+  )
+  return f"vol:{ticker}"
 
+def vol_context(
+  spx: pd.DataFrame,
+  trend: dict,
+  estimators: dict,
+  zscore_vix: dict,
+) -> dict:
+  """Assemble the template context from the rendered figures."""
   context = {}
   context["start_date"] = spx.index.min().strftime("%Y-%m-%d")
   context["end_date"] = spx.index.max().strftime("%Y-%m-%d")
-  context["estimators"] = estimators
+  context["next_session"] = next_sessions(spx.index.max(), 1)[0].strftime("%Y-%m-%d")
+  context["estimators"] = ESTIMATORS
 
-  context["mean_mwa_plot"] = vol_plot_trend_box(vols)["plot"]
+  context["mean_mwa_plot"] = trend["plot"]
+  context["mean_mwa_chart"] = trend["chart"]
 
-  context["estimators_plot"] = vol_plot_est_boxplots(vols)["plot"]
-  context["estimators_data"] = vol_plot_est_boxplots(vols)["data"]
+  context["estimators_plot"] = estimators["plot"]
+  context["estimators_chart"] = estimators["chart"]
+  context["estimators_data"] = estimators["data"]
 
-  context["zscore_vix_plot"] = vol_plot_zscore_vix(vols, vix, window)["plot"]
-  context["zscore_vix_data"] = vol_plot_zscore_vix(vols, vix, window)["data"]
+  context["zscore_vix_plot"] = zscore_vix["plot"]
+  context["zscore_vix_chart"] = zscore_vix["chart"]
+  context["zscore_vix_data"] = zscore_vix["data"]
 
   return context
+
+def api_vol(config: dict, ticker: str | None = None) -> dict:
+  """Return volatility data of an underlying, the primary by default."""
+  pipeline = Pipeline()
+  return pipeline[add_vol_nodes(pipeline, config, ticker)]
@@ -1,49 +1,136 @@
-"""Main flask app."""
+"""Main flask app.
 
-from pathlib import Path
-from flask import Flask
+Routes import their API module on first use, so that starting the app
+and serving one route does not load the dependencies of all others.
+The report pages are rebuilt in the background and served from a cache,
+see `report_cache`. API routes answer with compact JSON, see `json_api`.
+`/metrics` exposes the process metrics to Prometheus, see `metrics`.
+"""
 
-from api_garch import api_garch
-from api_itm import api_itm
-from api_vol import api_vol
-from lambda_function import get_config, handler
+import gzip
+from collections.abc import Callable
+
+from flask import Flask, Response, abort, request
+
+from io_utils import COMPRESS_MIN_BYTES, read_from_s3
+from json_api import dumps
+from lambda_function import REPORT_KEY, get_config, handler, report_pages
+from metrics import CONTENT_TYPE, REGISTRY
+from report_cache import CachedReport
+from tracing import span, trace
 
 app = Flask(__name__)
 
-@app.route("/")
-def itm_report() -> str:
-  """Generate index.html file and return it."""
+GZIP_LEVEL = 5  # faster than the default 9 at nearly the same size
+
+
+def build_report() -> dict:
+  """Run the report pipeline and read back the published pages by key."""
   handler({}, None)
+  config = get_config()
+  return {
+    page["key"]: read_from_s3(config, page["key"], decode=True)
+    for page in report_pages(config)
+  }
+
+
+_config = get_config()
+REPORT = CachedReport(build_report, _config["report_ttl"], _config["report_stale_ttl"])
+
+
+@app.route("/", defaults={"key": REPORT_KEY})
+@app.route("/<key>")
+def itm_report(key: str) -> Response:
+  """Serve a cached report page, 304 if the client has this version.
+
+  `/` is the page of the primary underlying, the others are served by
+  their key, e.g. `/ndx.html`.
+  """
+  if key not in {page["key"] for page in report_pages(get_config())}:
+    abort(404)
+  page = REPORT.get(key)
+  response = Response(page.body, mimetype="text/html")
+  response.set_etag(page.etag)
+  response.cache_control.public = True
+  response.cache_control.max_age = max(0, int(REPORT.ttl - REPORT.age(page)))
+  return response.make_conditional(request)
+
 
-  # Read the generated index.html file
-  with Path("index.html").open() as file:
-    return file.read()
+def json_response(name: str, compute: Callable[[], dict]) -> Response:
+  """Compute, encode and compress an API result, timed in Server-Timing.
+
+  `?plots=0` leaves out the figures. Bodies above COMPRESS_MIN_BYTES
+  are gzipped for clients that accept it.
+  """
+  plots = request.args.get("plots", "1").lower() not in ("0", "false", "no")
+  with trace(name) as api_trace:
+    with span("compute"):
+      result = compute()
+    with span("encode") as encoded:
+      body = dumps(result, plots=plots)
+      encoded.add_bytes(len(body))
+    gzipped = "gzip" in request.accept_encodings and len(body) >= COMPRESS_MIN_BYTES
+    if gzipped:
+      with span("gzip") as compressed:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        compressed.add_bytes(len(body))
+
+  response = Response(body, mimetype="application/json")
+  if gzipped:
+    response.headers["Content-Encoding"] = "gzip"
+  response.vary.add("Accept-Encoding")
+  response.headers["Server-Timing"] = api_trace.server_timing()
+  return response
+
+
+def requested_ticker(config: dict) -> str | None:
+  """Underlying of `?ticker=`, 404 unless it is configured."""
+  ticker = request.args.get("ticker")
+  if ticker is not None and ticker not in dict(config["underlyings"]):
+    abort(404, f"Unknown underlying {ticker}")
+  return ticker
+
+
+@app.route("/metrics")
+def metrics() -> Response:
+  """Process metrics in the Prometheus text format."""
+  return Response(REGISTRY.expose(), content_type=CONTENT_TYPE)
 
 
 @app.route("/api/itm")
-def predict_itm() -> str:
+def predict_itm() -> Response:
   """Predict ITM probability."""
+  from api_itm import api_itm  # noqa: PLC0415
+
   config = get_config()
-  return api_itm(config)
+  return json_response("itm", lambda: api_itm(config))
 
 
 @app.route("/api/vol")
-def volatility() -> str:
-  """Return volatility data."""
+def volatility() -> Response:
+  """Return volatility data of `?ticker=`, the primary underlying by default."""
+  from api_vol import api_vol  # noqa: PLC0415
+
   config = get_config()
-  return api_vol(config)
+  ticker = requested_ticker(config)
+  return json_response("vol", lambda: api_vol(config, ticker))
 
 
 @app.route("/api/garch")
-def garch() -> str:
-  """Return GARCH data."""
+def garch() -> Response:
+  """Return GARCH data of `?ticker=`, the primary underlying by default."""
+  from api_garch import api_garch  # noqa: PLC0415
+
   config = get_config()
-  return api_garch(config)
+  ticker = requested_ticker(config)
+  return json_response("garch", lambda: api_garch(config, ticker))
 
 
 @app.route("/api/assistant")
 def assistant() -> str:
   """Return assistant data."""
+  from api_assistant import api_assistant  # noqa: PLC0415
+
   config = get_config()
   return api_assistant(config)
 
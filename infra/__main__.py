@@ -17,17 +17,17 @@ aws.config.region = os.environ.get("AWS_REGION", "us-east-1")
 website_bucket = s3h.create_bucket()
 s3h.upload_files(website_bucket)
 
+# Setup CloudFront, the Lambda invalidates the pages it changes
+distribution = cf.setup_cloudfront(website_bucket)
+
 # Setup the Lambda function to process the website files.
 ecr_repo = lmh.setup_ecr_repo()
 lambda_image = lmh.setup_lambda_image(ecr_repo)
-website_lambda = lmh.setup_lambda(lambda_image, website_bucket)
+website_lambda = lmh.setup_lambda(lambda_image, website_bucket, distribution)
 
 # Setup scheduler
 sch.schedule_lambda(website_lambda)
 
-# Setup CloudFront
-distribution = cf.setup_cloudfront(website_bucket)
-
 # Setup ACM
 r53.setup_dns(distribution)
 
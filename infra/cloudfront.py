@@ -40,6 +40,24 @@ def setup_cloudfront(website_bucket: aws.s3.Bucket) -> aws.cloudfront.Distributi
       default_ttl=3600,
       max_ttl=3600,
     ),
+    # Content-hashed plot assets never change, cache them for a year
+    ordered_cache_behaviors=[
+      aws.cloudfront.DistributionOrderedCacheBehaviorArgs(
+        path_pattern="static/assets/*",
+        allowed_methods=["GET", "HEAD"],
+        cached_methods=["GET", "HEAD"],
+        target_origin_id=website_bucket.arn,
+        forwarded_values=aws.cloudfront.DistributionOrderedCacheBehaviorForwardedValuesArgs(
+          query_string=False,
+          cookies=aws.cloudfront.DistributionOrderedCacheBehaviorForwardedValuesCookiesArgs(forward='none'), # pylint: disable=line-too-long
+        ),
+        viewer_protocol_policy="redirect-to-https",
+        compress=True,
+        min_ttl=0,
+        default_ttl=31536000,
+        max_ttl=31536000,
+      ),
+    ],
     price_class="PriceClass_100",
     restrictions=aws.cloudfront.DistributionRestrictionsArgs(
       geo_restriction=aws.cloudfront.DistributionRestrictionsGeoRestrictionArgs(
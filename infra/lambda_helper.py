@@ -65,6 +65,7 @@ def setup_lambda_image(repo):
 def setup_lambda(
         lambda_image: aws.lambda_.Function,
         website_bucket: aws.s3.Bucket,
+        distribution: aws.cloudfront.Distribution,
     ) -> aws.lambda_.Function:
     """Set up roles and lambda function."""
     # Create an IAM role and policy that grants the necessary permissions to the Lambda function.
@@ -81,19 +82,27 @@ def setup_lambda(
         ).json,
     )
 
-    # Define a policy that allows the lambda to modify the website's S3 bucket.
+    # Define a policy that allows the lambda to modify the website's S3 bucket
+    # and to invalidate the pages it changes on CloudFront.
     _ = aws.iam.RolePolicy("lambda-policy",
         role=lambda_role.id,
-        policy=website_bucket.arn.apply(
-            lambda arn: aws.iam.get_policy_document(
-                statements=[aws.iam.GetPolicyDocumentStatementArgs(
-                    actions=[
-                        "s3:GetObject",
-                        "s3:PutObject",
-                    ],
-                    resources=[arn + "/*"],
-                    effect="Allow",
-                )],
+        policy=pulumi.Output.all(website_bucket.arn, distribution.arn).apply(
+            lambda arns: aws.iam.get_policy_document(
+                statements=[
+                    aws.iam.GetPolicyDocumentStatementArgs(
+                        actions=[
+                            "s3:GetObject",
+                            "s3:PutObject",
+                        ],
+                        resources=[arns[0] + "/*"],
+                        effect="Allow",
+                    ),
+                    aws.iam.GetPolicyDocumentStatementArgs(
+                        actions=["cloudfront:CreateInvalidation"],
+                        resources=[arns[1]],
+                        effect="Allow",
+                    ),
+                ],
             ).json),
     )
 
@@ -102,7 +111,8 @@ def setup_lambda(
         package_type="Image",
         image_uri=lambda_image.image_name,
         role=lambda_role.arn,
-        memory_size=1024,
+        # Size from `python -m memprofile`, which suggests a value
+        memory_size=int(os.environ.get("LAMBDA_MEMORY_MB", "1024")),
         timeout=120,
         environment=aws.lambda_.FunctionEnvironmentArgs(
             variables={
@@ -112,6 +122,7 @@ def setup_lambda(
                 "QUOTES_API_KEY": os.environ.get("QUOTES_API_KEY"),
                 "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY"),
                 "NTFY_TOPIC": os.environ.get("NTFY_TOPIC"),
+                "CLOUDFRONT_DISTRIBUTION_ID": distribution.id,
             },
         ),
     )
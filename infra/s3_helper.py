@@ -48,6 +48,8 @@ def upload_files(website_bucket):
 
             if filename.endswith(".css"):
                 content_type = "text/css"
+            elif filename.endswith(".js"):
+                content_type = "text/javascript"
             else:
                 content_type = None
 
@@ -1,42 +1,694 @@
 """
 Utility functions for reading and writing files.
 """
-import boto3
+import contextlib
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import mmap
+import os
+import shutil
+import tempfile
+import threading
 
-def save_to_s3(config, filename, content, content_type=None):
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from loguru import logger
+
+from metrics import REGISTRY
+from tracing import span
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-addressed objects never change, browsers and CloudFront keep them
+ASSET_PREFIX = 'static/assets/'
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Precompression of text uploads, S3 serves the stored encoding as is
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = (
+    'text/', 'image/svg+xml', 'application/json', 'application/javascript')
+BROTLI_QUALITY = 11
+
+# Uploads larger than this are compressed into a spooled file and sent
+# in parts instead of being held in memory
+STREAM_MIN_BYTES = 8 * 1024 * 1024
+STREAM_CHUNK = 1024 * 1024
+
+# Connections of the shared clients, one per concurrent pipeline node
+MAX_POOL_CONNECTIONS = 32
+
+# Local copies of S3 objects, see CachedStorage
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+VERSION_SUFFIX = '.version'
+CACHE_REQUESTS = REGISTRY.counter(
+    'storage_cache_requests_total',
+    'Local cache lookups of stored objects.',
+    ('result',))
+
+_client_lock = threading.Lock()
+
+
+@functools.cache
+def _cached_client(service):
+    import boto3  # noqa: PLC0415
+
+    config = Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+    return boto3.client(service, config=config)
+
+
+def aws_client(service):
     """
-    Save the content to an S3 bucket
+    Shared boto3 client, clients are thread-safe but creating them is not
     """
+    with _client_lock:
+        return _cached_client(service)
 
-    # Upload the content to the S3 bucket
-    if config['mode'] == 'dev':
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(content)
-    elif config['mode'] == 'prod':
-        s3 = boto3.client('s3')
-        s3.put_object(
-            Body=content,
-            Bucket=config['bucket_name'],
-            Key=filename,
-            ContentType=content_type)
 
+def s3_client():
+    """
+    Shared S3 client
+    """
+    return aws_client('s3')
 
-def read_from_s3(config, filename, decode=False):
+
+@functools.cache
+def _warn_brotli_missing():
+    """
+    Warn once per process that br uploads are gzipped instead
+    """
+    logger.warning("Brotli is not installed, br uploads fall back to gzip")
+
+
+def content_encoding(config, content_type):
+    """
+    Encoding of uploads of the given type, None for identity
+
+    `config['upload_encoding']` selects gzip (default), br or identity.
+    Brotli falls back to gzip, with a warning, when the module is not
+    installed.
+    """
+    if not content_type or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return None
+    encoding = config.get('upload_encoding') or 'gzip'
+    if encoding == 'br' and brotli is None:
+        _warn_brotli_missing()
+        return 'gzip'
+    return None if encoding == 'identity' else encoding
+
+
+def compress(content, encoding):
+    """
+    Compress bytes, gzip without a timestamp so equal content gives equal bytes
+    """
+    if encoding == 'gzip':
+        return gzip.compress(content, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return content
+
+
+def decompress(content, encoding):
+    """
+    Inverse of `compress`
+    """
+    if encoding == 'gzip':
+        return gzip.decompress(content)
+    if encoding == 'br':
+        return brotli.decompress(content)
+    return content
+
+
+def _put(config, key, content, content_type=None, **kwargs):
+    """
+    Upload bytes, precompressed above COMPRESS_MIN_BYTES
+    """
+    encoding = content_encoding(config, content_type)
+    if encoding and len(content) >= COMPRESS_MIN_BYTES:
+        content = compress(content, encoding)
+        kwargs['ContentEncoding'] = encoding
+    if content_type:
+        kwargs['ContentType'] = content_type
+
+    s3_client().put_object(
+        Body=content,
+        Bucket=config['bucket_name'],
+        Key=key,
+        **kwargs)
+
+
+def upload_stream(config, key, stream, content_type=None, **kwargs):
+    """
+    Upload a file object in parts, compressing it on the way
+
+    The compressed copy is spooled to a temporary file once it outgrows
+    STREAM_MIN_BYTES, so memory stays bounded for large artifacts.
+    Brotli is not streamed, large compressible uploads use gzip.
+    """
+    extra_args = dict(kwargs)
+    if content_type:
+        extra_args['ContentType'] = content_type
+
+    with tempfile.SpooledTemporaryFile(max_size=STREAM_MIN_BYTES) as spool:
+        if content_encoding(config, content_type):
+            with gzip.GzipFile(fileobj=spool, mode='wb', mtime=0) as gz:
+                shutil.copyfileobj(stream, gz, STREAM_CHUNK)
+            extra_args['ContentEncoding'] = 'gzip'
+        else:
+            shutil.copyfileobj(stream, spool, STREAM_CHUNK)
+        spool.seek(0)
+
+        s3_client().upload_fileobj(
+            spool,
+            config['bucket_name'],
+            key,
+            ExtraArgs=extra_args)
+
+
+class Storage:
+    """
+    Interface of the storage backends
+
+    Keys are paths relative to the site root. `open` returns a binary
+    file object, the other reads are built on it unless a backend has a
+    cheaper way.
+    """
+
+    def open(self, key):
+        """
+        Binary file object of a stored object
+        """
+        raise NotImplementedError
+
+    def write(self, key, content, content_type=None, metadata=None, **kwargs):
+        """
+        Store str, bytes or a binary file object under a key
+        """
+        raise NotImplementedError
+
+    def version(self, key):
+        """
+        Version of a stored object, None if it does not exist
+        """
+        raise NotImplementedError
+
+    def metadata(self, key):
+        """
+        User metadata of a stored object, empty if it does not exist
+        """
+        return {}
+
+    def delete(self, key):
+        """
+        Remove a stored object if it exists
+        """
+        raise NotImplementedError
+
+    def exists(self, key):
+        """
+        Whether an object is stored under a key
+        """
+        return self.version(key) is not None
+
+    def read(self, key):
+        """
+        Contents of a stored object
+        """
+        with self.open(key) as f:
+            return f.read()
+
+    def read_range(self, key, start, end=None):
+        """
+        Bytes `start` to `end` (exclusive, None for the end) of an object
+        """
+        with self.open(key) as f:
+            try:
+                f.seek(start)
+            except (OSError, AttributeError):
+                f.read(start)
+            return f.read() if end is None else f.read(end - start)
+
+    def read_if_modified(self, key, version=None):
+        """
+        Contents and version of an object, None as contents if the
+        version did not change
+        """
+        current = self.version(key)
+        if current is None:
+            raise FileNotFoundError(key)
+        if current == version:
+            return None, version
+        return self.read(key), current
+
+
+def _as_bytes(content):
+    return content.encode('utf-8') if isinstance(content, str) else content
+
+
+class LocalStorage(Storage):
+    """
+    Files under a root directory, read memory-mapped
+
+    Writes go to a temporary file that replaces the target, so readers
+    holding a mapping of the old file are not affected.
     """
-    Read a file from an S3 bucket
+
+    def __init__(self, root='.'):
+        self.root = root
+
+    def path(self, key):
+        """
+        Filesystem path of a key
+        """
+        return os.path.join(self.root, key)
+
+    def open(self, key):
+        with open(self.path(key), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()
+            # The mapping stays valid after the file is closed
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_range(self, key, start, end=None):
+        with self.open(key) as f:
+            return f[start:end] if isinstance(f, mmap.mmap) else b''
+
+    def write(self, key, content, content_type=None, metadata=None, **kwargs):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(path) or '.', delete=False) as f:
+            try:
+                if hasattr(content, 'read'):
+                    shutil.copyfileobj(content, f, STREAM_CHUNK)
+                else:
+                    f.write(_as_bytes(content))
+            except BaseException:
+                os.remove(f.name)
+                raise
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, path)
+
+    def version(self, key):
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class MemoryStorage(Storage):
+    """
+    Objects held in a dict, for tests and local runs without files
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            if key not in self._objects:
+                raise FileNotFoundError(key)
+            return self._objects[key]
+
+    def open(self, key):
+        return io.BytesIO(self._get(key)[0])
+
+    def read(self, key):
+        return self._get(key)[0]
+
+    def write(self, key, content, content_type=None, metadata=None, **kwargs):
+        content = content.read() if hasattr(content, 'read') else _as_bytes(content)
+        with self._lock:
+            version = str(next(self._versions))
+            self._objects[key] = (content, dict(metadata or {}), version)
+
+    def version(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        return entry and entry[2]
+
+    def metadata(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        return dict(entry[1]) if entry else {}
+
+    def delete(self, key):
+        with self._lock:
+            self._objects.pop(key, None)
+
+
+class S3Storage(Storage):
     """
+    Objects in the S3 bucket of the configuration
 
+    Uses the shared client and its connection pool. Text types are
+    uploaded precompressed with Content-Encoding set, content larger
+    than STREAM_MIN_BYTES or given as a binary file object is streamed.
+    Reads undo the Content-Encoding, gzip objects are decompressed while
+    they are streamed.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.bucket = config['bucket_name']
+
+    def _get(self, key, **kwargs):
+        return s3_client().get_object(Bucket=self.bucket, Key=key, **kwargs)
+
+    def _head(self, key):
+        """
+        Head of an object, None if it does not exist
+
+        Without ListBucket a missing key gives 403.
+        """
+        try:
+            return s3_client().head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('403', '404', 'NoSuchKey'):
+                return None
+            raise
+
+    def open(self, key):
+        response = self._get(key)
+        encoding = response.get('ContentEncoding')
+        if encoding == 'gzip':
+            return gzip.GzipFile(fileobj=response['Body'], mode='rb')
+        if encoding:
+            return io.BytesIO(decompress(response['Body'].read(), encoding))
+        return response['Body']
+
+    def read(self, key):
+        response = self._get(key)
+        return decompress(response['Body'].read(), response.get('ContentEncoding'))
+
+    def read_range(self, key, start, end=None):
+        """
+        Ranged GET of an object, ranges of compressed objects are
+        applied after decompression
+        """
+        last = '' if end is None else end - 1
+        response = self._get(key, Range=f'bytes={start}-{last}')
+        if response.get('ContentEncoding'):
+            response['Body'].close()
+            return super().read_range(key, start, end)
+        return response['Body'].read()
+
+    def read_if_modified(self, key, version=None):
+        kwargs = {'IfNoneMatch': version} if version else {}
+        try:
+            response = self._get(key, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('304', 'NotModified'):
+                return None, version
+            raise
+        content = decompress(response['Body'].read(), response.get('ContentEncoding'))
+        return content, response['ETag']
+
+    def write(self, key, content, content_type=None, metadata=None, **kwargs):
+        if metadata:
+            kwargs['Metadata'] = metadata
+        content = _as_bytes(content)
+        if hasattr(content, 'read'):
+            upload_stream(self.config, key, content, content_type, **kwargs)
+        elif len(content) > STREAM_MIN_BYTES:
+            upload_stream(self.config, key, io.BytesIO(content), content_type, **kwargs)
+        else:
+            _put(self.config, key, content, content_type, **kwargs)
+
+    def version(self, key):
+        head = self._head(key)
+        return head and head['ETag']
+
+    def metadata(self, key):
+        head = self._head(key)
+        return head.get('Metadata', {}) if head else {}
+
+    def delete(self, key):
+        s3_client().delete_object(Bucket=self.bucket, Key=key)
+
+
+class CachedStorage(Storage):
+    """
+    Read-through copies of another storage on the local disk
+
+    Objects are downloaded once, streamed into `cache_dir`, and read
+    memory-mapped from there. Each open checks the version at the
+    source, so changed objects are downloaded again. Writes go to the
+    source and drop the local copy. The least recently used copies are
+    removed once the cache holds more than `max_bytes`.
+    """
+
+    def __init__(self, source, cache_dir, max_bytes=CACHE_MAX_BYTES):
+        self.source = source
+        self.local = LocalStorage(cache_dir)
+        self.max_bytes = max_bytes
+
+    def _version_path(self, key):
+        return self.local.path(key) + VERSION_SUFFIX
+
+    def _fetch(self, key):
+        """
+        Make the local copy current
+        """
+        version = self.source.version(key)
+        if version is None:
+            raise FileNotFoundError(key)
+
+        path = self.local.path(key)
+        try:
+            with open(self._version_path(key), encoding='utf-8') as f:
+                cached = f.read()
+        except FileNotFoundError:
+            cached = None
+        if cached == version and os.path.exists(path):
+            CACHE_REQUESTS.labels('hit').inc()
+            os.utime(path)
+            return
+
+        CACHE_REQUESTS.labels('miss').inc()
+        with self.source.open(key) as src:
+            self.local.write(key, src)
+        with open(self._version_path(key), 'w', encoding='utf-8') as f:
+            f.write(version)
+        self._trim()
+
+    def _trim(self):
+        """
+        Remove least recently used copies over `max_bytes`
+        """
+        files = []
+        for directory, _, names in os.walk(self.local.root):
+            for name in names:
+                if not name.endswith(VERSION_SUFFIX):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            for stale in (path, path + VERSION_SUFFIX):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(stale)
+            total -= size
+
+    def open(self, key):
+        self._fetch(key)
+        return self.local.open(key)
+
+    def read_range(self, key, start, end=None):
+        self._fetch(key)
+        return self.local.read_range(key, start, end)
+
+    def write(self, key, content, content_type=None, metadata=None, **kwargs):
+        self.source.write(key, content, content_type, metadata, **kwargs)
+        self.local.delete(key)
+
+    def version(self, key):
+        return self.source.version(key)
+
+    def metadata(self, key):
+        return self.source.metadata(key)
+
+    def read_if_modified(self, key, version=None):
+        return self.source.read_if_modified(key, version)
+
+    def delete(self, key):
+        self.source.delete(key)
+        self.local.delete(key)
+
+
+def storage(config):
+    """
+    Storage backend of the configuration
+
+    `config['storage']` selects a backend directly, e.g. MemoryStorage
+    in tests. Otherwise dev uses the working directory and prod the S3
+    bucket, behind a local cache in `config['cache_dir']` if it is set.
+    """
+    if config.get('storage') is not None:
+        return config['storage']
     if config['mode'] == 'dev':
-        with open(filename, 'rb') as f:
-            file_contents = f.read()
-    elif config['mode'] == 'prod':
-        s3 = boto3.client('s3')
-        response = s3.get_object(
-            Bucket=config['bucket_name'],
-            Key=filename)
-        file_contents = response['Body'].read()
+        return LocalStorage()
+    if config.get('cache_dir'):
+        return CachedStorage(S3Storage(config), config['cache_dir'])
+    return S3Storage(config)
+
+
+def save_to_s3(config, filename, content, content_type=None, metadata=None):
+    """
+    Save the content to the storage of the configuration
+
+    `metadata` is stored as user metadata of the object where the
+    backend supports it, see `Storage.write`.
+    """
+    with span('storage.write', key=filename) as write:
+        storage(config).write(filename, content, content_type, metadata)
+        if not hasattr(content, 'read'):
+            write.add_bytes(len(_as_bytes(content)))
+
 
+def read_from_s3(config, filename, decode=False):
+    """
+    Read a file from the storage, undoing any Content-Encoding
+    """
+    with span('storage.read', key=filename) as read:
+        file_contents = storage(config).read(filename)
+        read.add_bytes(len(file_contents))
     if decode:
         file_contents = file_contents.decode('utf-8')
-
     return file_contents
+
+
+def open_from_s3(config, filename):
+    """
+    Binary file object of a stored file, without reading it into memory
+
+    Local files and cached copies are memory-mapped, S3 objects are
+    streamed.
+    """
+    return storage(config).open(filename)
+
+
+def read_if_modified(config, filename, version=None, decode=False):
+    """
+    Read a file unless it still has the given version
+
+    The version is the ETag of the object in S3 and the modification
+    time and size of a local file.
+
+    Returns
+    -------
+    file_contents : bytes, str or None
+        Contents of the file, None if the version did not change
+    version : str
+        Version of the file
+    """
+    with span('storage.read', key=filename) as read:
+        file_contents, version = storage(config).read_if_modified(filename, version)
+        read.add_bytes(len(file_contents or b''))
+    if decode and file_contents is not None:
+        file_contents = file_contents.decode('utf-8')
+    return file_contents, version
+
+
+def read_metadata(config, filename):
+    """
+    User metadata of a stored object, empty if it does not exist
+    """
+    return storage(config).metadata(filename)
+
+
+def invalidate_cdn(config, keys, reference):
+    """
+    Invalidate changed keys on the CloudFront distribution
+
+    `index.html` is also served as the default root object, so the root
+    path is invalidated with it. Nothing is sent without a distribution
+    or changed keys.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration with mode and distribution id
+    keys : list of str
+        Changed object keys
+    reference : str
+        Unique reference of the invalidation, e.g. the content digest
+
+    Returns
+    -------
+    paths : list of str
+        Invalidated paths
+    """
+    if config['mode'] != 'prod' or not config.get('distribution_id') or not keys:
+        return []
+
+    paths = [f'/{key}' for key in keys]
+    if 'index.html' in keys:
+        paths.append('/')
+
+    aws_client('cloudfront').create_invalidation(
+        DistributionId=config['distribution_id'],
+        InvalidationBatch={
+            'Paths': {'Quantity': len(paths), 'Items': paths},
+            'CallerReference': reference,
+        })
+    return paths
+
+
+def asset_key(content, extension):
+    """
+    Key of an asset named by the SHA-256 of its content
+    """
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    return f'{ASSET_PREFIX}{digest}.{extension}'
+
+
+def save_asset(config, content, extension, content_type):
+    """
+    Save immutable content under its hash and return the key
+
+    Objects that already exist are not uploaded again, since the same
+    key always holds the same bytes.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration with mode and bucket name
+    content : bytes
+        Asset content
+    extension : str
+        File extension of the key
+    content_type : str
+        MIME type of the content
+
+    Returns
+    -------
+    key : str
+        Key of the asset, relative to the site root
+    """
+    key = asset_key(content, extension)
+
+    backend = storage(config)
+    if not backend.exists(key):
+        with span('storage.write', key=key) as write:
+            backend.write(key, content, content_type, CacheControl=ASSET_CACHE_CONTROL)
+            write.add_bytes(len(content))
+
+    return key
@@ -0,0 +1,94 @@
+"""JSON encoding of API results.
+
+Frames become columnar arrays, dates ISO strings and NaN null. orjson
+is used when it is installed.
+"""
+
+import datetime
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+# Keys holding figures, dropped when a response asks for no plots
+PLOT_KEYS = ("plot", "probs_heatmap")
+PLOT_SUFFIX = "_plot"
+
+
+def _is_plot(key: object) -> bool:
+  return isinstance(key, str) and (key in PLOT_KEYS or key.endswith(PLOT_SUFFIX))
+
+
+def _array(values: object) -> list:
+  """Values of an index, series or column as a list, NaN and NaT as None."""
+  if isinstance(values, pd.MultiIndex):
+    return [list(label) for label in values.to_flat_index()]
+  if isinstance(values, pd.DatetimeIndex | pd.Series) and (
+    isinstance(values.dtype, pd.DatetimeTZDtype) or values.dtype.kind == "M"
+  ):
+    values = pd.DatetimeIndex(values)
+    daily = (values.normalize() == values).all()
+    if daily:
+      strings = values.strftime("%Y-%m-%d")
+    else:
+      strings = values.map(pd.Timestamp.isoformat)
+    return [None if pd.isna(v) else s for v, s in zip(values, strings, strict=True)]
+
+  array = np.asarray(values)
+  if array.dtype.kind == "f":
+    return np.where(np.isnan(array), None, array).tolist()
+  if array.dtype.kind in "iub":
+    return array.tolist()
+  return [to_jsonable(value) for value in array.tolist()]
+
+
+def to_jsonable(value: object, plots: bool = True) -> object:
+  """Convert API results to JSON types.
+
+  A frame becomes {"columns", "index", "data"} with one array per
+  column, a series {"index", "values"}. Without `plots`, figure keys
+  of dicts are left out at any depth.
+  """
+  if isinstance(value, dict):
+    return {
+      str(key): to_jsonable(item, plots)
+      for key, item in value.items()
+      if plots or not _is_plot(key)
+    }
+  if isinstance(value, pd.DataFrame):
+    return {
+      "columns": _array(value.columns),
+      "index": _array(value.index),
+      "data": [_array(value.iloc[:, i]) for i in range(value.shape[1])],
+    }
+  if isinstance(value, pd.Series):
+    return {"index": _array(value.index), "values": _array(value)}
+  if isinstance(value, pd.Index | np.ndarray):
+    return _array(value)
+  if isinstance(value, list | tuple):
+    return [to_jsonable(item, plots) for item in value]
+  if isinstance(value, np.generic):
+    value = value.item()
+  if isinstance(value, float) and math.isnan(value):
+    return None
+  if value is pd.NaT:
+    return None
+  if isinstance(value, datetime.date):
+    return value.isoformat()
+  if isinstance(value, str | int | float | bool) or value is None:
+    return value
+  return str(value)
+
+
+def dumps(value: object, plots: bool = True) -> bytes:
+  """Encode API results as compact JSON bytes."""
+  value = to_jsonable(value, plots)
+  if orjson is not None:
+    return orjson.dumps(value)
+  return json.dumps(value, separators=(",", ":"), allow_nan=False).encode("utf-8")
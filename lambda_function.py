@@ -1,21 +1,33 @@
-"""Standalone renderer of jinja2 template."""
+"""Standalone renderer of jinja2 template.
 
+Only light modules are imported at load time. The report stages import
+pandas, arch, openai and boto3 when the handler builds and runs them,
+which keeps the Lambda cold start short, see `profiling.py`.
+"""
+
+import hashlib
 import os
-import requests
+from typing import TYPE_CHECKING
 
 from loguru import logger
 from datetime import datetime, UTC
-from jinja2 import Environment
 
-from api_vol import api_vol
-from api_garch import api_garch
-from api_assistant import api_assistant
-from io_utils import save_to_s3, read_from_s3
+from io_utils import invalidate_cdn, read_if_modified, read_metadata, save_to_s3
+from pipeline import SKIPPED, Pipeline
+from memprofile import TOP_SITES, MemoryProfiler, profile
+from tracing import emit, span, trace
+from warm_state import STATE
+
+if TYPE_CHECKING:
+  import pandas as pd
+  from jinja2 import Template
 
 logger.level("DEBUG")
 
 def send_notification(ntfy_topic: str, data: dict) -> None:
   """Send message via ntfy.sh."""
+  import requests  # noqa: PLC0415
+
   ntfy_url = f"https://ntfy.sh/{ntfy_topic}"
   summary = data["summary"]
   forecast = data["forecast"]
@@ -41,6 +53,19 @@ def send_notification(ntfy_topic: str, data: dict) -> None:
   except requests.exceptions.RequestException as e:
     logger.error(f"Failed to send notification: {e}")
 
+DEFAULT_UNDERLYINGS = "^SPX:^VIX"
+
+def parse_underlyings(value: str) -> list:
+  """(underlying, volatility index) pairs of "^SPX:^VIX,^NDX:^VXN"."""
+  pairs = []
+  for item in value.split(","):
+    ticker, _, vol_index = item.strip().partition(":")
+    if not ticker or not vol_index:
+      msg = f"Expected TICKER:VOL_INDEX in UNDERLYINGS, got {item!r}"
+      raise ValueError(msg)
+    pairs.append((ticker, vol_index))
+  return pairs
+
 def get_config() -> dict:
   """Get the configuration."""
   config = {
@@ -50,14 +75,54 @@ def get_config() -> dict:
     "quotes_api_key": os.environ.get("QUOTES_API_KEY"),
     "openai_api_key": os.environ.get("OPENAI_API_KEY"),
     "ntfy_topic": os.environ.get("NTFY_TOPIC"),
+    "distribution_id": os.environ.get("CLOUDFRONT_DISTRIBUTION_ID"),
+    "upload_encoding": os.environ.get("UPLOAD_ENCODING", "gzip"),
+    "cache_dir": os.environ.get("STORAGE_CACHE_DIR"),
+    "render_mode": os.environ.get("RENDER_MODE", "vector"),
+    "render_workers": int(os.environ["RENDER_WORKERS"])
+      if os.environ.get("RENDER_WORKERS") else None,
+    "quotes_ttl": int(os.environ["QUOTES_TTL"])
+      if os.environ.get("QUOTES_TTL") else None,
+    "report_ttl": int(os.environ.get("REPORT_TTL", "900")),
+    "report_stale_ttl": int(os.environ.get("REPORT_STALE_TTL", "3600")),
+    "memory_profile": os.environ.get("MEMORY_PROFILE", "") not in ("", "0"),
+    "underlyings": parse_underlyings(
+      os.environ.get("UNDERLYINGS", DEFAULT_UNDERLYINGS),
+    ),
+    "garch_mode": os.environ.get("GARCH_MODE", "update"),
+    "garch_criterion": os.environ.get("GARCH_CRITERION", "bic"),
+    "garch_workers": int(os.environ["GARCH_WORKERS"])
+      if os.environ.get("GARCH_WORKERS") else None,
   }
   logger.info(f"Config: {config}")
   return config
 
-def handler(_: dict, context: dict) -> str:
-  """Lambda handler."""
-  logger.info("Starting...")
-  cfg = get_config()
+REPORT_KEY = "index.html"
+TEMPLATE_KEY = "templates/report.html"
+DIGEST_METADATA = "inputs-digest"
+TEMPLATE_TTL = 24 * 3600  # seconds a compiled template is kept by a warm container
+
+def read_template(cfg: dict) -> str:
+  """Read the report template source, revalidated by ETag when warm."""
+  def load(version: str | None) -> tuple[str | None, str]:
+    template_source, etag = read_if_modified(cfg, TEMPLATE_KEY, version, decode=True)
+    logger.info(f"Template {'read' if template_source else 'unchanged'} ({etag})")
+    return template_source, etag
+
+  return STATE.revalidate(TEMPLATE_KEY, load)
+
+def compile_template(template_source: str) -> "Template":
+  """Compile the report template once per source."""
+  digest = hashlib.sha256(template_source.encode("utf-8")).hexdigest()
+  return STATE.get(
+    f"template:{digest}",
+    lambda: _compile_template(template_source),
+    ttl=TEMPLATE_TTL,
+  )
+
+def _compile_template(template_source: str) -> "Template":
+  """Compile the report template."""
+  from jinja2 import Environment  # noqa: PLC0415
 
   def quote(value: float) -> str:
     """Formatter for quotes."""
@@ -69,30 +134,36 @@ def handler(_: dict, context: dict) -> str:
   # Register the 'quote' filter
   env.filters["quote"] = quote
 
-  # Read the template from S3
-  template_source = read_from_s3(cfg, "templates/report.html", decode=True)
-
   # Create the template
-  template = env.from_string(template_source)
-  logger.info("Template read from S3")
+  return env.from_string(template_source)
 
-  # Get the volatility data
-  vol_data = api_vol(cfg)
-  logger.debug(f"API VOL: {vol_data.keys()}")
+def page_key(cfg: dict, ticker: str) -> str:
+  """Key of the report page of an underlying, the primary one is the index."""
+  if ticker == cfg["underlyings"][0][0]:
+    return REPORT_KEY
+  return f"{ticker.lstrip('^').lower()}.html"
 
-  # Get the GARCH data
-  garch_data = api_garch(cfg)
-  logger.debug(f"API GARCH: {garch_data.keys()}")
+def report_pages(cfg: dict) -> list:
+  """Underlyings with their volatility index and page key, in order."""
+  return [
+    {"ticker": ticker, "vol_index": vol_index, "key": page_key(cfg, ticker)}
+    for ticker, vol_index in cfg["underlyings"]
+  ]
 
-  # Get the assistant data
-  assistant_data = api_assistant(
-    cfg,
-    vol_data["estimators_data"],
-    vol_data["zscore_vix_data"],
-  )
-  logger.debug(f"API ASSISTANT: {assistant_data}")
+def render_report(
+  template: "Template",
+  vol_data: dict,
+  garch_data: dict,
+  assistant_data: dict,
+  page: dict,
+) -> str:
+  """Render the report page of an underlying.
 
-  send_notification(cfg["ntfy_topic"], assistant_data)
+  `page` is one of `report_pages` with all of them under "pages".
+  """
+  logger.debug(f"API VOL: {vol_data.keys()}")
+  logger.debug(f"API GARCH: {garch_data.keys()}")
+  logger.debug(f"API ASSISTANT: {assistant_data}")
 
   # Generate the context for the template
   context = {
@@ -100,20 +171,214 @@ def handler(_: dict, context: dict) -> str:
     "vol": vol_data,
     "garch": garch_data,
     "assistant": assistant_data,
+    "page": page,
   }
+  with span("template.render") as render:
+    page = template.render(context)
+    render.add_bytes(len(page.encode("utf-8")))
+  return page
+
+def report_digest(
+  template_source: str,
+  template: "Template",
+  vol_data: dict,
+  garch_data: dict,
+  page: dict,
+) -> str:
+  """Digest of the template and of the page it renders from the data.
 
-  # Render the template
-  rendered_template = template.render(context)
+  The timestamp and the assistant text change on every run, the page
+  is rendered without them so that unchanged quotes give the same digest.
+  """
+  page = template.render({
+    "timestamp": "",
+    "vol": vol_data,
+    "garch": garch_data,
+    "assistant": {},
+    "page": page,
+  })
+  digest = hashlib.sha256(template_source.encode("utf-8"))
+  digest.update(page.encode("utf-8"))
+  return digest.hexdigest()
+
+def report_changed(cfg: dict, key: str, digest: str) -> bool:
+  """Whether the published report was rendered from other inputs."""
+  changed = read_metadata(cfg, key).get(DIGEST_METADATA) != digest
+  if not changed:
+    logger.info(f"Inputs of {key} unchanged ({digest[:12]}), skipping publication")
+  return changed
+
+def publish_report(cfg: dict, key: str, report: str | None, digest: str) -> list:
+  """Save the rendered report with its digest and return the changed keys."""
+  if report is None:
+    return []
 
-  # Save the rendered template to S3
   save_to_s3(
     cfg,
-    "index.html",
-    rendered_template,
+    key,
+    report,
     content_type="text/html",
+    metadata={DIGEST_METADATA: digest},
+  )
+  return [key]
+
+def ask_assistant(
+  cfg: dict,
+  underlying: tuple,
+  estimators_data: "pd.DataFrame",
+  zscore_vix_data: list,
+  events: "pd.DataFrame | None",
+) -> dict:
+  """Summarize the volatility data, openai is only loaded when asked."""
+  from api_assistant import cached_assistant  # noqa: PLC0415
+
+  return cached_assistant(cfg, estimators_data, zscore_vix_data, events, underlying)
+
+def add_page_nodes(pipeline: Pipeline, cfg: dict, page: dict) -> None:
+  """Register the report page of an underlying, see `add_report_nodes`."""
+  from api_garch import add_garch_nodes  # noqa: PLC0415
+  from api_vol import add_vol_nodes  # noqa: PLC0415
+
+  ticker = page["ticker"]
+  key = page["key"]
+
+  # Volatility and GARCH nodes share the quotes, estimates and fits
+  vol = add_vol_nodes(pipeline, cfg, ticker)
+  garch = add_garch_nodes(pipeline, cfg, ticker)
+
+  pipeline.add(
+    f"digest:{ticker}",
+    lambda template_source, template, vol_data, garch_data: report_digest(
+      template_source,
+      template,
+      vol_data,
+      garch_data,
+      page,
+    ),
+    ["template:source", "template", vol, garch],
+  )
+  pipeline.add(
+    f"changed:{ticker}",
+    lambda digest: report_changed(cfg, key, digest),
+    [f"digest:{ticker}"],
+  )
+  pipeline.add(
+    f"assistant:{ticker}",
+    lambda estimators_data, zscore_vix_data, events: ask_assistant(
+      cfg,
+      (ticker, page["vol_index"]),
+      estimators_data,
+      zscore_vix_data,
+      events,
+    ),
+    [f"vol:estimators_data:{ticker}", f"vol:zscore_vix_data:{ticker}", "events"],
+    imports=["openai"],
   )
+  pipeline.add(
+    f"report:{ticker}",
+    lambda template, vol_data, garch_data, assistant_data, changed: render_report(
+      template,
+      vol_data,
+      garch_data,
+      assistant_data,
+      page,
+    ) if changed else None,
+    ["template", vol, garch, f"assistant:{ticker}", f"changed:{ticker}"],
+  )
+  pipeline.add(
+    f"publish:{ticker}",
+    lambda report, digest: publish_report(cfg, key, report, digest),
+    [f"report:{ticker}", f"digest:{ticker}"],
+  )
+
+def add_report_nodes(pipeline: Pipeline, cfg: dict) -> None:
+  """Register the report graph, one page per configured underlying.
+
+  quotes -> estimators and GARCH -> plots -> digest -> template ->
+  publication, each artifact is computed once and independent ones
+  concurrently. The quotes of all underlyings are fetched in one batch,
+  their estimators computed as a panel and their GARCH models fitted in
+  one process pool. The economic calendar is fetched from the start,
+  and the assistant runs as soon as the estimator tables are ready, in
+  parallel with the figures and the GARCH fit. The notification of the
+  primary underlying is sent alongside the publication. Pages whose
+  digest matches the published one are not uploaded, without changes
+  to the primary page no notification is sent.
+  """
+  from api_quotes import get_economic_events  # noqa: PLC0415
 
-  logger.info("Rendered template saved to S3")
+  pipeline.add("template:source", lambda: read_template(cfg))
+  pipeline.add("template", compile_template, ["template:source"])
+  pipeline.add("events", lambda: get_economic_events(cfg))
+
+  pages = report_pages(cfg)
+  for page in pages:
+    add_page_nodes(pipeline, cfg, page | {"pages": pages})
+  tickers = [page["ticker"] for page in pages]
+
+  primary = tickers[0]
+  pipeline.add(
+    "notification",
+    lambda assistant_data, changed: changed and send_notification(
+      cfg["ntfy_topic"],
+      assistant_data,
+    ),
+    [f"assistant:{primary}", f"changed:{primary}"],
+  )
+
+  # Invalidate what changed, referenced by the digests of all pages.
+  # Pages of underlyings without quotes are skipped, the others published.
+  def publish(*keys: list) -> list:
+    for ticker, page_keys in zip(tickers, keys, strict=True):
+      if page_keys is SKIPPED:
+        logger.error(f"Report page of {ticker} skipped, its quotes are missing")
+    return [key for page_keys in keys if page_keys is not SKIPPED for key in page_keys]
+
+  pipeline.add(
+    "publish",
+    publish,
+    [f"publish:{ticker}" for ticker in tickers],
+    allow_skipped=True,
+  )
+  pipeline.add(
+    "digest",
+    lambda *digests: hashlib.sha256(
+      "".join(d for d in digests if d is not SKIPPED).encode("utf-8"),
+    ).hexdigest(),
+    [f"digest:{ticker}" for ticker in tickers],
+    allow_skipped=True,
+  )
+  pipeline.add(
+    "invalidate",
+    lambda keys, digest: invalidate_cdn(cfg, keys, digest),
+    ["publish", "digest"],
+  )
+
+def handler(_: dict, context: dict) -> str:
+  """Lambda handler."""
+  logger.info("Starting...")
+  cfg = get_config()
+
+  # Stages share one heap, a memory profile runs them one at a time and
+  # without worker processes, whose allocations it would not see
+  profiler = None
+  if cfg["memory_profile"]:
+    profiler = MemoryProfiler()
+    cfg["render_workers"] = 1
+    cfg["garch_workers"] = 1
+
+  with trace("report") as report_trace, profile(profiler):
+    pipeline = Pipeline(max_workers=1 if profiler else None)
+    add_report_nodes(pipeline, cfg)
+    results = pipeline.run("publish", "invalidate", "notification")
+  emit(report_trace, cfg["mode"])
+  if profiler:
+    logger.info(profiler.summary(int(os.environ.get("MEMORY_TOP_SITES", TOP_SITES))))
+
+  logger.info(
+    f"Changed keys: {results['publish']}, invalidated: {results['invalidate']}",
+  )
+  logger.info(f"Warm state: {STATE.stats()}")
   return "Done"
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""Opt-in memory profile of the report stages.
+
+With a `MemoryProfiler` active, every `tracing.span` also records the
+peak and retained Python heap of its block (tracemalloc) and the peak
+resident set size of the process, sampled in the background. Stages
+share one heap, so the handler runs them one at a time while profiling.
+
+Usage: python -m memprofile [handler|itm] [--top N]
+"""
+
+import argparse
+import contextvars
+import math
+import os
+import resource
+import threading
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+FRAMES = 1  # traceback depth of allocation sites
+SAMPLE_INTERVAL = 0.01  # seconds between RSS samples
+SNAPSHOT_GROWTH = 1.2  # heap growth that triggers a new peak snapshot
+TOP_SITES = 10
+HEADROOM = 1.25  # suggested memory over the peak RSS
+
+_profiler = contextvars.ContextVar("memory_profiler", default=None)
+
+
+def rss_bytes() -> int:
+  """Resident set size of the process."""
+  try:
+    with open("/proc/self/statm", encoding="ascii") as f:
+      return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except OSError:
+    # Peak rather than current size where /proc is not available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def suggested_memory_mb(peak_rss: int) -> int:
+  """Lambda memory size covering the peak with headroom, in 64 MB steps."""
+  return max(128, 64 * math.ceil(peak_rss * HEADROOM / 2**20 / 64))
+
+
+@dataclass
+class Frame:
+  """Memory of an open stage."""
+
+  heap_start: int
+  heap_peak: int
+  rss_peak: int
+
+
+class MemoryProfiler:
+  """tracemalloc and RSS measurements of nested stages.
+
+  tracemalloc has a single peak, so opening a stage folds the peak so
+  far into the enclosing stages before it is reset.
+  """
+
+  def __init__(self, frames: int = FRAMES, interval: float = SAMPLE_INTERVAL) -> None:
+    """Create a stopped profiler."""
+    self.frames = frames
+    self.interval = interval
+    self.rss_peak = 0
+    self._open: list[Frame] = []
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._sampler = None
+    self._peak_snapshot = None
+    self._snapshot_at = 0
+    self._final_snapshot = None
+
+  def start(self) -> None:
+    """Start tracing allocations and sampling RSS."""
+    tracemalloc.start(self.frames)
+    self._stop.clear()
+    self._sampler = threading.Thread(target=self._sample, daemon=True)
+    self._sampler.start()
+
+  def stop(self) -> None:
+    """Stop sampling and tracing, keeping the allocation sites."""
+    self._stop.set()
+    self._sampler.join()
+    self._final_snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+  def _sample(self) -> None:
+    """Track peak RSS and snapshot the heap whenever it grows."""
+    while not self._stop.wait(self.interval):
+      rss = rss_bytes()
+      heap, _ = tracemalloc.get_traced_memory()
+      with self._lock:
+        self.rss_peak = max(self.rss_peak, rss)
+        for frame in self._open:
+          frame.rss_peak = max(frame.rss_peak, rss)
+      if heap > self._snapshot_at * SNAPSHOT_GROWTH:
+        self._snapshot_at = heap
+        self._peak_snapshot = tracemalloc.take_snapshot()
+
+  def enter(self) -> Frame:
+    """Open a stage."""
+    heap, peak = tracemalloc.get_traced_memory()
+    frame = Frame(heap, heap, rss_bytes())
+    with self._lock:
+      for outer in self._open:
+        outer.heap_peak = max(outer.heap_peak, peak)
+      self._open.append(frame)
+      tracemalloc.reset_peak()
+    return frame
+
+  def exit(self, frame: Frame) -> dict:
+    """Close a stage and return its memory in MB."""
+    heap, peak = tracemalloc.get_traced_memory()
+    rss = rss_bytes()
+    with self._lock:
+      self._open.remove(frame)
+      frame.heap_peak = max(frame.heap_peak, peak)
+      for outer in self._open:
+        outer.heap_peak = max(outer.heap_peak, frame.heap_peak)
+      self.rss_peak = max(self.rss_peak, rss)
+    return {
+      "heap_peak_mb": round((frame.heap_peak - frame.heap_start) / 2**20, 2),
+      "heap_retained_mb": round((heap - frame.heap_start) / 2**20, 2),
+      "rss_peak_mb": round(max(frame.rss_peak, rss) / 2**20, 1),
+    }
+
+  def top_sites(self, top: int = TOP_SITES) -> dict:
+    """Largest allocation sites at the highest sampled heap and at the end."""
+    def sites(snapshot: tracemalloc.Snapshot | None) -> list:
+      if snapshot is None:
+        return []
+      snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(inclusive=False, filename_pattern=tracemalloc.__file__),
+      ])
+      return [
+        (str(stat.traceback[0]), stat.size, stat.count)
+        for stat in snapshot.statistics("lineno")[:top]
+      ]
+
+    return {"peak": sites(self._peak_snapshot), "retained": sites(self._final_snapshot)}
+
+  def summary(self, top: int = TOP_SITES) -> str:
+    """Peak RSS, the suggested Lambda memory and the top allocation sites."""
+    lines = [
+      f"Peak RSS {self.rss_peak / 2**20:,.0f} MB, "
+      f"suggested Lambda memory {suggested_memory_mb(self.rss_peak)} MB",
+    ]
+    for kind, sites in self.top_sites(top).items():
+      lines.append(f"Top allocation sites ({kind}):")
+      lines.extend(
+        f"  {size / 2**20:>8.2f} MB {count:>8} blocks  {site}"
+        for site, size, count in sites
+      )
+    return "\n".join(lines)
+
+
+def active_profiler() -> MemoryProfiler | None:
+  """Profiler of the current context, if any."""
+  return _profiler.get()
+
+
+@contextmanager
+def profile(profiler: MemoryProfiler | None) -> Iterator[MemoryProfiler | None]:
+  """Activate a profiler for the block, None profiles nothing."""
+  if profiler is None:
+    yield None
+    return
+
+  profiler.start()
+  token = _profiler.set(profiler)
+  try:
+    yield profiler
+  finally:
+    _profiler.reset(token)
+    profiler.stop()
+
+
+def main() -> None:
+  """Profile the report handler or the ITM dataset load in dev mode."""
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument(
+    "target", nargs="?", choices=["handler", "itm"], default="handler",
+  )
+  parser.add_argument("--top", type=int, default=TOP_SITES)
+  args = parser.parse_args()
+
+  os.environ.setdefault("MODE", "dev")
+  os.environ["MEMORY_PROFILE"] = "1"
+  os.environ["MEMORY_TOP_SITES"] = str(args.top)
+
+  from lambda_function import get_config, handler  # noqa: PLC0415
+
+  if args.target == "handler":
+    handler(None, None)
+    return
+
+  from api_itm import load_itm_frame  # noqa: PLC0415
+  from tracing import emit, trace  # noqa: PLC0415
+
+  profiler = MemoryProfiler()
+  cfg = get_config()
+  with trace("itm") as itm_trace, profile(profiler):
+    load_itm_frame(cfg)
+  emit(itm_trace, "dev")
+  print(profiler.summary(args.top))  # noqa: T201
+
+
+if __name__ == "__main__":
+  main()
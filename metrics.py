@@ -0,0 +1,256 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and fixed-bucket histograms are kept per label values, an
+update is a dict lookup and an add under an uncontended lock. Values
+owned by other objects, such as cache statistics, are read by callbacks
+at scrape time. Every `tracing.span` is observed in `SPAN_SECONDS`, so
+timed stages need no metrics code of their own.
+"""
+
+import abc
+import bisect
+import threading
+from collections.abc import Callable, Iterator
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "volreport_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: object) -> str:
+  return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+  pairs = [
+    f'{name}="{_escape(value)}"'
+    for name, value in zip(names, values, strict=True)
+  ]
+  if extra:
+    pairs.append(extra)
+  return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+  """Metric with one child per combination of label values."""
+
+  kind = ""
+
+  def __init__(self, name: str, description: str, labels: tuple = ()) -> None:
+    """Create a metric without children."""
+    self.name = name
+    self.description = description
+    self.labelnames = tuple(labels)
+    self._children = {}
+    self._lock = threading.Lock()
+
+  @abc.abstractmethod
+  def _child(self) -> object:
+    """New child holding the values of one combination of labels."""
+
+  def labels(self, *values: object) -> object:
+    """Child for the label values, in the order of the label names."""
+    child = self._children.get(values)
+    if child is None:
+      if len(values) != len(self.labelnames):
+        msg = f"{self.name} expects labels {self.labelnames}, got {values}"
+        raise ValueError(msg)
+      with self._lock:
+        child = self._children.setdefault(values, self._child())
+    return child
+
+  @abc.abstractmethod
+  def samples(self) -> Iterator[str]:
+    """Sample lines of all children."""
+
+  def expose(self) -> str:
+    """HELP, TYPE and sample lines."""
+    head = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+    return "\n".join(head + list(self.samples()))
+
+
+class _CounterChild:
+  __slots__ = ("_lock", "value")
+
+  def __init__(self) -> None:
+    self.value = 0
+    self._lock = threading.Lock()
+
+  def inc(self, amount: float = 1) -> None:
+    with self._lock:
+      self.value += amount
+
+
+class Counter(_Metric):
+  """Monotonic count."""
+
+  kind = "counter"
+
+  def _child(self) -> _CounterChild:
+    return _CounterChild()
+
+  def inc(self, amount: float = 1) -> None:
+    """Increment the counter without labels."""
+    self.labels().inc(amount)
+
+  def samples(self) -> Iterator[str]:
+    """One sample line per child."""
+    for values, child in list(self._children.items()):
+      yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+
+
+class _HistogramChild:
+  __slots__ = ("_lock", "bounds", "counts", "sum")
+
+  def __init__(self, bounds: tuple) -> None:
+    self.bounds = bounds
+    self.counts = [0] * (len(bounds) + 1)
+    self.sum = 0.0
+    self._lock = threading.Lock()
+
+  def observe(self, value: float) -> None:
+    i = bisect.bisect_left(self.bounds, value)
+    with self._lock:
+      self.counts[i] += 1
+      self.sum += value
+
+
+class Histogram(_Metric):
+  """Distribution over fixed upper bounds, in seconds for latencies."""
+
+  kind = "histogram"
+
+  def __init__(
+    self,
+    name: str,
+    description: str,
+    labels: tuple = (),
+    buckets: tuple = LATENCY_BUCKETS,
+  ) -> None:
+    """Create a histogram with sorted bucket bounds."""
+    super().__init__(name, description, labels)
+    self.buckets = tuple(sorted(buckets))
+
+  def _child(self) -> _HistogramChild:
+    return _HistogramChild(self.buckets)
+
+  def observe(self, value: float) -> None:
+    """Observe a value without labels."""
+    self.labels().observe(value)
+
+  def samples(self) -> Iterator[str]:
+    """Cumulative bucket, sum and count lines per child."""
+    for values, child in list(self._children.items()):
+      with child._lock:  # noqa: SLF001
+        counts, total = list(child.counts), child.sum
+      cumulative = 0
+      for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+        cumulative += count
+        le = f'le="{bound}"'
+        yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+      yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}"
+      yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+class Callback(_Metric):
+  """Counter or gauge read from a function at scrape time.
+
+  The function returns a number, or a dict from tuples of label values
+  to numbers.
+  """
+
+  def __init__(
+    self,
+    name: str,
+    description: str,
+    kind: str,
+    read: Callable[[], float | dict],
+    labels: tuple = (),
+  ) -> None:
+    """Wrap `read` as a metric of type `kind`."""
+    super().__init__(name, description, labels)
+    self.kind = kind
+    self._read = read
+
+  def _child(self) -> object:
+    msg = f"{self.name} is read from its callback and has no children"
+    raise TypeError(msg)
+
+  def labels(self, *_: object) -> object:
+    """Not supported, the callback returns the values of all labels."""
+    msg = f"{self.name} is read from its callback, labels cannot be updated"
+    raise TypeError(msg)
+
+  def samples(self) -> Iterator[str]:
+    """One sample line per value returned by the callback."""
+    values = self._read()
+    if not isinstance(values, dict):
+      values = {(): values}
+    for label_values, value in values.items():
+      yield f"{self.name}{_labels(self.labelnames, label_values)} {_number(value)}"
+
+
+class Registry:
+  """Named metrics of the process."""
+
+  def __init__(self) -> None:
+    """Create an empty registry."""
+    self._metrics: dict[str, _Metric] = {}
+    self._lock = threading.Lock()
+
+  def register(self, metric: _Metric) -> _Metric:
+    """Add a metric, or return the one registered under its name."""
+    with self._lock:
+      return self._metrics.setdefault(metric.name, metric)
+
+  def counter(self, name: str, description: str, labels: tuple = ()) -> Counter:
+    """Registered counter, the prefix is added to the name."""
+    return self.register(Counter(PREFIX + name, description, labels))
+
+  def histogram(
+    self,
+    name: str,
+    description: str,
+    labels: tuple = (),
+    buckets: tuple = LATENCY_BUCKETS,
+  ) -> Histogram:
+    """Registered histogram, the prefix is added to the name."""
+    return self.register(Histogram(PREFIX + name, description, labels, buckets))
+
+  def callback(
+    self,
+    name: str,
+    description: str,
+    kind: str,
+    read: Callable[[], float | dict],
+    labels: tuple = (),
+  ) -> Callback:
+    """Registered callback metric, the prefix is added to the name."""
+    return self.register(Callback(PREFIX + name, description, kind, read, labels))
+
+  def expose(self) -> str:
+    """All metrics in the text exposition format."""
+    with self._lock:
+      metrics = list(self._metrics.values())
+    return "\n".join(metric.expose() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+  "span_seconds", "Wall time of traced stages.", ("span",),
+)
+SPAN_BYTES = REGISTRY.counter(
+  "span_bytes_total", "Bytes transferred by traced stages.", ("span",),
+)
+
+
+def observe_span(name: str, seconds: float, nbytes: int) -> None:
+  """Record a finished span."""
+  SPAN_SECONDS.labels(name).observe(seconds)
+  if nbytes:
+    SPAN_BYTES.labels(name).inc(nbytes)
@@ -0,0 +1,145 @@
+"""Compute-once graph of named report artifacts."""
+
+import contextvars
+import importlib
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+
+from loguru import logger
+
+from tracing import span
+
+# pyplot keeps global state and is not thread-safe
+PYPLOT_LOCK = threading.Lock()
+
+
+class _Skipped:
+  """Result of a node without its inputs, see `Pipeline`."""
+
+  def __repr__(self) -> str:
+    return "SKIPPED"
+
+
+SKIPPED = _Skipped()
+
+
+class Pipeline:
+  """Graph of named artifacts, each computed at most once.
+
+  A node is a function called with the results of its dependencies, in
+  the order they are listed. `run` starts every node as soon as its
+  dependencies are done, so independent nodes run concurrently in a
+  thread pool. Exclusive nodes hold `PYPLOT_LOCK` while they run. Each
+  node is a `tracing.span` of its name, run in a copy of the context
+  of `run`.
+
+  A node returns `SKIPPED` when its inputs are unavailable, the nodes
+  depending on it are then skipped as well. Nodes registered with
+  `allow_skipped` receive `SKIPPED` instead, to combine what is left.
+
+  Heavy modules a node needs can be listed as its `imports`. They are
+  loaded by "import:<module>" nodes that start with the run, so that
+  imports overlap with network waits of unrelated nodes instead of
+  delaying the start of the process.
+  """
+
+  def __init__(self, max_workers: int | None = None) -> None:
+    """Create an empty pipeline."""
+    self._nodes = {}
+    self._results = {}
+    self._max_workers = max_workers
+
+  def __contains__(self, name: str) -> bool:
+    """Whether a node is registered."""
+    return name in self._nodes
+
+  def add(  # noqa: PLR0913
+    self,
+    name: str,
+    fn: Callable,
+    deps: Iterable[str] = (),
+    *,
+    exclusive: bool = False,
+    imports: Iterable[str] = (),
+    allow_skipped: bool = False,
+  ) -> None:
+    """Register a node."""
+    if name in self._nodes:
+      msg = f"Node {name} is already registered"
+      raise ValueError(msg)
+
+    after = []
+    for module in imports:
+      node = f"import:{module}"
+      if node not in self._nodes:
+        load = partial(importlib.import_module, module)
+        self._nodes[node] = (load, (), (), False, False)
+      after.append(node)
+    self._nodes[name] = (fn, tuple(deps), tuple(after), exclusive, allow_skipped)
+
+  def _waits_for(self, name: str) -> tuple:
+    """Dependencies and imports of a node."""
+    _, deps, after, _, _ = self._nodes[name]
+    return deps + after
+
+  def _required(self, targets: Iterable[str]) -> list:
+    """Targets and their transitive dependencies not computed yet."""
+    required = []
+    stack = list(targets)
+    while stack:
+      name = stack.pop()
+      if name in self._results or name in required:
+        continue
+      if name not in self._nodes:
+        msg = f"Unknown node {name}"
+        raise KeyError(msg)
+      required.append(name)
+      stack.extend(self._waits_for(name))
+    return required
+
+  def _call(self, name: str) -> object:
+    """Compute one node from the results of its dependencies."""
+    fn, deps, _, exclusive, allow_skipped = self._nodes[name]
+    args = [self._results[dep] for dep in deps]
+    if not allow_skipped and any(arg is SKIPPED for arg in args):
+      logger.debug(f"Pipeline node {name} skipped")
+      return SKIPPED
+    logger.debug(f"Pipeline node {name} started")
+    with span(name):
+      if exclusive:
+        with PYPLOT_LOCK:
+          return fn(*args)
+      return fn(*args)
+
+  def run(self, *targets: str) -> dict:
+    """Compute the targets and return their results by name."""
+    pending = set(self._required(targets))
+    running: dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+      while pending or running:
+        ready = [
+          name for name in pending
+          if all(dep in self._results for dep in self._waits_for(name))
+        ]
+        for name in ready:
+          pending.discard(name)
+          context = contextvars.copy_context()
+          running[executor.submit(context.run, self._call, name)] = name
+
+        if not running:
+          msg = f"Dependency cycle between {sorted(pending)}"
+          raise ValueError(msg)
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+          name = running.pop(future)
+          self._results[name] = future.result()
+
+    return {name: self._results[name] for name in targets}
+
+  def __getitem__(self, name: str) -> object:
+    """Result of a node, computed if needed."""
+    return self.run(name)[name]
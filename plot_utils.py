@@ -0,0 +1,224 @@
+"""Encoding of report figures.
+
+matplotlib is imported on first use, so the client render mode, which
+only emits chart data, never loads it.
+"""
+
+import base64
+import logging
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from io_utils import save_asset
+from pipeline import PYPLOT_LOCK
+from pool_utils import discard_pool, shared_pool
+from tracing import span
+
+if TYPE_CHECKING:
+  from matplotlib.figure import Figure
+
+logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+CLIENT_MODE = "client"  # charts drawn in the browser from JSON series
+CLIENT_POINTS = 300  # series longer than this are down-sampled
+CLIENT_DECIMALS = 4
+
+FIGURE_BUDGET = 150_000  # bytes of SVG per figure in compact mode
+RASTER_DPIS = (200, 150, 100)  # resolutions of rasterized layers, tried in order
+SIMPLIFY_THRESHOLD = 0.5  # pixels, matplotlib defaults to 1/9
+
+# Rasterizing below this zorder keeps text, ticks and legends as vectors
+RASTER_ZORDER = 2.6
+
+RENDER_WORKERS = 4  # one process per report figure
+
+
+def dense(render_mode: str) -> dict:
+  """Keyword arguments for layers with many paths (strips, scatters, fills)."""
+  return {"rasterized": True} if render_mode == "compact" else {}
+
+
+def _save(fig: "Figure", dpi: int | None = None) -> bytes:
+  """Save the figure as SVG without a creation date."""
+  buf = BytesIO()
+  fig.savefig(buf, format="svg", transparent=True, dpi=dpi, metadata={"Date": None})
+  return buf.getvalue()
+
+
+def figure_svg(
+  fig: "Figure",
+  name: str,
+  render_mode: str = "vector",
+  budget: int = FIGURE_BUDGET,
+) -> bytes:
+  """Save the figure as SVG, log its size and close it.
+
+  "vector" keeps every layer as paths. "compact" simplifies paths and
+  renders layers marked with `dense` as images. If the SVG is still
+  over `budget` bytes, all data layers are rasterized at decreasing
+  resolutions until it fits. Element ids are salted with the name, so
+  the same figure always gives the same bytes.
+  """
+  import matplotlib.pyplot as plt  # noqa: PLC0415
+
+  rc = {"svg.hashsalt": name}
+  if render_mode != "compact":
+    with plt.rc_context(rc):
+      svg = _save(fig)
+  else:
+    with plt.rc_context(rc | {"path.simplify_threshold": SIMPLIFY_THRESHOLD}):
+      svg = _save(fig, dpi=RASTER_DPIS[0])
+      if len(svg) > budget:
+        for ax in fig.axes:
+          ax.set_rasterization_zorder(RASTER_ZORDER)
+        for dpi in RASTER_DPIS:
+          svg = _save(fig, dpi=dpi)
+          if len(svg) <= budget:
+            break
+        else:
+          logger.warning(f"Figure {name} is over budget: {len(svg):,} > {budget:,}")
+
+  logger.info(f"Figure {name}: {len(svg) / 1024:,.1f} kB ({render_mode})")
+  plt.close(fig)
+  return svg
+
+
+def encode_figure(
+  fig: "Figure",
+  name: str,
+  render_mode: str = "vector",
+  budget: int = FIGURE_BUDGET,
+) -> str:
+  """`figure_svg` as a base64 string, for inline images and JSON."""
+  return base64.b64encode(figure_svg(fig, name, render_mode, budget)).decode("utf-8")
+
+
+def save_plot(config: dict, svg: bytes | None) -> str | None:
+  """Save a figure as a content-addressed asset and return its key."""
+  return None if svg is None else save_asset(config, svg, "svg", "image/svg+xml")
+
+
+def _use_agg() -> None:
+  """Select the non-interactive backend in a render worker."""
+  import matplotlib  # noqa: PLC0415
+
+  matplotlib.use("Agg")
+
+
+def render_pool(max_workers: int | None = None) -> ProcessPoolExecutor | None:
+  """Shared process pool for figures, see `shared_pool`.
+
+  Call it when the first figure is drawn, so runs without figures start
+  no workers. Returns None with a single worker or where processes are
+  unavailable, figures then render in-process.
+  """
+  max_workers = max_workers or min(RENDER_WORKERS, os.cpu_count() or 1)
+  if max_workers == 1:
+    return None
+  return shared_pool(max_workers, initializer=_use_agg)
+
+
+def render(pool: ProcessPoolExecutor | None, fn: Callable, *args: object) -> object:
+  """Call a figure function in the render pool and return its result.
+
+  Without a pool the figure is drawn in-process under `PYPLOT_LOCK`.
+  The function and its arguments are pickled, so pass module-level
+  functions and only the data the figure needs. The span counts the
+  bytes of the SVG, CPU time of pool workers is not included.
+  """
+  with span(f"plot:{fn.__name__}") as draw:
+    result = _render(pool, fn, *args)
+    svg = result.get("plot") if isinstance(result, dict) else result
+    draw.add_bytes(len(svg) if isinstance(svg, bytes) else 0)
+  return result
+
+
+def _render(pool: ProcessPoolExecutor | None, fn: Callable, *args: object) -> object:
+  if pool is not None:
+    try:
+      return pool.submit(fn, *args).result()
+    except BrokenProcessPool as e:
+      logger.warning(f"Render pool failed, drawing in-process: {e}")
+      discard_pool(pool)
+
+  with PYPLOT_LOCK:
+    return fn(*args)
+
+
+def _chart_values(values: pd.Series, decimals: int) -> list:
+  """float32 values rounded for JSON, NaN as None."""
+  values = np.asarray(values, dtype=np.float32).astype(float).round(decimals)
+  return [None if np.isnan(value) else value for value in values.tolist()]
+
+
+def lines_chart(
+  frame: pd.DataFrame,
+  value_format: str = "pct",
+  max_points: int = CLIENT_POINTS,
+  decimals: int = CLIENT_DECIMALS,
+  **options: object,
+) -> dict:
+  """Columnar line panel of a date-indexed frame.
+
+  Dates become day offsets from the first one and every column a list
+  of values. Longer series keep every n-th row up to the last one, so
+  at most `max_points` remain. `options` are passed to the browser,
+  e.g. `band` (two series to shade between) or `dashed`.
+  """
+  step = max(1, -(-len(frame) // max_points))
+  frame = frame.iloc[len(frame) - 1::-step].iloc[::-1]
+  start = frame.index[0]
+  return {
+    "kind": "lines",
+    "start": start.strftime("%Y-%m-%d"),
+    "x": (frame.index - start).days.tolist(),
+    "series": {
+      str(column): _chart_values(frame[column], decimals) for column in frame.columns
+    },
+    "format": value_format,
+    **options,
+  }
+
+
+def box_stats(values: pd.Series) -> list:
+  """Tukey box of a sample: [low whisker, Q1, median, Q3, high whisker]."""
+  values = values.dropna()
+  q1, median, q3 = values.quantile([0.25, 0.5, 0.75])
+  iqr = q3 - q1
+  low = values[values >= q1 - 1.5 * iqr].min()
+  high = values[values <= q3 + 1.5 * iqr].max()
+  return [low, q1, median, q3, high]
+
+
+def boxes_chart(
+  boxes: dict,
+  groups: list,
+  line: dict | None = None,
+  value_format: str = "pct",
+  decimals: int = CLIENT_DECIMALS,
+) -> dict:
+  """Box panel, `boxes` maps a series name to one `box_stats` per group.
+
+  `line` optionally marks one value per group, e.g. the latest estimate.
+  """
+  return {
+    "kind": "boxes",
+    "groups": [str(group) for group in groups],
+    "series": {
+      str(name): [_chart_values(box, decimals) for box in group_boxes]
+      for name, group_boxes in boxes.items()
+    },
+    "line": line and {
+      "name": line["name"],
+      "values": _chart_values(line["values"], decimals),
+    },
+    "format": value_format,
+  }
@@ -0,0 +1,101 @@
+"""Process pool helpers."""
+
+import atexit
+import multiprocessing
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from loguru import logger
+
+# Pools are created from pipeline and cache threads, where forking would
+# copy locks held by other threads, so workers are forked from a server
+# process. The server imports the modules whose functions run in pools
+# once, otherwise every worker would import them again.
+WORKER_MODULES = ["__main__", "api_vol", "api_garch", "arch", "scipy.stats"]
+
+if "forkserver" in multiprocessing.get_all_start_methods():
+  MP_CONTEXT = multiprocessing.get_context("forkserver")
+  MP_CONTEXT.set_forkserver_preload(WORKER_MODULES)
+else:
+  MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# Pools shared by the invocations of a warm container, by their arguments
+_POOLS: dict = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def create_pool(
+  max_workers: int | None = None,
+  initializer: Callable | None = None,
+) -> ProcessPoolExecutor | None:
+  """Create a process pool, or return None where processes are unavailable.
+
+  Workers start from `MP_CONTEXT`, so a pool can be created from any
+  thread. AWS Lambda has no /dev/shm, so creating the pool fails there
+  with OSError.
+  """
+  try:
+    return ProcessPoolExecutor(
+      max_workers=max_workers,
+      mp_context=MP_CONTEXT,
+      initializer=initializer,
+    )
+  except (OSError, NotImplementedError) as e:
+    logger.warning(f"Process pool unavailable, running serially: {e}")
+    return None
+
+
+def shared_pool(
+  max_workers: int | None = None,
+  initializer: Callable | None = None,
+) -> ProcessPoolExecutor | None:
+  """Process pool reused by all callers passing the same arguments.
+
+  The pool is created on first use and shut down at exit, see
+  `create_pool`. Where no pool can be created, None is cached as well.
+  """
+  key = (max_workers, initializer)
+  with _POOLS_LOCK:
+    if key not in _POOLS:
+      pool = create_pool(max_workers, initializer)
+      if pool is not None:
+        atexit.register(pool.shutdown, cancel_futures=True)
+      _POOLS[key] = pool
+    return _POOLS[key]
+
+
+def discard_pool(pool: ProcessPoolExecutor) -> None:
+  """Shut a broken shared pool down, the next caller gets a new one."""
+  with _POOLS_LOCK:
+    for key in [key for key, value in _POOLS.items() if value is pool]:
+      del _POOLS[key]
+  atexit.unregister(pool.shutdown)
+  pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_starmap(
+  fn: Callable,
+  args: Iterable[tuple],
+  max_workers: int | None = None,
+) -> list:
+  """Call `fn(*item)` for every item in worker processes, keeping order.
+
+  The workers of a `shared_pool` are reused by later calls. Where no
+  pool can be created, the calls run serially in the current process,
+  as they do with `max_workers=1` or a single item.
+  """
+  args = list(args)
+  if max_workers == 1 or len(args) < 2:
+    return [fn(*item) for item in args]
+
+  executor = shared_pool(max_workers)
+  if executor is None:
+    return [fn(*item) for item in args]
+
+  try:
+    return list(executor.map(fn, *zip(*args, strict=True)))
+  except BrokenProcessPool:
+    discard_pool(executor)
+    raise
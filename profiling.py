@@ -0,0 +1,80 @@
+"""Import-time profile of a module in a fresh interpreter.
+
+Usage: python -m profiling [module] [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Cold-start budget of `import lambda_function`, overridden by STARTUP_BUDGET_MS
+STARTUP_BUDGET_MS = 300
+
+# Must not be loaded before the handler runs
+HEAVY_MODULES = (
+  "arch",
+  "boto3",
+  "matplotlib",
+  "openai",
+  "pandas",
+  "scipy",
+  "seaborn",
+)
+
+
+def startup_budget_ms() -> float:
+  """Configured cold-start budget in milliseconds."""
+  return float(os.environ.get("STARTUP_BUDGET_MS", STARTUP_BUDGET_MS))
+
+
+def import_profile(module: str) -> tuple[list, list]:
+  """Import the module with `-X importtime` in a new interpreter.
+
+  Returns (module, self ms, cumulative ms, depth) for every module it
+  loaded, in import order, and the list of loaded top-level packages.
+  """
+  probe = "import sys; print(','.join(sorted({m.split('.')[0] for m in sys.modules})))"
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", f"import {module}; {probe}"],
+    capture_output=True,
+    text=True,
+    check=True,
+    cwd=Path(__file__).parent,
+  )
+
+  rows = []
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:") or "imported package" in line:
+      continue
+    self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+    depth = (len(name) - len(name.lstrip())) // 2
+    rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, depth))
+
+  return rows, result.stdout.strip().split(",")
+
+
+def report(module: str, top: int = 20) -> str:
+  """Per-module milliseconds of importing `module`, slowest first."""
+  rows, loaded = import_profile(module)
+  total = next(cumulative for name, _, cumulative, _ in rows if name == module)
+
+  lines = [
+    f"import {module}: {total:,.1f} ms (budget {startup_budget_ms():,.0f} ms)",
+    f"{'module':<40} {'self ms':>9} {'cumul. ms':>10}",
+  ]
+  for name, self_ms, cumulative_ms, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+    lines.append(f"{'  ' * depth + name:<40} {self_ms:>9.1f} {cumulative_ms:>10.1f}")
+
+  heavy = sorted(set(HEAVY_MODULES) & set(loaded))
+  lines.append(f"heavy modules loaded: {', '.join(heavy) or 'none'}")
+  return "\n".join(lines)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("module", nargs="?", default="lambda_function")
+  parser.add_argument("--top", type=int, default=20)
+  args = parser.parse_args()
+  print(report(args.module, args.top))  # noqa: T201
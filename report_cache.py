@@ -0,0 +1,107 @@
+"""Report pages cached with stale-while-revalidate.
+
+One build renders all pages, they are rebuilt at most once at a time.
+Within `ttl` seconds the cached pages are served as is, for `stale_ttl`
+seconds after that they are still served while one background rebuild
+runs. Older pages, or the first request, wait for the rebuild.
+"""
+
+import hashlib
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from loguru import logger
+
+from metrics import REGISTRY
+
+REQUESTS = REGISTRY.counter(
+  "report_cache_requests_total", "Report page requests by cache state.", ("state",),
+)
+
+
+@dataclass(frozen=True)
+class Page:
+  """Rendered page with its entity tag."""
+
+  body: bytes
+  etag: str
+  built: float
+
+
+class CachedReport:
+  """Single-flight, stale-while-revalidate cache of the report pages."""
+
+  def __init__(
+    self,
+    build: Callable[[], dict[str, str | bytes]],
+    ttl: float,
+    stale_ttl: float,
+    clock: Callable[[], float] = time.monotonic,
+  ) -> None:
+    """Cache the pages `build` returns by name.
+
+    Nothing is built before the first get.
+    """
+    self._build = build
+    self.ttl = ttl
+    self.stale_ttl = stale_ttl
+    self._clock = clock
+    self._pages: dict[str, Page] | None = None
+    self._built = 0.0
+    self._rebuild: Future | None = None
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+
+  def _run(self) -> dict[str, Page]:
+    """Build the pages and replace the cached ones."""
+    started = self._clock()
+    bodies = self._build()
+    built = self._clock()
+    pages = {}
+    for name, body in bodies.items():
+      data = body.encode("utf-8") if isinstance(body, str) else body
+      pages[name] = Page(data, hashlib.sha256(data).hexdigest()[:32], built)
+    with self._lock:
+      self._pages = pages
+      self._built = built
+    logger.info(f"Report rebuilt in {built - started:,.1f} s ({len(pages)} pages)")
+    return pages
+
+  def _start_rebuild(self) -> Future:
+    """The running rebuild, or a new one. Call with the lock held."""
+    if self._rebuild is None or self._rebuild.done():
+      self._rebuild = self._executor.submit(self._run)
+      self._rebuild.add_done_callback(self._log_failure)
+    return self._rebuild
+
+  @staticmethod
+  def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+      logger.error(f"Report rebuild failed: {future.exception()}")
+
+  def age(self, page: Page) -> float:
+    """Seconds since the page was built."""
+    return self._clock() - page.built
+
+  def get(self, name: str) -> Page:
+    """Current version of page `name`, rebuilt as described in the module docstring.
+
+    A failed rebuild keeps the stale pages, without them it raises.
+    Raises KeyError when the build has no page `name`.
+    """
+    with self._lock:
+      pages = self._pages
+      age = self._clock() - self._built
+      if pages is not None and age < self.ttl:
+        REQUESTS.labels("fresh").inc()
+        return pages[name]
+      rebuild = self._start_rebuild()
+      if pages is not None and age < self.ttl + self.stale_ttl:
+        REQUESTS.labels("stale").inc()
+        return pages[name]
+
+    REQUESTS.labels("miss").inc()
+    return rebuild.result()[name]
@@ -0,0 +1,208 @@
+// Charts of the client render mode, drawn as SVG from the JSON panels
+// emitted by plot_utils.lines_chart and plot_utils.boxes_chart.
+(function () {
+  "use strict";
+
+  var NS = "http://www.w3.org/2000/svg";
+  var DAY = 86400000;
+  var WIDTH = 900;
+  var PAD = { top: 24, right: 12, bottom: 24, left: 52 };
+  var PALETTE = ["#3b4cc0", "#7b9ff9", "#c0d4f5", "#f2cbb7", "#ee8468", "#b40426"];
+  var BAND = "rgba(180, 4, 38, 0.15)";
+  var MARKER = "rgba(255, 0, 0, 0.1)";
+
+  function el(name, attrs, parent) {
+    var node = document.createElementNS(NS, name);
+    Object.keys(attrs).forEach(function (key) { node.setAttribute(key, attrs[key]); });
+    if (parent) { parent.appendChild(node); }
+    return node;
+  }
+
+  function text(parent, x, y, label, attrs) {
+    var node = el("text", Object.assign({ x: x, y: y, "font-size": 11 }, attrs || {}), parent);
+    node.textContent = label;
+    return node;
+  }
+
+  function format(kind, value) {
+    return kind === "pct" ? (100 * value).toFixed(1) + "%" : value.toFixed(2);
+  }
+
+  function color(i, n) {
+    if (n === 1) { return PALETTE[0]; }
+    return PALETTE[Math.round(i * (PALETTE.length - 1) / (n - 1))];
+  }
+
+  function scale(d0, d1, r0, r1) {
+    var span = d1 - d0 || 1;
+    return function (v) { return r0 + (v - d0) / span * (r1 - r0); };
+  }
+
+  function extent(arrays) {
+    var lo = Infinity;
+    var hi = -Infinity;
+    arrays.forEach(function (values) {
+      values.forEach(function (v) {
+        if (v === null) { return; }
+        lo = Math.min(lo, v);
+        hi = Math.max(hi, v);
+      });
+    });
+    var pad = (hi - lo) * 0.05 || 1e-3;
+    return [lo - pad, hi + pad];
+  }
+
+  function day(start, offset) {
+    return new Date(Date.parse(start) + offset * DAY).toISOString().slice(0, 10);
+  }
+
+  // Path through the points, broken at missing values
+  function line(xs, ys, sx, sy) {
+    var d = "";
+    var move = true;
+    ys.forEach(function (y, i) {
+      if (y === null) { move = true; return; }
+      d += (move ? "M" : "L") + sx(xs[i]).toFixed(1) + "," + sy(y).toFixed(1);
+      move = false;
+    });
+    return d;
+  }
+
+  function yAxis(svg, sy, domain, kind, height) {
+    for (var i = 0; i <= 4; i++) {
+      var v = domain[0] + i * (domain[1] - domain[0]) / 4;
+      var y = sy(v);
+      el("line", { x1: PAD.left, x2: WIDTH - PAD.right, y1: y, y2: y, stroke: "#eee" }, svg);
+      text(svg, PAD.left - 4, y + 4, format(kind, v), { "text-anchor": "end" });
+    }
+    el("line", {
+      x1: PAD.left, x2: PAD.left, y1: PAD.top, y2: height - PAD.bottom, stroke: "#999",
+    }, svg);
+  }
+
+  function legend(svg, names, colors) {
+    var x = PAD.left + 8;
+    names.forEach(function (name, i) {
+      el("rect", { x: x, y: 6, width: 12, height: 3, fill: colors[i] }, svg);
+      text(svg, x + 16, 12, name);
+      x += 24 + 7 * name.length;
+    });
+  }
+
+  function lines(panel, svg, height) {
+    var names = Object.keys(panel.series);
+    var xs = panel.x;
+    var sx = scale(xs[0], xs[xs.length - 1], PAD.left, WIDTH - PAD.right);
+    var domain = extent(names.map(function (name) { return panel.series[name]; }));
+    var sy = scale(domain[0], domain[1], height - PAD.bottom, PAD.top);
+    yAxis(svg, sy, domain, panel.format, height);
+
+    if (panel.marker) {
+      var mx = sx((Date.parse(panel.marker) - Date.parse(panel.start)) / DAY);
+      el("rect", {
+        x: mx, y: PAD.top, width: Math.max(0, WIDTH - PAD.right - mx),
+        height: height - PAD.top - PAD.bottom, fill: MARKER,
+      }, svg);
+    }
+
+    if (panel.band) {
+      var low = panel.series[panel.band[0]];
+      var high = panel.series[panel.band[1]];
+      var upper = line(xs, high.map(function (v, i) { return low[i] === null ? null : v; }), sx, sy);
+      var lower = [];
+      for (var i = xs.length - 1; i >= 0; i--) {
+        if (low[i] !== null && high[i] !== null) {
+          lower.push(sx(xs[i]).toFixed(1) + "," + sy(low[i]).toFixed(1));
+        }
+      }
+      if (upper) { el("path", { d: upper + "L" + lower.join("L") + "Z", fill: BAND }, svg); }
+    }
+
+    var colors = names.map(function (_, i) { return color(i, names.length); });
+    names.forEach(function (name, i) {
+      var dashed = (panel.dashed || []).indexOf(name) >= 0;
+      el("path", {
+        d: line(xs, panel.series[name], sx, sy),
+        fill: "none",
+        stroke: colors[i],
+        "stroke-width": 1.5,
+        "stroke-dasharray": dashed ? "3,3" : "none",
+      }, svg);
+    });
+
+    for (var t = 0; t <= 5; t++) {
+      var offset = xs[0] + t * (xs[xs.length - 1] - xs[0]) / 5;
+      text(svg, sx(offset), height - 6, day(panel.start, Math.round(offset)), {
+        "text-anchor": t === 0 ? "start" : t === 5 ? "end" : "middle",
+      });
+    }
+    legend(svg, names, colors);
+  }
+
+  function boxes(panel, svg, height) {
+    var names = Object.keys(panel.series);
+    var groups = panel.groups;
+    var all = [];
+    names.forEach(function (name) {
+      panel.series[name].forEach(function (box) { all.push(box); });
+    });
+    if (panel.line) { all.push(panel.line.values); }
+    var domain = extent(all);
+    var sy = scale(domain[0], domain[1], height - PAD.bottom, PAD.top);
+    yAxis(svg, sy, domain, panel.format, height);
+
+    var slot = (WIDTH - PAD.left - PAD.right) / groups.length;
+    var width = slot * 0.8 / names.length;
+    var colors = names.map(function (_, i) { return color(i, names.length); });
+
+    groups.forEach(function (group, g) {
+      var x0 = PAD.left + g * slot + slot * 0.1;
+      names.forEach(function (name, s) {
+        var box = panel.series[name][g];
+        if (box[2] === null) { return; }
+        var x = x0 + s * width;
+        var mid = x + width / 2;
+        el("line", {
+          x1: mid, x2: mid, y1: sy(box[0]), y2: sy(box[4]), stroke: "#555",
+        }, svg);
+        el("rect", {
+          x: x + 1, y: sy(box[3]), width: Math.max(1, width - 2),
+          height: Math.max(1, sy(box[1]) - sy(box[3])), fill: colors[s], stroke: "#555",
+        }, svg);
+        el("line", {
+          x1: x + 1, x2: x + width - 1, y1: sy(box[2]), y2: sy(box[2]), stroke: "#222",
+        }, svg);
+      });
+      text(svg, PAD.left + (g + 0.5) * slot, height - 6, group, { "text-anchor": "middle" });
+    });
+
+    if (panel.line) {
+      var centers = groups.map(function (_, g) { return g; });
+      var sx = function (g) { return PAD.left + (g + 0.5) * slot; };
+      el("path", {
+        d: line(centers, panel.line.values, sx, sy),
+        fill: "none",
+        stroke: "red",
+        "stroke-width": 1.5,
+      }, svg);
+      names = names.concat([panel.line.name]);
+      colors = colors.concat(["red"]);
+    }
+    legend(svg, names, colors);
+  }
+
+  document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("script[data-chart]").forEach(function (node) {
+      var target = document.getElementById(node.dataset.chart);
+      JSON.parse(node.textContent).panels.forEach(function (panel) {
+        var height = panel.kind === "boxes" ? 220 : 240;
+        var svg = el("svg", {
+          viewBox: "0 0 " + WIDTH + " " + height,
+          width: "100%",
+          role: "img",
+        }, target);
+        (panel.kind === "boxes" ? boxes : lines)(panel, svg, height);
+      });
+    });
+  });
+})();
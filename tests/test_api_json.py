@@ -0,0 +1,85 @@
+"""
+Unit tests for the JSON API encoding.
+"""
+
+import gzip
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from json_api import dumps, to_jsonable
+
+
+class TestJsonApi(unittest.TestCase):
+    """
+    Columnar frames, plot omission and compressed responses
+    """
+
+    def setUp(self):
+        index = pd.MultiIndex.from_tuples(
+            [("YZ", 10), ("YZ", 20)], names=["Estimator", "Window"])
+        dates = pd.to_datetime(["2024-01-02", "2024-01-03"])
+        self.result = {
+            "estimators_data": pd.DataFrame(
+                {"vol": [0.15, np.nan], "n": [1, 2]}, index=index),
+            "closes": pd.Series([1.5, 2.5], index=dates),
+            "updated": pd.Timestamp("2024-01-03 16:00"),
+            "vix": np.float64(14.2),
+            "garch_plot": "assets/garch.svg",
+            "lookup": {"probs_heatmap": "aGVhdG1hcA==", "samples": 10},
+        }
+
+    def test_columnar_frames(self):
+        """
+        Test that frames and series become arrays with NaN as null
+        """
+        data = json.loads(dumps(self.result))
+        self.assertEqual(data["estimators_data"], {
+            "columns": ["vol", "n"],
+            "index": [["YZ", 10], ["YZ", 20]],
+            "data": [[0.15, None], [1, 2]],
+        })
+        self.assertEqual(data["closes"], {
+            "index": ["2024-01-02", "2024-01-03"],
+            "values": [1.5, 2.5],
+        })
+        self.assertEqual(data["updated"], "2024-01-03T16:00:00")
+        self.assertEqual(data["vix"], 14.2)
+
+    def test_omit_plots(self):
+        """
+        Test that plots=False drops figure keys at any depth
+        """
+        data = to_jsonable(self.result, plots=False)
+        self.assertNotIn("garch_plot", data)
+        self.assertEqual(data["lookup"], {"samples": 10})
+        self.assertIn("garch_plot", to_jsonable(self.result))
+
+    def test_response(self):
+        """
+        Test that large bodies are gzipped and timed in Server-Timing
+        """
+        import app  # noqa: PLC0415
+
+        result = {"values": pd.Series(np.arange(2000, dtype=float))}
+        path = "/api/vol?plots=0"
+        with app.app.test_request_context(path, headers={"Accept-Encoding": "gzip"}):
+            response = app.json_response("vol", lambda: result)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        timing = response.headers["Server-Timing"]
+        for metric in ("compute;dur=", "encode;dur=", "gzip;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+        data = json.loads(gzip.decompress(response.get_data()))
+        self.assertEqual(len(data["values"]["values"]), 2000)
+
+        with app.app.test_request_context(path):
+            response = app.json_response("vol", lambda: result)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertNotIn("gzip", response.headers["Server-Timing"])
+
+
+if __name__ == "__main__":
+    unittest.main()
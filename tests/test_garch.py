@@ -0,0 +1,245 @@
+"""
+Unit tests for the GARCH model family.
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from arch import arch_model
+
+from api_garch import (
+    REFIT_DAYS,
+    fit_model,
+    forecast_panel,
+    forecast_results,
+    forecast_variance,
+    model_weights,
+    refit_reason,
+    simulate_variance,
+    simulation_bands,
+)
+
+
+def returns(n=500, seed=0):
+    """
+    Percent returns with volatility clustering
+    """
+    rng = np.random.default_rng(seed)
+    variance = np.empty(n)
+    values = np.empty(n)
+    variance[0] = 1.0
+    values[0] = rng.standard_normal()
+    for t in range(1, n):
+        variance[t] = 0.05 + 0.1 * values[t - 1] ** 2 + 0.85 * variance[t - 1]
+        values[t] = np.sqrt(variance[t]) * rng.standard_normal()
+    return pd.Series(values, index=pd.bdate_range("2022-01-03", periods=n))
+
+
+class TestGarchFit(unittest.TestCase):
+    """
+    Warm starts, updates and refit triggers
+    """
+
+    def setUp(self):
+        self.model = arch_model(returns(), vol="GARCH", p=1, q=1)
+        self.label = "GARCH(1,1)"
+        self.state = {}
+        fit_model(self.model, self.label, self.state, mode="refit")
+
+    def test_update_reuses_parameters(self):
+        """
+        Test that an update filters through the stored parameters
+        """
+        params = self.state[self.label]["params"]
+        entry, info = fit_model(self.model, self.label, self.state, mode="update")
+        self.assertEqual(info["mode"], "update")
+        self.assertEqual(info["iterations"], 0)
+        self.assertEqual(entry["params"], params)
+        self.assertEqual(entry["filter"]["nobs"], 0)
+        self.assertEqual(len(entry["volatility"]), len(self.model.y))
+
+    def test_update_filters_new_returns(self):
+        """
+        Test that an update over new returns matches filtering the full
+        sample through the stored parameters
+        """
+        series = returns()
+        for label, spec in [
+                ("GJR-GARCH(1,1,1)-t", {"vol": "GARCH", "p": 1, "o": 1, "q": 1,
+                                        "dist": "t"}),
+                ("EGARCH(1,1,1)", {"vol": "EGARCH", "p": 1, "o": 1, "q": 1}),
+                ("GARCH(1,2)", {"vol": "GARCH", "p": 1, "q": 2})]:
+            with self.subTest(model=label):
+                state = {}
+                fit_model(arch_model(series[:-3], **spec), label, state, mode="refit")
+                params = list(state[label]["params"].values())
+                model = arch_model(series, **spec)
+                entry, info = fit_model(model, label, state, mode="update")
+                self.assertEqual(info["mode"], "update")
+                self.assertEqual(entry["filter"]["nobs"], 3)
+                self.assertEqual(entry["end_date"], "2023-12-01")
+
+                full = model.fix(params)
+                # The backcast of the shorter sample fades out within a year
+                np.testing.assert_allclose(
+                    entry["volatility"][-250:], full.conditional_volatility[-250:],
+                    rtol=1e-6)
+                n_dist = model.distribution.num_params
+                expected = model.distribution.loglikelihood(
+                    params[len(params) - n_dist:], full.resid[-3:],
+                    full.conditional_volatility[-3:] ** 2, individual=True)
+                self.assertAlmostEqual(
+                    entry["filter"]["loglikelihood"][0], expected.sum(), places=6)
+
+    def test_forecast_variance(self):
+        """
+        Test that the forecast from the stored state matches arch's
+        analytic forecast
+        """
+        model = arch_model(returns(), vol="GARCH", p=1, o=1, q=1)
+        state = {}
+        entry, _ = fit_model(model, "GJR-GARCH(1,1,1)", state, mode="refit")
+        expected = model.fix(list(entry["params"].values())).forecast(horizon=10)
+        np.testing.assert_allclose(
+            forecast_variance(model, entry, 10), expected.variance.iloc[-1], rtol=1e-8)
+
+    def test_refit_warm_starts(self):
+        """
+        Test that a full refit starts from the stored parameters
+        """
+        _, info = fit_model(self.model, self.label, self.state, mode="refit")
+        self.assertTrue(info["warm_start"])
+        self.assertTrue(info["converged"])
+
+    def test_refit_reason(self):
+        """
+        Test refits on age and without a parameter covariance
+        """
+        entry = self.state[self.label]
+        end_date = self.model.y.index[-1]
+        reason, updated = refit_reason(self.model, entry, end_date)
+        self.assertIsNone(reason)
+        self.assertIsNotNone(updated)
+
+        later = end_date + pd.Timedelta(days=REFIT_DAYS)
+        self.assertEqual(refit_reason(self.model, entry, later)[0], "scheduled refit")
+
+        singular = entry | {"cov": None}
+        reason, updated = refit_reason(self.model, singular, end_date)
+        self.assertEqual(reason, "no parameter covariance for the drift test")
+        self.assertIsNone(updated)
+
+        gap = entry | {"end_date": "2021-01-01"}
+        reason, _ = refit_reason(self.model, gap, end_date)
+        self.assertEqual(reason, "stored end date is not in the returns")
+
+        reason, _ = refit_reason(self.model, None, end_date)
+        self.assertEqual(reason, "no stored parameters")
+
+
+class TestGarchForecast(unittest.TestCase):
+    """
+    Information-criterion weights and simulated bands
+    """
+
+    def test_model_weights(self):
+        """
+        Test that weights sum to 1 and non-converged models get none
+        """
+        state = {
+            "a": {"bic": 100.0, "fit": {"converged": True}},
+            "b": {"bic": 102.0, "fit": {"converged": True}},
+            "c": {"bic": 90.0, "fit": {"converged": False}},
+        }
+        weights = model_weights(state, ["a", "b", "c"])
+        self.assertAlmostEqual(weights.sum(), 1.0)
+        self.assertEqual(weights["c"], 0.0)
+        self.assertAlmostEqual(weights["a"] / weights["b"], np.exp(1.0))
+
+    def test_model_weights_not_converged(self):
+        """
+        Test that weights stay defined when no model converged
+        """
+        state = {
+            "a": {"bic": 100.0, "fit": {"converged": False}},
+            "b": {"bic": 102.0, "fit": {"converged": False}},
+            "c": {"bic": np.nan, "fit": {"converged": False}},
+        }
+        weights = model_weights(state, ["a", "b", "c"])
+        self.assertAlmostEqual(weights.sum(), 1.0)
+        self.assertEqual(weights.idxmax(), "a")
+        self.assertEqual(weights["c"], 0.0)
+
+        state = {label: entry | {"bic": np.nan} for label, entry in state.items()}
+        weights = model_weights(state, ["a", "b", "c"])
+        self.assertTrue(np.allclose(weights, 1 / 3))
+
+    def test_zero_weight_dropped(self):
+        """
+        Test that zero-weight models do not enter the average
+        """
+        history = pd.bdate_range("2024-01-01", periods=5)
+        future = pd.bdate_range("2024-01-08", periods=2)
+        fits = [
+            {"label": "a", "volatility": np.full(4, 0.01),
+             "variance": np.full(2, 1e-4)},
+            {"label": "b", "volatility": np.full(4, np.inf),
+             "variance": np.full(2, np.inf)},
+        ]
+        weights = pd.Series({"a": 1.0, "b": 0.0})
+        result = forecast_results(history, future, fits, weights=weights)
+        np.testing.assert_allclose(result["average"].iloc[1:], result["a"].iloc[1:])
+        self.assertTrue(np.isnan(result["average"].iloc[0]))
+
+    def test_forecast_panel(self):
+        """
+        Test that a panel fits every underlying into its own state
+        """
+        panel = {}
+        for seed, ticker in enumerate(["^SPX", "^NDX"]):
+            series = returns(n=300, seed=seed)
+            quotes = pd.DataFrame({"close": 100 + series.cumsum()})
+            models = [
+                [arch_model(series, vol="GARCH", p=1, q=1), "GARCH(1,1)"],
+                [arch_model(series, vol="GARCH", p=1, o=1, q=1), "GJR-GARCH(1,1,1)"],
+            ]
+            panel[ticker] = (models, quotes, {})
+
+        result = forecast_panel(panel, horizon=5, mode="refit", workers=1)
+        self.assertEqual(list(result), ["^SPX", "^NDX"])
+        for ticker, (_, quotes, state) in panel.items():
+            self.assertEqual(set(state), {"GARCH(1,1)", "GJR-GARCH(1,1,1)"})
+            self.assertEqual(len(result[ticker]), len(quotes) + 5)
+            self.assertIn("BIC average", result[ticker].columns)
+        self.assertNotEqual(
+            panel["^SPX"][2]["GARCH(1,1)"]["params"],
+            panel["^NDX"][2]["GARCH(1,1)"]["params"])
+
+    def test_simulation_reproducible(self):
+        """
+        Test that a fixed seed gives the same paths and bands, and that
+        the step budget caps the paths
+        """
+        model = arch_model(returns(seed=1), vol="GARCH", p=1, o=1, q=1)
+        params = model.fit(disp="off").params.to_dict()
+        dates = pd.bdate_range("2024-01-01", periods=22)
+
+        first = simulate_variance(model, params, n_paths=300, chunk=100, seed=3)
+        second = simulate_variance(model, params, n_paths=300, chunk=100, seed=3)
+        self.assertEqual(first.shape, (300, 22))
+        np.testing.assert_array_equal(first, second)
+
+        capped = simulate_variance(
+            model, params, n_paths=300, chunk=100, max_steps=22 * 150, seed=3)
+        self.assertEqual(capped.shape, (150, 22))
+        np.testing.assert_array_equal(first[:100], capped[:100])
+
+        bands, term_structure = simulation_bands(first, dates)
+        bands_again, term_again = simulation_bands(second, dates)
+        pd.testing.assert_frame_equal(bands, bands_again)
+        pd.testing.assert_frame_equal(term_structure, term_again)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+"""
+Unit tests for file utilities.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from botocore.stub import ANY, Stubber
+import io_utils
+from io_utils import (
+    ASSET_PREFIX,
+    CachedStorage,
+    LocalStorage,
+    MemoryStorage,
+    S3Storage,
+    asset_key,
+    compress,
+    content_encoding,
+    decompress,
+    invalidate_cdn,
+    open_from_s3,
+    read_from_s3,
+    read_if_modified,
+    read_metadata,
+    s3_client,
+    save_asset,
+    save_to_s3,
+)
+
+
+class TestAssets(unittest.TestCase):
+    """
+    Content-addressed assets in dev mode
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_save_asset(self):
+        """
+        Test that keys follow the content and existing assets are kept
+        """
+        config = {'mode': 'dev'}
+        key = save_asset(config, b'<svg/>', 'svg', 'image/svg+xml')
+        self.assertTrue(key.startswith(ASSET_PREFIX))
+        self.assertTrue(key.endswith('.svg'))
+        self.assertEqual(key, asset_key(b'<svg/>', 'svg'))
+        self.assertNotEqual(key, asset_key(b'<svg></svg>', 'svg'))
+
+        mtime = os.stat(key).st_mtime_ns
+        self.assertEqual(save_asset(config, b'<svg/>', 'svg', 'image/svg+xml'), key)
+        self.assertEqual(os.stat(key).st_mtime_ns, mtime)
+
+
+class TestCompression(unittest.TestCase):
+    """
+    Precompressed uploads
+    """
+
+    config = {'mode': 'prod', 'bucket_name': 'bucket'}
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+
+    def test_content_encoding(self):
+        """
+        Test that only text types are compressed
+        """
+        self.assertEqual(content_encoding({}, 'text/html'), 'gzip')
+        self.assertEqual(content_encoding({}, 'image/svg+xml'), 'gzip')
+        self.assertIsNone(content_encoding({}, 'application/octet-stream'))
+        identity = {'upload_encoding': 'identity'}
+        self.assertIsNone(content_encoding(identity, 'text/html'))
+
+        with mock.patch.object(io_utils, 'brotli', None), \
+                mock.patch.object(io_utils, 'logger') as logger:
+            io_utils._warn_brotli_missing.cache_clear()
+            for _ in range(2):
+                encoding = content_encoding({'upload_encoding': 'br'}, 'text/html')
+                self.assertEqual(encoding, 'gzip')
+        logger.warning.assert_called_once()
+        io_utils._warn_brotli_missing.cache_clear()
+
+    def test_roundtrip(self):
+        """
+        Test that compression is reversible and gzip is reproducible
+        """
+        content = b'<p>volatility</p>' * 200
+        for encoding in ('gzip', 'br', None):
+            if encoding == 'br' and io_utils.brotli is None:
+                continue
+            self.assertEqual(decompress(compress(content, encoding), encoding), content)
+        self.assertEqual(compress(content, 'gzip'), compress(content, 'gzip'))
+
+    def test_save_and_read(self):
+        """
+        Test that large text is uploaded compressed and read back decoded
+        """
+        html = '<p>volatility</p>' * 200
+        body = compress(html.encode('utf-8'), 'gzip')
+        with Stubber(s3_client()) as stub:
+            stub.add_response('put_object', {}, {
+                'Body': body, 'Bucket': 'bucket', 'Key': 'index.html',
+                'ContentType': 'text/html', 'ContentEncoding': 'gzip',
+            })
+            stub.add_response('put_object', {}, {
+                'Body': b'<p/>', 'Bucket': 'bucket', 'Key': 'small.html',
+                'ContentType': 'text/html',
+            })
+            stub.add_response('get_object', {
+                'Body': io.BytesIO(body), 'ContentEncoding': 'gzip',
+            }, {'Bucket': 'bucket', 'Key': 'index.html'})
+
+            save_to_s3(self.config, 'index.html', html, content_type='text/html')
+            save_to_s3(self.config, 'small.html', '<p/>', content_type='text/html')
+            self.assertEqual(read_from_s3(self.config, 'index.html', decode=True), html)
+            stub.assert_no_pending_responses()
+
+    def test_stream(self):
+        """
+        Test that file objects are streamed gzip-compressed
+        """
+        data = b'date,close\n' + b'2025-01-02,5868.55\n' * 1000
+        with Stubber(s3_client()) as stub:
+            stub.add_response('put_object', {}, {
+                'Body': ANY, 'Bucket': 'bucket', 'Key': 'quotes.csv',
+                'ContentType': 'text/csv', 'ContentEncoding': 'gzip',
+                'ChecksumAlgorithm': ANY,
+            })
+            save_to_s3(
+                self.config, 'quotes.csv', io.BytesIO(data), content_type='text/csv')
+            stub.assert_no_pending_responses()
+
+
+class TestPublication(unittest.TestCase):
+    """
+    Stored digests and CloudFront invalidation
+    """
+
+    config = {'mode': 'prod', 'bucket_name': 'bucket', 'distribution_id': 'E123'}
+
+    @classmethod
+    def setUpClass(cls):
+        TestCompression.setUpClass()
+
+    def test_read_metadata(self):
+        """
+        Test that a missing object has no metadata
+        """
+        with Stubber(s3_client()) as stub:
+            stub.add_response('head_object', {'Metadata': {'inputs-digest': 'abc'}},
+                              {'Bucket': 'bucket', 'Key': 'index.html'})
+            stub.add_client_error('head_object', '404', http_status_code=404)
+            self.assertEqual(read_metadata(self.config, 'index.html'),
+                             {'inputs-digest': 'abc'})
+            self.assertEqual(read_metadata(self.config, 'index.html'), {})
+
+    def test_read_if_modified(self):
+        """
+        Test that an unchanged ETag is not downloaded again
+        """
+        with Stubber(s3_client()) as stub:
+            stub.add_response('get_object', {
+                'Body': io.BytesIO(b'page'),
+                'ETag': '"v1"',
+            }, {'Bucket': 'bucket', 'Key': 'report.html'})
+            stub.add_client_error('get_object', '304', http_status_code=304,
+                                  expected_params={'Bucket': 'bucket',
+                                                   'Key': 'report.html',
+                                                   'IfNoneMatch': '"v1"'})
+            self.assertEqual(read_if_modified(self.config, 'report.html', decode=True),
+                             ('page', '"v1"'))
+            self.assertEqual(read_if_modified(self.config, 'report.html', '"v1"'),
+                             (None, '"v1"'))
+
+    def test_invalidate_cdn(self):
+        """
+        Test that only changed keys are invalidated
+        """
+        self.assertEqual(invalidate_cdn(self.config, [], 'abc'), [])
+        self.assertEqual(invalidate_cdn({'mode': 'prod'}, ['index.html'], 'abc'), [])
+
+        with Stubber(io_utils.aws_client('cloudfront')) as stub:
+            stub.add_response('create_invalidation', {}, {
+                'DistributionId': 'E123',
+                'InvalidationBatch': {
+                    'Paths': {'Quantity': 2, 'Items': ['/index.html', '/']},
+                    'CallerReference': 'abc',
+                },
+            })
+            self.assertEqual(invalidate_cdn(self.config, ['index.html'], 'abc'),
+                             ['/index.html', '/'])
+            stub.assert_no_pending_responses()
+
+class TestStorage(unittest.TestCase):
+    """
+    Storage backends
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_local(self):
+        """
+        Test memory-mapped reads, ranges and versions of local files
+        """
+        local = LocalStorage(self.tmp.name)
+        self.assertIsNone(local.version('data/a.bin'))
+        local.write('data/a.bin', b'0123456789')
+        version = local.version('data/a.bin')
+
+        with local.open('data/a.bin') as f:
+            self.assertEqual(f.read(4), b'0123')
+        self.assertEqual(local.read_range('data/a.bin', 2, 5), b'234')
+        self.assertEqual(local.read_range('data/a.bin', 8), b'89')
+        self.assertEqual(local.read_if_modified('data/a.bin', version), (None, version))
+
+        local.write('data/a.bin', io.BytesIO(b'abc'))
+        self.assertEqual(local.read('data/a.bin'), b'abc')
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, 'data')), ['a.bin'])
+
+    def test_memory(self):
+        """
+        Test that a configured backend replaces the mode
+        """
+        config = {'mode': 'prod', 'storage': MemoryStorage()}
+        save_to_s3(config, 'index.html', '<p/>', 'text/html', {'inputs-digest': 'abc'})
+        self.assertEqual(read_from_s3(config, 'index.html', decode=True), '<p/>')
+        self.assertEqual(read_metadata(config, 'index.html'), {'inputs-digest': 'abc'})
+        with open_from_s3(config, 'index.html') as f:
+            self.assertEqual(f.read(), b'<p/>')
+        with self.assertRaises(FileNotFoundError):
+            read_from_s3(config, 'missing.html')
+
+    def test_cached(self):
+        """
+        Test that objects are downloaded once per version
+        """
+        source = MemoryStorage()
+        source.write('itm.pkl', b'x' * 100)
+        opened = []
+        source_open = source.open
+        source.open = lambda key: opened.append(key) or source_open(key)
+
+        cached = CachedStorage(source, self.tmp.name, max_bytes=150)
+        self.assertEqual(cached.read('itm.pkl'), b'x' * 100)
+        self.assertEqual(cached.read_range('itm.pkl', 10, 12), b'xx')
+        self.assertEqual(len(opened), 1)
+
+        cached.write('itm.pkl', b'y' * 100)
+        self.assertEqual(cached.read('itm.pkl'), b'y' * 100)
+        self.assertEqual(len(opened), 2)
+
+        source.write('quotes.csv', b'z' * 100)
+        cached.read('quotes.csv')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, 'itm.pkl')))
+
+    def test_s3_range(self):
+        """
+        Test that ranges of identity-encoded objects are ranged GETs
+        """
+        TestCompression.setUpClass()
+        s3 = S3Storage({'mode': 'prod', 'bucket_name': 'bucket'})
+        with Stubber(s3_client()) as stub:
+            stub.add_response('get_object', {'Body': io.BytesIO(b'234')}, {
+                'Bucket': 'bucket', 'Key': 'itm.pkl', 'Range': 'bytes=2-4',
+            })
+            self.assertEqual(s3.read_range('itm.pkl', 2, 5), b'234')
+            stub.assert_no_pending_responses()
+
+if __name__ == "__main__":
+    unittest.main()
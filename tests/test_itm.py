@@ -0,0 +1,108 @@
+"""
+Unit tests for the ITM statistics module.
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from api_itm import (
+    wilson_interval, bootstrap_interval, compact_itm_frame, itm_stats, probs_heatmap)
+
+
+class TestIntervals(unittest.TestCase):
+    """
+    Confidence intervals for ITM probabilities
+    """
+
+    def test_wilson_interval(self):
+        """
+        Test against the textbook 50/100 interval
+        """
+        lower, upper = wilson_interval([50, 0], [100, 0])
+        self.assertAlmostEqual(lower[0], 0.4038, places=4)
+        self.assertAlmostEqual(upper[0], 0.5962, places=4)
+        self.assertTrue(np.isnan(lower[1]))
+
+    def test_bootstrap_interval(self):
+        """
+        Test shape, empty cells and reproducibility
+        """
+        hits = np.array([[10, 0], [40, 5]])
+        counts = np.array([[100, 0], [80, 50]])
+
+        lower, upper = bootstrap_interval(hits, counts, seed=1)
+        self.assertEqual(lower.shape, (2, 2))
+        self.assertTrue(np.isnan(lower[0, 1]))
+        self.assertTrue(np.all(lower[~np.isnan(lower)] <= upper[~np.isnan(upper)]))
+        self.assertTrue(lower[1, 0] < 0.5 < upper[1, 0])
+
+        lower_again, _ = bootstrap_interval(hits, counts, seed=1)
+        np.testing.assert_array_equal(lower, lower_again)
+
+
+class TestItmFrame(unittest.TestCase):
+    """
+    Compact ITM frame and statistics on synthetic data
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 2000
+        delta = rng.choice([0.1, 0.2, 0.3], n)
+        self.df = pd.DataFrame({
+            'quote_datetime': pd.Timestamp('2023-01-02') + pd.to_timedelta(
+                rng.integers(0, 300, n), unit='D'),
+            'vix_open': rng.uniform(10, 40, n),
+            'open_to_close_pct': rng.normal(0, 1, n),
+            'expiration_weekday': rng.integers(0, 5, n),
+            'delta_bin': pd.cut(delta, [0, 0.15, 0.25, 0.35]),
+            'itm': (rng.random(n) < delta).astype(int),
+            'unused': rng.random(n),
+        })
+
+    def test_compact_itm_frame(self):
+        """
+        Test dtypes and that the source frame is not modified
+        """
+        compact = compact_itm_frame(self.df)
+        self.assertEqual(compact['expiration_weekday'].dtype, np.int8)
+        self.assertEqual(compact['vix_open'].dtype, np.float32)
+        self.assertEqual(compact['itm'].dtype, bool)
+        self.assertIsInstance(compact['delta_bin'].dtype, pd.CategoricalDtype)
+        self.assertNotIn('unused', compact.columns)
+        self.assertIn('unused', self.df.columns)
+
+    def test_missing_itm(self):
+        """
+        Test that rows without an ITM outcome are dropped, not counted as ITM
+        """
+        df = self.df.assign(itm=self.df['itm'].astype(float))
+        df.loc[df.index[:10], 'itm'] = np.nan
+        compact = compact_itm_frame(df)
+        self.assertEqual(compact['itm'].dtype, bool)
+        self.assertEqual(len(compact), len(df) - 10)
+        self.assertEqual(compact['itm'].sum(), df['itm'].sum())
+
+    def test_probs_heatmap(self):
+        """
+        Test that the heatmap leaves its frame untouched
+        """
+        probs = pd.DataFrame({'a': [0.0, 0.5], 'b': [0.2, 0.0]})
+        expected = probs.copy()
+        probs_heatmap(probs)
+        pd.testing.assert_frame_equal(probs, expected)
+
+    def test_itm_stats(self):
+        """
+        Test that statistics leave the frame untouched
+        """
+        compact = compact_itm_frame(self.df)
+        columns = list(compact.columns)
+        stats = itm_stats(compact, 20.0, 0.1)
+        self.assertEqual(list(compact.columns), columns)
+        self.assertIn('intervals', stats)
+        self.assertGreater(int(stats['group_samples']), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Unit tests for the memory profile of stages.
+"""
+
+import unittest
+
+from memprofile import MemoryProfiler, profile, suggested_memory_mb
+from tracing import span, trace
+
+
+class TestMemoryProfile(unittest.TestCase):
+    """
+    Heap peaks of nested spans
+    """
+
+    def test_stages(self):
+        """
+        Test that peaks reach enclosing spans and freed memory is not retained
+        """
+        size = 8 * 2**20
+        with trace("run") as run, profile(MemoryProfiler()) as profiler:
+            with span("outer"):
+                with span("inner"):
+                    block = bytearray(size)
+                    del block
+                kept = bytearray(size // 2)
+
+        inner, outer = run.spans
+        self.assertGreaterEqual(inner.memory["heap_peak_mb"], 8)
+        self.assertLess(inner.memory["heap_retained_mb"], 1)
+        self.assertGreaterEqual(outer.memory["heap_peak_mb"], 8)
+        self.assertGreaterEqual(outer.memory["heap_retained_mb"], 4)
+        self.assertGreater(profiler.rss_peak, 0)
+        self.assertIn("heap MB", run.pretty())
+        self.assertIn("outer.heap_peak_mb", run.emf())
+        self.assertEqual(len(kept), size // 2)
+
+    def test_without_profiler(self):
+        """
+        Test that spans have no memory when nothing is profiled
+        """
+        with trace("run") as run, profile(None):
+            with span("a"):
+                pass
+        self.assertIsNone(run.spans[0].memory)
+        self.assertNotIn("a.heap_peak_mb", run.emf())
+
+    def test_suggested_memory(self):
+        """
+        Test that suggestions have headroom and Lambda's minimum
+        """
+        self.assertEqual(suggested_memory_mb(0), 128)
+        self.assertEqual(suggested_memory_mb(551 * 2**20), 704)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Unit tests for the process metrics.
+"""
+
+import threading
+import unittest
+
+from metrics import Registry
+from tracing import span
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Counters, histograms, callbacks and the span hook
+    """
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        """
+        Test that labelled counters add up across threads
+        """
+        counter = self.registry.counter("hits_total", "Hits.", ("cache",))
+
+        def hit():
+            for _ in range(1000):
+                counter.labels("warm").inc()
+
+        threads = [threading.Thread(target=hit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.labels('a"b').inc(2)
+
+        text = self.registry.expose()
+        self.assertIn("# TYPE volreport_hits_total counter", text)
+        self.assertIn('volreport_hits_total{cache="warm"} 4000', text)
+        self.assertIn('volreport_hits_total{cache="a\\"b"} 2', text)
+        with self.assertRaises(ValueError):
+            counter.labels()
+
+    def test_histogram(self):
+        """
+        Test that buckets are cumulative and end with +Inf
+        """
+        histogram = self.registry.histogram(
+            "fetch_seconds", "Fetch time.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        lines = self.registry.expose().splitlines()
+        self.assertIn('volreport_fetch_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('volreport_fetch_seconds_bucket{le="1.0"} 3', lines)
+        self.assertIn('volreport_fetch_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn("volreport_fetch_seconds_sum 3.65", lines)
+        self.assertIn("volreport_fetch_seconds_count 4", lines)
+
+    def test_callback(self):
+        """
+        Test that callbacks are read at scrape time
+        """
+        stats = {"hits": 1}
+        self.registry.callback(
+            "events_total", "Events.", "counter",
+            lambda: {(event,): n for event, n in stats.items()}, ("event",))
+        stats["hits"] = 5
+        self.assertIn('volreport_events_total{event="hits"} 5', self.registry.expose())
+        with self.assertRaises(TypeError):
+            self.registry.callback("size", "Size.", "gauge", lambda: 1).labels()
+
+    def test_spans(self):
+        """
+        Test that spans are observed outside of a trace
+        """
+        import warm_state  # noqa: F401, PLC0415
+        from metrics import REGISTRY, SPAN_SECONDS  # noqa: PLC0415
+
+        with span("metrics.test") as block:
+            block.add_bytes(10)
+        self.assertEqual(sum(SPAN_SECONDS.labels("metrics.test").counts), 1)
+        text = REGISTRY.expose()
+        self.assertIn('volreport_span_bytes_total{span="metrics.test"} 10', text)
+        self.assertIn("volreport_warm_state_events_total", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
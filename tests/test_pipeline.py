@@ -0,0 +1,84 @@
+"""
+Unit tests for the report pipeline.
+"""
+
+import sys
+import threading
+import unittest
+from pipeline import SKIPPED, Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    Compute-once dependency graph
+    """
+
+    def test_compute_once(self):
+        """
+        Test that shared dependencies are computed once
+        """
+        calls = []
+        pipeline = Pipeline()
+        pipeline.add("quotes", lambda: calls.append("quotes") or 2)
+        pipeline.add("double", lambda x: 2 * x, ["quotes"])
+        pipeline.add("square", lambda x: x * x, ["quotes"])
+        pipeline.add("sum", lambda a, b: a + b, ["double", "square"])
+
+        self.assertEqual(pipeline.run("sum", "double"), {"sum": 8, "double": 4})
+        self.assertEqual(pipeline["square"], 4)
+        self.assertEqual(calls, ["quotes"])
+
+    def test_concurrent_nodes(self):
+        """
+        Test that independent nodes run at the same time
+        """
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline()
+        pipeline.add("a", lambda: barrier.wait() is not None)
+        pipeline.add("b", lambda: barrier.wait() is not None)
+        self.assertEqual(pipeline.run("a", "b"), {"a": True, "b": True})
+
+    def test_errors(self):
+        """
+        Test unknown nodes, duplicates and cycles
+        """
+        pipeline = Pipeline()
+        pipeline.add("a", lambda b: b, ["b"])
+        pipeline.add("b", lambda a: a, ["a"])
+        with self.assertRaises(ValueError):
+            pipeline.add("a", lambda: None)
+        with self.assertRaises(ValueError):
+            pipeline.run("a")
+        with self.assertRaises(KeyError):
+            pipeline.run("c")
+
+    def test_imports(self):
+        """
+        Test that imports are loaded first and not passed as arguments
+        """
+        pipeline = Pipeline()
+        pipeline.add("a", lambda: sys.modules["json"].dumps(1), imports=["json"])
+        pipeline.add("b", lambda a: a, ["a"], imports=["json"])
+        self.assertEqual(pipeline["b"], "1")
+        self.assertIn("import:json", pipeline)
+
+    def test_skipped(self):
+        """
+        Test that skipped nodes skip their dependants unless allowed
+        """
+        calls = []
+        pipeline = Pipeline()
+        pipeline.add("a", lambda: SKIPPED)
+        pipeline.add("b", lambda: 2)
+        pipeline.add("c", lambda a: calls.append(a), ["a"])
+        pipeline.add(
+            "total",
+            lambda *values: sum(v for v in values if v is not SKIPPED),
+            ["c", "b"],
+            allow_skipped=True,
+        )
+        self.assertEqual(pipeline.run("c", "total"), {"c": SKIPPED, "total": 2})
+        self.assertEqual(calls, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+"""
+Unit tests for figure encoding.
+"""
+
+import base64
+import unittest
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from plot_utils import (
+    box_stats,
+    boxes_chart,
+    dense,
+    encode_figure,
+    figure_svg,
+    lines_chart,
+    render,
+    render_pool,
+)
+from pool_utils import discard_pool, process_starmap, shared_pool
+
+
+def _scatter(render_mode):
+    rng = np.random.default_rng(0)
+    fig, ax = plt.subplots()
+    ax.scatter(rng.random(5000), rng.random(5000), **dense(render_mode))
+    return fig
+
+
+def _scatter_svg(render_mode):
+    return encode_figure(_scatter(render_mode), "scatter", render_mode)
+
+
+class TestEncodeFigure(unittest.TestCase):
+    """
+    Render modes and the byte budget
+    """
+
+    def test_compact_is_smaller(self):
+        """
+        Test that rasterized dense layers shrink the SVG
+        """
+        vector = base64.b64decode(encode_figure(_scatter("vector"), "vector"))
+        compact = base64.b64decode(
+            encode_figure(_scatter("compact"), "compact", "compact"))
+        self.assertTrue(vector.startswith(b"<?xml"))
+        self.assertLess(len(compact), len(vector) / 2)
+
+    def test_reproducible(self):
+        """
+        Test that the same figure gives the same bytes
+        """
+        first = figure_svg(_scatter("vector"), "scatter")
+        second = figure_svg(_scatter("vector"), "scatter")
+        self.assertEqual(first, second)
+        self.assertNotIn(b"<dc:date>", first)
+
+    def test_budget(self):
+        """
+        Test that a figure over budget is rasterized until it fits
+        """
+        svg = base64.b64decode(
+            encode_figure(_scatter("vector"), "scatter", "compact", budget=120_000))
+        self.assertLessEqual(len(svg), 120_000)
+        self.assertIn(b"<image", svg)
+
+
+class TestRender(unittest.TestCase):
+    """
+    Figures rendered in worker processes
+    """
+
+    def test_render(self):
+        """
+        Test that the pool and the in-process path give the same figure
+        """
+        pool = render_pool(2)
+        self.assertIsNotNone(pool)
+        self.assertIs(render_pool(2), pool)
+
+        pooled = base64.b64decode(render(pool, _scatter_svg, "vector"))
+        local = base64.b64decode(render(None, _scatter_svg, "vector"))
+        self.assertTrue(pooled.startswith(b"<?xml"))
+        self.assertAlmostEqual(len(pooled), len(local), delta=100)
+
+    def test_shared_pool(self):
+        """
+        Test that starmaps reuse a pool and a discarded pool is replaced
+        """
+        self.assertEqual(process_starmap(pow, [(2, 3), (3, 2)], max_workers=2), [8, 9])
+        pool = shared_pool(2)
+        self.assertIs(shared_pool(2), pool)
+        self.assertEqual(process_starmap(pow, [(2, 4), (4, 2)], max_workers=2), [16, 16])
+        self.assertIs(shared_pool(2), pool)
+
+        discard_pool(pool)
+        self.assertIsNot(shared_pool(2), pool)
+
+    def test_single_worker(self):
+        """
+        Test that a single worker renders in-process
+        """
+        self.assertIsNone(render_pool(1))
+
+
+class TestCharts(unittest.TestCase):
+    """
+    Chart data of the client render mode
+    """
+
+    def test_lines_chart(self):
+        """
+        Test day offsets, down-sampling, rounding and missing values
+        """
+        index = pd.bdate_range("2024-01-01", periods=1000)
+        values = np.linspace(0, 1, 1000)
+        values[-2] = np.nan
+        frame = pd.DataFrame({10: values}, index=index)
+
+        chart = lines_chart(frame, max_points=300, band=["10", "10"])
+        start = pd.Timestamp(chart["start"])
+        self.assertLess(start - index[0], pd.Timedelta(days=7))
+        self.assertLessEqual(len(chart["x"]), 300)
+        self.assertEqual(chart["x"][-1], (index[-1] - start).days)
+        self.assertEqual(chart["series"]["10"][-1], 1.0)
+        self.assertEqual(chart["band"], ["10", "10"])
+
+        short = lines_chart(frame.iloc[-5:])
+        self.assertEqual(short["x"], (index[-5:] - index[-5]).days.tolist())
+        self.assertIsNone(short["series"]["10"][-2])
+        self.assertEqual(short["series"]["10"][0], round(values[-5], 4))
+
+    def test_boxes_chart(self):
+        """
+        Test Tukey whiskers and the marker line
+        """
+        sample = pd.Series([1.0, 2, 3, 4, 5, 100])
+        low, q1, median, q3, high = box_stats(sample)
+        self.assertEqual((low, median, high), (1.0, 3.5, 5.0))
+
+        chart = boxes_chart({"mean": [box_stats(sample)]}, [10],
+                            line={"name": "last", "values": [np.float64(2)]})
+        self.assertEqual(chart["groups"], ["10"])
+        self.assertEqual(chart["series"]["mean"][0][2], 3.5)
+        self.assertEqual(chart["line"]["values"], [2.0])
+
+if __name__ == "__main__":
+    unittest.main()
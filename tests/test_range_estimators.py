@@ -0,0 +1,72 @@
+"""
+Unit tests for the range-based volatility estimators.
+"""
+
+import math
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from volatility.models import garman_klass, parkinson, rogers_satchell
+
+
+def quotes(seed=0, periods=300):
+    """
+    Random daily prices
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, periods)))
+    open_ = close * np.exp(rng.normal(0, 0.003, periods))
+    return pd.DataFrame({
+        "open": open_,
+        "high": np.maximum(open_, close) * np.exp(rng.uniform(0, 0.01, periods)),
+        "low": np.minimum(open_, close) * np.exp(-rng.uniform(0, 0.01, periods)),
+        "close": close,
+    }, index=pd.bdate_range("2024-01-01", periods=periods))
+
+
+def rolling_apply(rs, window, trading_periods=252):
+    """
+    Previous implementation with a Python function per window
+    """
+    def f(v):
+        return (trading_periods * v.mean())**0.5
+
+    return rs.rolling(window=window, center=False).apply(func=f)
+
+
+class TestRangeEstimators(unittest.TestCase):
+    """
+    Rolling means against the previous rolling apply
+    """
+
+    def setUp(self):
+        self.price_data = quotes()
+        log_hl = (self.price_data["high"] / self.price_data["low"]).apply(np.log)
+        log_co = (self.price_data["close"] / self.price_data["open"]).apply(np.log)
+        log_ho = (self.price_data["high"] / self.price_data["open"]).apply(np.log)
+        log_lo = (self.price_data["low"] / self.price_data["open"]).apply(np.log)
+        self.terms = {
+            parkinson: (1.0 / (4.0 * math.log(2.0))) * log_hl**2.0,
+            garman_klass: 0.5 * log_hl**2 - (2 * math.log(2) - 1) * log_co**2,
+            rogers_satchell: log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co),
+        }
+
+    def test_rolling_mean(self):
+        """
+        Test that estimates match the rolling apply within rounding
+        """
+        for module, rs in self.terms.items():
+            for window in (10, 22, 60):
+                with self.subTest(estimator=module.__name__, window=window):
+                    result = module.get_estimator(
+                        self.price_data, window, trading_periods=252)
+                    expected = rolling_apply(rs, window)
+                    pd.testing.assert_series_equal(
+                        result, expected, check_names=False, rtol=1e-12, atol=1e-15)
+                    self.assertEqual(result.isna().sum(), window - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Unit tests for the cached report page.
+"""
+
+import os
+import threading
+import unittest
+from unittest import mock
+
+from report_cache import CachedReport
+
+
+class Clock:
+    """
+    Manually advanced clock
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCachedReport(unittest.TestCase):
+    """
+    TTL, stale-while-revalidate and single-flight rebuilds
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.builds = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def build(self):
+        self.release.wait(5)
+        self.builds.append(1)
+        if len(self.builds) == 3:
+            raise RuntimeError("quotes api down")
+        return {"index.html": f"<p>{len(self.builds)}</p>",
+                "ndx.html": f"<p>ndx {len(self.builds)}</p>"}
+
+    def test_stale_while_revalidate(self):
+        """
+        Test that stale pages are served while one rebuild runs
+        """
+        cache = CachedReport(self.build, ttl=10, stale_ttl=20, clock=self.clock)
+        first = cache.get("index.html")
+        self.assertEqual(first.body, b"<p>1</p>")
+        self.assertIs(cache.get("index.html"), first)
+
+        self.clock.now = 15
+        self.release.clear()
+        self.assertIs(cache.get("index.html"), first)
+        self.assertIs(cache.get("index.html"), first)
+        self.release.set()
+        cache._rebuild.result()
+        self.assertEqual(cache.get("index.html").body, b"<p>2</p>")
+        self.assertNotEqual(cache.get("index.html").etag, first.etag)
+        self.assertEqual(len(self.builds), 2)
+
+        # A failed rebuild keeps the stale page
+        self.clock.now = 40
+        second = cache.get("index.html")
+        cache._rebuild.exception()
+        self.assertIs(cache.get("index.html"), second)
+        self.clock.now = 100
+        self.assertEqual(cache.get("index.html").body, b"<p>4</p>")
+
+    def test_single_flight(self):
+        """
+        Test that concurrent first requests wait for one build
+        """
+        cache = CachedReport(self.build, ttl=10, stale_ttl=20, clock=self.clock)
+        self.release.clear()
+        pages = []
+        threads = [
+            threading.Thread(target=lambda: pages.append(cache.get("index.html")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual({page.body for page in pages}, {b"<p>1</p>"})
+
+    def test_conditional_get(self):
+        """
+        Test that the report route answers a matching ETag with 304
+        """
+        import app  # noqa: PLC0415
+
+        report = app.REPORT
+        app.REPORT = CachedReport(
+            lambda: {"index.html": "<p/>"}, ttl=10, stale_ttl=20)
+        try:
+            client = app.app.test_client()
+            response = client.get("/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, b"<p/>")
+            etag = response.headers["ETag"]
+            response = client.get("/", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+        finally:
+            app.REPORT = report
+
+    def test_pages(self):
+        """
+        Test that every underlying's page is served from one build
+        """
+        cache = CachedReport(self.build, ttl=10, stale_ttl=20, clock=self.clock)
+        self.assertEqual(cache.get("ndx.html").body, b"<p>ndx 1</p>")
+        self.assertEqual(cache.get("index.html").body, b"<p>1</p>")
+        self.assertEqual(len(self.builds), 1)
+        with self.assertRaises(KeyError):
+            cache.get("rut.html")
+
+        import app  # noqa: PLC0415
+
+        report = app.REPORT
+        app.REPORT = cache
+        try:
+            client = app.app.test_client()
+            with mock.patch.dict(os.environ, {"UNDERLYINGS": "^SPX:^VIX,^NDX:^VXN"}):
+                self.assertEqual(client.get("/ndx.html").data, b"<p>ndx 1</p>")
+                self.assertEqual(client.get("/").data, b"<p>1</p>")
+                self.assertEqual(client.get("/rut.html").status_code, 404)
+            self.assertEqual(len(self.builds), 1)
+        finally:
+            app.REPORT = report
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Unit tests for the trading sessions module.
+"""
+
+import unittest
+from volatility.sessions import is_session, next_sessions, sessions_between
+
+
+class TestSessions(unittest.TestCase):
+    """
+    NYSE session table
+    """
+
+    def test_holidays(self):
+        """
+        Test holidays, observed holidays and special closures
+        """
+        self.assertFalse(is_session("2024-03-29"))  # Good Friday
+        self.assertFalse(is_session("2022-06-20"))  # Juneteenth observed
+        self.assertFalse(is_session("2025-01-09"))  # Carter funeral
+        self.assertFalse(is_session("2024-06-15"))  # Saturday
+        self.assertTrue(is_session("2021-12-31"))  # New Year on Saturday
+        self.assertTrue(is_session("2024-07-05"))
+
+    def test_next_sessions(self):
+        """
+        Test lookup across Christmas and New Year
+        """
+        result = next_sessions("2024-12-24", 5)
+        self.assertEqual(
+            [day.strftime("%Y-%m-%d") for day in result],
+            ["2024-12-26", "2024-12-27", "2024-12-30", "2024-12-31", "2025-01-02"])
+
+    def test_sessions_between(self):
+        """
+        Test session counts of full years
+        """
+        self.assertEqual(len(sessions_between("2023-01-01", "2023-12-31")), 250)
+        self.assertEqual(len(sessions_between("2024-01-01", "2024-12-31")), 252)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Cold-start import cost of the Lambda handler.
+"""
+
+import unittest
+
+from profiling import HEAVY_MODULES, import_profile, startup_budget_ms
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Import of lambda_function in a fresh interpreter
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rows, cls.loaded = import_profile("lambda_function")
+
+    def test_budget(self):
+        """
+        Test that the import stays within STARTUP_BUDGET_MS
+        """
+        total = next(cumulative for name, _, cumulative, _ in self.rows
+                     if name == "lambda_function")
+        self.assertLessEqual(total, startup_budget_ms())
+
+    def test_lazy_modules(self):
+        """
+        Test that heavy dependencies are left to the report stages
+        """
+        self.assertFalse(set(HEAVY_MODULES) & set(self.loaded))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Unit tests for timing spans.
+"""
+
+import json
+import unittest
+
+from pipeline import Pipeline
+from tracing import MAX_METRICS, add_bytes, span, trace
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Spans, traces and EMF records
+    """
+
+    def test_nesting(self):
+        """
+        Test that spans record their parent, bytes and times
+        """
+        with trace("run") as run:
+            with span("outer") as outer:
+                with span("inner", key="a"):
+                    add_bytes(10)
+                outer.add_bytes(5)
+        add_bytes(1)
+
+        inner, outer = run.spans
+        self.assertEqual(inner.record(run.start)["parent"], "outer")
+        self.assertEqual(inner.attrs, {"key": "a"})
+        self.assertEqual((inner.bytes, outer.bytes), (10, 5))
+        self.assertGreaterEqual(outer.wall_ms, inner.wall_ms)
+        self.assertIn("  inner", run.pretty())
+
+    def test_decorator_and_pipeline(self):
+        """
+        Test that decorated functions and pipeline nodes join the trace
+        """
+        @span("work")
+        def work():
+            add_bytes(3)
+            return 1
+
+        pipeline = Pipeline()
+        pipeline.add("a", work)
+        with trace("run") as run:
+            pipeline.run("a")
+
+        totals = run.totals()
+        self.assertEqual(list(totals), ["a", "work"])
+        self.assertEqual(totals["work"]["bytes"], 3)
+        self.assertEqual(run.spans[0].record(run.start)["parent"], "a")
+
+    def test_emf(self):
+        """
+        Test that every span name gets metrics within the directive limit
+        """
+        with trace("run") as run:
+            for i in range(40):
+                with span(f"s{i}"):
+                    add_bytes(i)
+
+        record = json.loads(json.dumps(run.emf()))
+        directives = record["_aws"]["CloudWatchMetrics"]
+        self.assertEqual([len(d["Metrics"]) for d in directives], [MAX_METRICS, 20])
+        self.assertEqual(record["s39.bytes"], 39)
+        self.assertEqual(record["Trace"], "run")
+        self.assertEqual(len(record["spans"]), 40)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Unit tests for reports of several underlyings.
+"""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import api_quotes
+from api_quotes import cached_quotes_batch, data_key
+from lambda_function import parse_underlyings
+from api_vol import add_vol_nodes
+from pipeline import SKIPPED, Pipeline
+from volatility.estimators import (
+    VolatilityEstimator,
+    multi_window_estimates,
+    panel_estimates,
+)
+from warm_state import STATE
+
+
+def quotes(seed, periods=150):
+    """
+    Random daily prices
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, periods)))
+    open_ = close * np.exp(rng.normal(0, 0.003, periods))
+    return pd.DataFrame({
+        "open": open_,
+        "high": np.maximum(open_, close) * 1.004,
+        "low": np.minimum(open_, close) * 0.996,
+        "close": close,
+        "volume": 1e6,
+    }, index=pd.bdate_range("2024-01-01", periods=periods))
+
+
+class TestUnderlyings(unittest.TestCase):
+    """
+    Panel estimates, batched quotes and configuration
+    """
+
+    def test_panel_estimates(self):
+        """
+        Test that panel estimates equal the estimates of each underlying
+        """
+        data = {
+            "^SPX": quotes(1),
+            "^NDX": quotes(2),
+            "^RUT": quotes(3, periods=120),
+        }
+        ens = VolatilityEstimator(estimators=[
+            "close_to_close",
+            "parkinson",
+            "garman_klass",
+            "rogers_satchell",
+            "yang_zhang",
+        ])
+        result = panel_estimates(ens, data, windows=[10, 22], components=True)
+        for ticker, price_data in data.items():
+            pd.testing.assert_frame_equal(
+                result[ticker],
+                multi_window_estimates(
+                    ens, price_data, windows=[10, 22], components=True))
+
+    def test_missing_quotes(self):
+        """
+        Test that underlyings without quotes are skipped, not the others
+        """
+        ens = VolatilityEstimator(estimators=["close_to_close"])
+        result = panel_estimates(ens, {"^SPX": quotes(1), "^NDX": None}, windows=[10])
+        self.assertEqual(list(result), ["^SPX"])
+
+        STATE.clear()
+        config = {
+            "quotes_api_key": None,
+            "render_mode": "client",
+            "underlyings": [("^SPX", "^VIX"), ("^NDX", "^VXN")],
+        }
+        fetch = mock.Mock(return_value={
+            "^SPX": quotes(1), "^VIX": quotes(2), "^NDX": None, "^VXN": quotes(3)})
+        pipeline = Pipeline()
+        spx = add_vol_nodes(pipeline, config, "^SPX")
+        ndx = add_vol_nodes(pipeline, config, "^NDX")
+        with mock.patch.object(api_quotes, "get_historical_quotes_batch", fetch), \
+                mock.patch.object(api_quotes, "logger") as logger:
+            result = pipeline.run(spx, ndx, "vol:panel")
+        logger.error.assert_called_once()
+        self.assertIs(result[ndx], SKIPPED)
+        self.assertEqual(result[spx]["end_date"], "2024-07-26")
+        self.assertEqual(list(result["vol:panel"]), ["^SPX"])
+        STATE.clear()
+
+    def test_quotes_batch(self):
+        """
+        Test that only quotes missing from the warm state are fetched
+        """
+        STATE.clear()
+        config = {"quotes_api_key": None}
+        fetch = mock.Mock(
+            side_effect=lambda config, tickers: {t: quotes(0) for t in tickers})
+        with mock.patch.object(api_quotes, "get_historical_quotes_batch", fetch):
+            cached_quotes_batch(config, ["^SPX", "^VIX"])
+            result = cached_quotes_batch(config, ["^SPX", "^VIX", "^NDX"])
+        self.assertEqual(
+            [c.args[1] for c in fetch.call_args_list], [["^SPX", "^VIX"], ["^NDX"]])
+        self.assertEqual(list(result), ["^SPX", "^VIX", "^NDX"])
+        STATE.clear()
+
+    def test_config(self):
+        """
+        Test parsing of UNDERLYINGS and keys of per-underlying data
+        """
+        self.assertEqual(
+            parse_underlyings("^SPX:^VIX, ^NDX:^VXN"),
+            [("^SPX", "^VIX"), ("^NDX", "^VXN")])
+        with self.assertRaises(ValueError):
+            parse_underlyings("^SPX")
+        key = "data/garch_state.json"
+        self.assertEqual(data_key(key, "^SPX"), "data/garch_state.json")
+        self.assertEqual(data_key(key, "^NDX"), "data/garch_state_ndx.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
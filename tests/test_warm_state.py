@@ -0,0 +1,95 @@
+"""
+Unit tests for the warm invocation state.
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from warm_state import WarmState, nbytes
+
+
+class Clock:
+    """
+    Manually advanced clock
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestWarmState(unittest.TestCase):
+    """
+    TTLs, revalidation and memory caps
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.state = WarmState(max_bytes=10_000, clock=self.clock)
+
+    def test_ttl(self):
+        """
+        Test that values are reloaded once expired and None is not kept
+        """
+        loads = []
+        def load():
+            loads.append(1)
+            return len(loads)
+
+        self.assertEqual(self.state.get("a", load, ttl=10), 1)
+        self.clock.now = 9
+        self.assertEqual(self.state.get("a", load, ttl=10), 1)
+        self.clock.now = 10
+        self.assertEqual(self.state.get("a", load, ttl=10), 2)
+
+        self.assertIsNone(self.state.get("b", lambda: None))
+        self.assertEqual(self.state.get("b", lambda: 3), 3)
+        self.assertEqual(self.state.stats()["hits"], 1)
+
+    def test_revalidate(self):
+        """
+        Test that an unchanged version keeps the cached value
+        """
+        versions = []
+        def load(version):
+            versions.append(version)
+            return (None, version) if version == "v1" else ("page", "v1")
+
+        self.assertEqual(self.state.revalidate("t", load), "page")
+        self.assertEqual(self.state.revalidate("t", load), "page")
+        self.assertEqual(versions, [None, "v1"])
+        self.assertEqual(self.state.stats()["revalidated"], 1)
+
+    def test_memory_cap(self):
+        """
+        Test that least recently used entries are evicted over the cap
+        """
+        block = np.zeros(400)
+        for key in "abc":
+            self.state.put(key, block.copy())
+        self.state.get("a", lambda: None)
+        self.state.put("d", block.copy())
+
+        stats = self.state.stats()
+        self.assertEqual(stats["entries"], 3)
+        self.assertLessEqual(stats["bytes"], 10_000)
+        self.assertIsNone(self.state.get("b", lambda: None))
+        self.assertIsNotNone(self.state.get("a", lambda: None))
+
+        self.state.put("e", np.zeros(2_000))
+        self.assertIsNone(self.state.get("e", lambda: None))
+
+    def test_nbytes(self):
+        """
+        Test sizes of frames and nested containers
+        """
+        frame = pd.DataFrame({"close": np.arange(1_000.0)})
+        self.assertGreaterEqual(nbytes(frame), 8_000)
+        self.assertGreaterEqual(nbytes({"a": [frame, frame]}), nbytes(frame))
+        self.assertLess(nbytes({"a": [frame, frame]}), 2 * nbytes(frame))
+
+if __name__ == "__main__":
+    unittest.main()
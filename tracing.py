@@ -0,0 +1,224 @@
+"""Timing spans of a report run.
+
+`span` measures wall time, CPU time of the calling thread and bytes
+transferred within a block, and can decorate functions. With a
+`memprofile.MemoryProfiler` active it also records heap and RSS. Every span
+is observed in the process metrics, see `metrics`. Spans nest and
+belong to the `trace` that is active in the context, pipeline nodes run
+in a copy of the context of `Pipeline.run`. `emit` writes a finished
+trace as one CloudWatch Embedded Metric Format record, or as a tree in
+dev mode.
+"""
+
+import contextvars
+import json
+import re
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+from memprofile import active_profiler
+from metrics import observe_span
+
+NAMESPACE = "VolReport"
+MAX_METRICS = 100  # per EMF metric directive
+MEMORY_UNITS = {
+  "heap_peak_mb": "Megabytes",
+  "heap_retained_mb": "Megabytes",
+  "rss_peak_mb": "Megabytes",
+}
+
+_trace = contextvars.ContextVar("trace", default=None)
+_token_chars = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+_span = contextvars.ContextVar("span", default=None)
+
+
+@dataclass
+class Span:
+  """Measurements of one block."""
+
+  name: str
+  parent: "Span | None" = field(repr=False)
+  start: float
+  attrs: dict = field(default_factory=dict)
+  wall_ms: float = 0.0
+  cpu_ms: float = 0.0
+  bytes: int = 0
+  memory: dict | None = None
+
+  def add_bytes(self, n: int) -> None:
+    """Count bytes read, written or produced by the block."""
+    self.bytes += n
+
+  def record(self, origin: float) -> dict:
+    """Span as a JSON-compatible dict, `origin` is the start of the trace."""
+    return {
+      "name": self.name,
+      "parent": self.parent and self.parent.name,
+      "start_ms": round((self.start - origin) * 1000, 1),
+      "wall_ms": round(self.wall_ms, 1),
+      "cpu_ms": round(self.cpu_ms, 1),
+      "bytes": self.bytes,
+      **(self.memory or {}),
+      **self.attrs,
+    }
+
+
+class Trace:
+  """Spans of one run, safe to add to from several threads."""
+
+  def __init__(self, name: str) -> None:
+    """Start an empty trace."""
+    self.name = name
+    self.start = time.perf_counter()
+    self.timestamp = time.time()
+    self.spans: list[Span] = []
+    self._lock = threading.Lock()
+
+  def add(self, span: Span) -> None:
+    """Add a finished span."""
+    with self._lock:
+      self.spans.append(span)
+
+  def totals(self) -> dict:
+    """Wall ms, CPU ms and bytes summed by span name, the largest memory."""
+    totals = {}
+    for span in sorted(self.spans, key=lambda s: s.start):
+      total = totals.setdefault(span.name, {"wall_ms": 0.0, "cpu_ms": 0.0, "bytes": 0})
+      total["wall_ms"] += span.wall_ms
+      total["cpu_ms"] += span.cpu_ms
+      total["bytes"] += span.bytes
+      for key, value in (span.memory or {}).items():
+        total[key] = max(total.get(key, value), value)
+    return totals
+
+  def emf(self, namespace: str = NAMESPACE) -> dict:
+    """One Embedded Metric Format record with a metric per span name."""
+    units = {"wall_ms": "Milliseconds", "cpu_ms": "Milliseconds", "bytes": "Bytes"}
+    values = {}
+    metrics = []
+    for name, total in self.totals().items():
+      for key, unit in (units | MEMORY_UNITS).items():
+        if key not in total:
+          continue
+        metric = f"{name}.{key}"
+        values[metric] = round(total[key], 1)
+        metrics.append({"Name": metric, "Unit": unit})
+
+    return {
+      "_aws": {
+        "Timestamp": int(self.timestamp * 1000),
+        "CloudWatchMetrics": [
+          {
+            "Namespace": namespace,
+            "Dimensions": [["Trace"]],
+            "Metrics": metrics[i:i + MAX_METRICS],
+          }
+          for i in range(0, len(metrics), MAX_METRICS)
+        ],
+      },
+      "Trace": self.name,
+      **values,
+      "spans": [
+        span.record(self.start)
+        for span in sorted(self.spans, key=lambda s: s.start)
+      ],
+    }
+
+  def server_timing(self) -> str:
+    """Top-level spans and the total as a Server-Timing header value."""
+    metrics = [
+      f'{_token_chars.sub("-", span.name)};dur={span.wall_ms:.1f};desc="{span.name}"'
+      for span in sorted(self.spans, key=lambda s: s.start)
+      if span.parent is None
+    ]
+    metrics.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+    return ", ".join(metrics)
+
+  def pretty(self) -> str:
+    """Spans as an indented tree in start order."""
+    children = {}
+    for span in sorted(self.spans, key=lambda s: s.start):
+      children.setdefault(id(span.parent) if span.parent else None, []).append(span)
+
+    profiled = any(span.memory for span in self.spans)
+    header = f"{'span':<44} {'start':>8} {'wall ms':>9} {'cpu ms':>8} {'kB':>9}"
+    if profiled:
+      header += f" {'heap MB':>8} {'kept MB':>8} {'RSS MB':>7}"
+    lines = [header]
+
+    def walk(parent: int | None, depth: int) -> None:
+      for span in children.get(parent, []):
+        label = "  " * depth + span.name
+        line = (
+          f"{label:<44} {(span.start - self.start) * 1000:>8.0f} "
+          f"{span.wall_ms:>9.1f} {span.cpu_ms:>8.1f} {span.bytes / 1024:>9.1f}"
+        )
+        if span.memory:
+          line += (
+            f" {span.memory['heap_peak_mb']:>8.1f}"
+            f" {span.memory['heap_retained_mb']:>8.1f}"
+            f" {span.memory['rss_peak_mb']:>7.0f}"
+          )
+        lines.append(line)
+        walk(id(span), depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Trace]:
+  """Collect the spans of the block into a new trace."""
+  current = Trace(name)
+  token = _trace.set(current)
+  try:
+    yield current
+  finally:
+    _trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: object) -> Iterator[Span]:
+  """Measure a block, or a function when used as a decorator.
+
+  Outside of a trace the measurements are discarded.
+  """
+  parent = _span.get()
+  profiler = active_profiler()
+  frame = profiler and profiler.enter()
+  current = Span(name, parent, time.perf_counter(), attrs)
+  cpu = time.thread_time()
+  token = _span.set(current)
+  try:
+    yield current
+  finally:
+    _span.reset(token)
+    current.wall_ms = (time.perf_counter() - current.start) * 1000
+    current.cpu_ms = (time.thread_time() - cpu) * 1000
+    if profiler:
+      current.memory = profiler.exit(frame)
+    observe_span(name, current.wall_ms / 1000, current.bytes)
+    active = _trace.get()
+    if active is not None:
+      active.add(current)
+
+
+def add_bytes(n: int) -> None:
+  """Count bytes in the innermost span of the context, if any."""
+  current = _span.get()
+  if current is not None:
+    current.add_bytes(n)
+
+
+def emit(finished: Trace, mode: str | None) -> None:
+  """Write the trace, as a tree in dev and as an EMF record otherwise."""
+  if mode == "dev":
+    logger.info(f"Trace {finished.name}:\n{finished.pretty()}")
+  else:
+    # EMF records must be a line of their own on stdout
+    print(json.dumps(finished.emf()), flush=True)  # noqa: T201
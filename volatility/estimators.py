@@ -5,6 +5,7 @@ TODO add tests
 import pandas as pd
 from volatility import models
 from api_quotes import get_historical_quotes
+from tracing import span
 
 
 class VolatilityEstimator(object):
@@ -33,14 +34,31 @@ class VolatilityEstimator(object):
         y : pandas.DataFrame
             Estimator series values
         """
-        result = pd.concat(
-            [getattr(models, estimator).get_estimator(
-            price_data=price_data,
-            window=window,
-            clean=False
-            ) for estimator in self._estimators],
-            axis=1
-        )
+        return self._combine(
+            self._estimates(price_data, window).values(),
+            window,
+            components)
+
+    def _estimates(self, price_data, window):
+        """
+        Values of each estimator, series of a frame of prices and frames
+        with a column per ticker of a panel
+        """
+        estimates = {}
+        for estimator in self._estimators:
+            with span(f'estimator:{estimator}', window=window):
+                estimates[estimator] = getattr(models, estimator).get_estimator(
+                    price_data=price_data,
+                    window=window,
+                    clean=False
+                )
+        return estimates
+
+    def _combine(self, series, window, components):
+        """
+        Estimator series with their mean, labelled by estimator and window
+        """
+        result = pd.concat(series, axis=1)
         result['mean'] = result.dropna(axis=0).mean(axis=1, skipna=False)
         result.columns = pd.MultiIndex.from_product(
             [self._estimators + ['mean'], [window]],
@@ -51,6 +69,30 @@ class VolatilityEstimator(object):
 
         return result
 
+    def estimate_panel(self, panel, window, components=False, clean=True):
+        """
+        Estimate volatility of several underlyings sharing their dates
+
+        Parameters
+        ----------
+        panel : pandas.DataFrame
+            Price data with (field, ticker) columns
+
+        Returns
+        -------
+        y : dict
+            Estimates by ticker, as returned by `estimate`
+        """
+        estimates = self._estimates(panel, window)
+        results = {}
+        for ticker in panel['close'].columns:
+            result = self._combine(
+                [values[ticker] for values in estimates.values()],
+                window,
+                components)
+            results[ticker] = result.dropna() if clean else result
+        return results
+
     def estimate(self, price_data, window, components=False, clean=True):
         """
         Estimate volatility
@@ -98,6 +140,67 @@ def multi_window_estimates(
     return result
 
 
+PANEL_FIELDS = ['open', 'high', 'low', 'close']
+
+
+def panel_estimates(
+        estimator,
+        price_data,
+        windows,
+        components=False):
+    """
+    Calculate a volatility estimator of several underlyings for multiple
+    windows
+
+    Underlyings with the same dates are stacked into one panel, so that
+    every model runs once per window for all of them. Underlyings without
+    price data are left out.
+
+    Parameters
+    ----------
+    estimator : VolatilityEstimator
+        Estimator to use
+    price_data : dict
+        Price data by ticker, None when unavailable
+    windows : tuple
+        Tuple of window sizes for which to calculate the estimator
+
+    Returns
+    -------
+    y : dict
+        Estimates by ticker, as returned by `multi_window_estimates`
+    """
+    price_data = {
+        ticker: data for ticker, data in price_data.items() if data is not None}
+
+    groups = []
+    for ticker, data in price_data.items():
+        group = next(
+            (g for g in groups if price_data[g[0]].index.equals(data.index)),
+            None)
+        if group is None:
+            groups.append([ticker])
+        else:
+            group.append(ticker)
+
+    results = {}
+    for group in groups:
+        panel = pd.concat(
+            {ticker: price_data[ticker][PANEL_FIELDS] for ticker in group},
+            axis=1,
+            names=['Ticker', 'Field']
+        ).swaplevel(axis=1)
+        estimates = [
+            estimator.estimate_panel(
+                panel,
+                window=window,
+                components=components) for window in windows]
+        for ticker in group:
+            results[ticker] = pd.concat(
+                [estimate[ticker] for estimate in estimates], axis=1)
+    return results
+
+
 ESTIMATORS = [
     "close_to_close",
     # "parkinson",
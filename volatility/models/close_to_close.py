@@ -4,8 +4,13 @@ Implementing close-to-close vol estimator
 
 import math
 import numpy as np
+from volatility.sessions import TRADING_DAYS_PER_YEAR
 
-def get_estimator(price_data, window, trading_periods=252, clean=False):
+def get_estimator(
+        price_data,
+        window,
+        trading_periods=TRADING_DAYS_PER_YEAR,
+        clean=False):
     """
     Main method
     """
@@ -3,8 +3,14 @@ Exponentially Weighted Moving Average (EWMA) model.
 """
 
 import numpy as np
-
-def get_estimator(price_data, window, lambda_=0.94, trading_periods=252, clean=False):
+from volatility.sessions import TRADING_DAYS_PER_YEAR
+
+def get_estimator(
+        price_data,
+        window,
+        lambda_=0.94,
+        trading_periods=TRADING_DAYS_PER_YEAR,
+        clean=False):
     """
     Compute the exponentially weighted moving average (EWMA) volatility of a series of returns.
     
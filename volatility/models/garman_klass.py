@@ -4,8 +4,13 @@ Garman-Klass volatility estimator
 
 import math
 import numpy as np
+from volatility.sessions import TRADING_DAYS_PER_YEAR
 
-def get_estimator(price_data, window, trading_periods=252, clean=False):
+def get_estimator(
+        price_data,
+        window,
+        trading_periods=TRADING_DAYS_PER_YEAR,
+        clean=False):
     """
     Main method
     """
@@ -14,10 +19,7 @@ def get_estimator(price_data, window, trading_periods=252, clean=False):
 
     rs = 0.5 * log_hl**2 - (2*math.log(2)-1) * log_co**2
 
-    def f(v):
-        return (trading_periods * v.mean())**0.5
-
-    result = rs.rolling(window=window, center=False).apply(func=f)
+    result = (trading_periods * rs.rolling(window=window, center=False).mean())**0.5
 
     if clean:
         return result.dropna()
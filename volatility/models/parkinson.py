@@ -4,22 +4,24 @@ Parkinson volatility estimator
 
 import math
 import numpy as np
+from volatility.sessions import TRADING_DAYS_PER_YEAR
 
 
-def get_estimator(price_data, window, trading_periods=252, clean=False):
+def get_estimator(
+        price_data,
+        window,
+        trading_periods=TRADING_DAYS_PER_YEAR,
+        clean=False):
     """
     Main method
     """
     rs = (1.0 / (4.0 * math.log(2.0))) *\
     ((price_data['high'] / price_data['low']).apply(np.log))**2.0
 
-    def f(v):
-        return (trading_periods * v.mean())**0.5
-
-    result = rs.rolling(
+    result = (trading_periods * rs.rolling(
         window=window,
         center=False
-    ).apply(func=f)
+    ).mean())**0.5
 
     if clean:
         return result.dropna()
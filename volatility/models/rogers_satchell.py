@@ -3,8 +3,13 @@ Rogers-Satchell volatility estimator
 """
 
 import numpy as np
+from volatility.sessions import TRADING_DAYS_PER_YEAR
 
-def get_estimator(price_data, window, trading_periods=252, clean=False):
+def get_estimator(
+        price_data,
+        window,
+        trading_periods=TRADING_DAYS_PER_YEAR,
+        clean=False):
     """
     Main method
     """
@@ -14,13 +19,10 @@ def get_estimator(price_data, window, trading_periods=252, clean=False):
 
     rs = log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co)
 
-    def f(v):
-        return (trading_periods * v.mean())**0.5
-
-    result = rs.rolling(
+    result = (trading_periods * rs.rolling(
         window=window,
         center=False
-    ).apply(func=f)
+    ).mean())**0.5
 
     if clean:
         return result.dropna()
@@ -0,0 +1,176 @@
+"""
+NYSE trading sessions
+
+The session table is built once per process from the exchange holiday
+rules and kept as a sorted int32 array of day numbers since 1970-01-01,
+lookups are binary searches on it.
+"""
+
+import datetime
+import functools
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 1990
+LAST_YEAR = 2060
+
+# Annualization convention, the table itself averages about 251 sessions a year
+TRADING_DAYS_PER_YEAR = 252
+
+# Unscheduled full-day closures
+SPECIAL_CLOSURES = [
+    "1994-04-27",  # Nixon funeral
+    "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14",  # September 11
+    "2004-06-11",  # Reagan funeral
+    "2007-01-02",  # Ford funeral
+    "2012-10-29", "2012-10-30",  # Hurricane Sandy
+    "2018-12-05",  # G.H.W. Bush funeral
+    "2025-01-09",  # Carter funeral
+]
+
+
+def _easter(year):
+    """
+    Easter Sunday, anonymous Gregorian algorithm
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7  # noqa: E741
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """
+    n-th weekday of the month, n=-1 for the last one
+    """
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        offset = (weekday - first.weekday()) % 7 + 7 * (n - 1)
+        return first + datetime.timedelta(days=offset)
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day):
+    """
+    Saturday holidays move to Friday, Sunday holidays to Monday
+    """
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    """
+    Full-day NYSE holidays of a year
+
+    Parameters
+    ----------
+    year : int
+        Calendar year
+
+    Returns
+    -------
+    y : list of datetime.date
+        Holidays falling on weekdays
+    """
+    holidays = [
+        _nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        _easter(year) - datetime.timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(datetime.date(year, 7, 4)),  # Independence Day
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(datetime.date(year, 12, 25)),  # Christmas
+    ]
+
+    # New Year's Day on a Saturday is not observed on the prior Friday
+    new_year = datetime.date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.append(_observed(new_year))
+
+    if year >= 1998:
+        holidays.append(_nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    if year >= 2022:
+        holidays.append(_observed(datetime.date(year, 6, 19)))  # Juneteenth
+
+    return sorted(day for day in holidays if day.weekday() < 5)
+
+
+@functools.cache
+def session_table():
+    """
+    Sorted int32 day numbers since 1970-01-01 of all sessions
+    from FIRST_YEAR to LAST_YEAR
+    """
+    holidays = [
+        day for year in range(FIRST_YEAR, LAST_YEAR + 1)
+        for day in nyse_holidays(year)
+    ] + SPECIAL_CLOSURES
+
+    days = np.arange(
+        np.datetime64(f"{FIRST_YEAR}-01-01"),
+        np.datetime64(f"{LAST_YEAR + 1}-01-01"),
+    )
+    holidays = np.array(holidays, dtype="datetime64[D]")
+    sessions = days[np.is_busday(days, holidays=holidays)]
+    sessions = sessions.astype(np.int32)
+    sessions.flags.writeable = False
+    return sessions
+
+
+def _day_number(day):
+    """
+    Day number since 1970-01-01 of a date-like value
+    """
+    return pd.Timestamp(day).to_datetime64().astype("datetime64[D]").astype(np.int64)
+
+
+def _to_index(day_numbers):
+    """
+    DatetimeIndex from day numbers
+    """
+    days = day_numbers.astype("datetime64[D]")
+    return pd.DatetimeIndex(days.astype("datetime64[ns]"))
+
+
+def is_session(day):
+    """
+    Whether the exchange is open on the given day
+    """
+    table = session_table()
+    number = _day_number(day)
+    i = np.searchsorted(table, number)
+    return bool(i < table.size and table[i] == number)
+
+
+def next_sessions(after, n):
+    """
+    The next n sessions strictly after the given day
+    """
+    table = session_table()
+    i = np.searchsorted(table, _day_number(after), side="right")
+    if i + n > table.size:
+        raise ValueError(f"Session table ends in {LAST_YEAR}")
+    return _to_index(table[i:i + n])
+
+
+def sessions_between(start, end):
+    """
+    Sessions from start to end, both inclusive
+    """
+    table = session_table()
+    i = np.searchsorted(table, _day_number(start), side="left")
+    j = np.searchsorted(table, _day_number(end), side="right")
+    return _to_index(table[i:j])
@@ -0,0 +1,236 @@
+"""State reused across warm Lambda invocations.
+
+A Lambda container serves many invocations and keeps module globals
+between them. `STATE` holds what is expensive to rebuild, such as the
+compiled report template, downloaded quotes and fitted models. Every
+entry has a TTL, and the least recently used entries are evicted once
+the registry holds more than its memory cap.
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from loguru import logger
+
+from metrics import REGISTRY
+
+WARM_STATE_MB = 128  # memory cap of the registry, overridden by WARM_STATE_MB
+MAX_ENTRIES = 256
+LOCK_STRIPES = 16
+
+# Shared by many objects, not counted in their size
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+
+def nbytes(value: object) -> int:
+  """Approximate memory held by a value and everything it references.
+
+  Frames and arrays report their buffers, containers and objects are
+  walked, each object is counted once.
+  """
+  seen = set()
+  total = 0
+  stack = [value]
+  while stack:
+    obj = stack.pop()
+    if id(obj) in seen or isinstance(obj, _OPAQUE):
+      continue
+    seen.add(id(obj))
+
+    if hasattr(obj, "memory_usage") and callable(obj.memory_usage):
+      usage = obj.memory_usage(deep=True)
+      total += int(getattr(usage, "sum", lambda u=usage: u)())
+    elif isinstance(getattr(obj, "nbytes", None), int):
+      total += obj.nbytes
+    elif isinstance(obj, dict):
+      total += sys.getsizeof(obj)
+      stack.extend(obj.keys())
+      stack.extend(obj.values())
+    elif isinstance(obj, list | tuple | set | frozenset):
+      total += sys.getsizeof(obj)
+      stack.extend(obj)
+    else:
+      total += sys.getsizeof(obj)
+      if hasattr(obj, "__dict__"):
+        stack.append(vars(obj))
+  return total
+
+
+@dataclass
+class Entry:
+  """Cached value with its expiry and source version."""
+
+  value: object
+  size: int
+  expires: float
+  version: str | None = None
+
+
+class WarmState:
+  """Thread-safe registry of values with TTLs and a memory cap.
+
+  `get` returns a fresh cached value or loads it. `revalidate` asks the
+  loader whether an expired value is still current, e.g. by ETag, and
+  keeps it if so. None is never cached, so failed loads are retried.
+  """
+
+  def __init__(
+    self,
+    max_bytes: int,
+    max_entries: int = MAX_ENTRIES,
+    clock: Callable[[], float] = time.monotonic,
+  ) -> None:
+    """Create an empty registry."""
+    self.max_bytes = max_bytes
+    self.max_entries = max_entries
+    self._clock = clock
+    self._entries: OrderedDict[str, Entry] = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+    # Loads of one key run once, loads of unrelated keys in parallel
+    self._load_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+    self._stats = dict.fromkeys(("hits", "misses", "revalidated", "evictions"), 0)
+
+  def _load_lock(self, key: str) -> threading.RLock:
+    return self._load_locks[hash(key) % LOCK_STRIPES]
+
+  def _lookup(self, key: str) -> tuple[Entry | None, bool]:
+    """Entry of a key, marked as recently used, and whether it is fresh."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None, False
+      self._entries.move_to_end(key)
+      return entry, self._clock() < entry.expires
+
+  def _count(self, stat: str) -> None:
+    with self._lock:
+      self._stats[stat] += 1
+
+  def get(
+    self,
+    key: str,
+    load: Callable[[], object],
+    ttl: float | None = None,
+  ) -> object:
+    """Cached value of a key, loaded when missing or older than `ttl` seconds.
+
+    A `ttl` of None never expires.
+    """
+    with self._load_lock(key):
+      entry, fresh = self._lookup(key)
+      if fresh:
+        self._count("hits")
+        return entry.value
+
+      self._count("misses")
+      value = load()
+      self.put(key, value, ttl)
+      return value
+
+  def peek(self, key: str) -> object:
+    """Fresh cached value of a key, None without loading or counting."""
+    entry, fresh = self._lookup(key)
+    return entry.value if fresh else None
+
+  def revalidate(
+    self,
+    key: str,
+    load: Callable[[str | None], tuple[object, str | None]],
+    ttl: float | None = 0,
+  ) -> object:
+    """Cached value of a key, checked against its source once expired.
+
+    `load` receives the version of the cached value, or None, and
+    returns the new value and version, or None as the value when the
+    cached one is still current. The default `ttl` checks on every call.
+    """
+    with self._load_lock(key):
+      entry, fresh = self._lookup(key)
+      if fresh:
+        self._count("hits")
+        return entry.value
+
+      value, version = load(entry.version if entry else None)
+      if value is None and entry is not None:
+        self._count("revalidated")
+        with self._lock:
+          entry.expires = self._expires(ttl)
+        return entry.value
+
+      self._count("misses")
+      self.put(key, value, ttl, version)
+      return value
+
+  def _expires(self, ttl: float | None) -> float:
+    return math.inf if ttl is None else self._clock() + ttl
+
+  def put(
+    self,
+    key: str,
+    value: object,
+    ttl: float | None = None,
+    version: str | None = None,
+  ) -> None:
+    """Store a value, evicting least recently used entries over the caps."""
+    size = nbytes(value)
+    with self._lock:
+      self._discard(key)
+      if value is None:
+        return
+      if size > self.max_bytes:
+        logger.warning(
+          f"Warm state {key} is over the cap: {size:,} > {self.max_bytes:,}",
+        )
+        return
+
+      self._entries[key] = Entry(value, size, self._expires(ttl), version)
+      self._bytes += size
+      while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+        evicted, _ = next(iter(self._entries.items()))
+        self._discard(evicted)
+        self._stats["evictions"] += 1
+
+  def _discard(self, key: str) -> None:
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._bytes -= entry.size
+
+  def invalidate(self, key: str) -> None:
+    """Drop a key."""
+    with self._lock:
+      self._discard(key)
+
+  def clear(self) -> None:
+    """Drop all keys."""
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self) -> dict:
+    """Counters since the container started, with the current size."""
+    with self._lock:
+      return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+STATE = WarmState(int(os.environ.get("WARM_STATE_MB", WARM_STATE_MB)) * 2**20)
+
+REGISTRY.callback(
+  "warm_state_events_total", "Warm state lookups and evictions.", "counter",
+  lambda: {
+    (event,): count for event, count in STATE.stats().items()
+    if event not in ("entries", "bytes")
+  },
+  ("event",),
+)
+REGISTRY.callback(
+  "warm_state_bytes", "Estimated size of the warm state.", "gauge",
+  lambda: STATE.stats()["bytes"],
+)